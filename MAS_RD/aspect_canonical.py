@@ -0,0 +1,248 @@
+# aspect_canonical.py (方面短语规范化: 批量嵌入摘要知识中的方面短语，按近邻相似度聚类，生成 规范名称 -> 别名 的别名表)
+
+import argparse
+import json
+import os
+import time
+from collections import Counter
+from concurrent.futures import ThreadPoolExecutor
+from typing import Callable, Iterable
+
+import numpy as np
+import pyarrow as pa
+import pyarrow.parquet as pq
+from dotenv import load_dotenv
+
+from json_to_neo4j import KEY_TO_GRAPH_MAP, aspect_items
+from patent_dataset import iter_records, resolve_dataset_path
+
+# 默认只规范化分析工具据以聚合的三类方面 (技术空白、关联技术都按节点共现计数)
+DEFAULT_LABELS = ["待解决问题", "技术实现", "应用领域"]
+BLOCK_ELEMENTS = 1 << 25  # 分块相似度矩阵每块的元素数上限 (float32 约 128 MB)
+CHAIN_SLACK = 0.05  # 连通分量可能经多跳串联；与规范短语的相似度低于 阈值 - CHAIN_SLACK 的成员不并入
+
+
+# --- 1. 别名表: 加载器、离线导入与进程内图后端共用 ---
+class AspectAliases:
+    """
+    每个标签一组 {规范名称: [别名, ...]}。canonical(label, name) 把别名映射为规范名称 (未登记的短语原样返回)，
+    aliases(label, canonical) 返回规范节点的别名列表 (写入节点的 aliases 属性)。
+    """
+
+    def __init__(self, clusters: dict[str, dict[str, list[str]]], meta: dict = None):
+        self.clusters = clusters
+        self.meta = meta or {}
+        self._canonical = {label: {alias: canonical for canonical, aliases in label_clusters.items() for alias in aliases}
+                           for label, label_clusters in clusters.items()}
+
+    @classmethod
+    def load(cls, path: str) -> "AspectAliases | None":
+        """别名表不存在时返回 None (加载器按原样写入方面短语)。"""
+        if not path or not os.path.exists(path): return None
+        with open(path, 'r', encoding='utf-8') as f:
+            data = json.load(f)
+        return cls(data.get("labels", {}), {key: value for key, value in data.items() if key != "labels"})
+
+    def save(self, path: str):
+        with open(path, 'w', encoding='utf-8') as f:
+            json.dump({**self.meta, "labels": self.clusters}, f, ensure_ascii=False, indent=2)
+
+    def canonical(self, label: str, name: str) -> str:
+        return self._canonical.get(label, {}).get(name, name)
+
+    def aliases(self, label: str, canonical: str) -> list[str]:
+        return self.clusters.get(label, {}).get(canonical, [])
+
+    def describe(self) -> str:
+        alias_count = sum(len(aliases) for label_clusters in self.clusters.values() for aliases in label_clusters.values())
+        cluster_count = sum(len(label_clusters) for label_clusters in self.clusters.values())
+        return f"{alias_count} 个别名并入 {cluster_count} 个规范节点 ({', '.join(self.clusters)})"
+
+    def __bool__(self) -> bool:
+        return any(self.clusters.values())
+
+
+# --- 2. 统计方面短语: 与加载器相同的拆解方式，按出现次数选出规范名称 ---
+def collect_aspect_phrases(unstructured_path: str, labels: Iterable[str], read_batch_rows: int = 10000) -> dict[str, Counter]:
+    labels = set(labels)
+    phrases = {label: Counter() for label in labels}
+    for records in iter_records(unstructured_path, batch_size=read_batch_rows):
+        for record in records:
+            for label, _, item_name in aspect_items(record):
+                if label in labels: phrases[label][item_name] += 1
+    return phrases
+
+
+# --- 3. 批量嵌入: 本地向量缓存，再次运行只嵌入新出现的短语 ---
+class EmbeddingStore:
+    """短语向量缓存 (Parquet: text + 定长 float32 向量)，文件元数据记录嵌入模型与维度，不一致时整体失效。"""
+
+    def __init__(self, path: str, model: str, dimensions: int):
+        self.path = path
+        self.model = model
+        self.dimensions = dimensions
+        self.vectors: dict[str, np.ndarray] = {}
+        self._dirty = False
+        if path and os.path.exists(path):
+            table = pq.read_table(path)
+            metadata = table.schema.metadata or {}
+            if metadata.get(b"model") == model.encode() and metadata.get(b"dimensions") == str(dimensions).encode():
+                texts = table.column("text").to_pylist()
+                matrix = table.column("vector").combine_chunks().flatten().to_numpy().reshape(len(texts), dimensions)
+                self.vectors = dict(zip(texts, matrix))
+
+    def missing(self, texts: Iterable[str]) -> list[str]:
+        return [text for text in texts if text not in self.vectors]
+
+    def add(self, texts: list[str], vectors: list[list[float]]):
+        for text, vector in zip(texts, vectors):
+            self.vectors[text] = np.asarray(vector, dtype=np.float32)
+        self._dirty = True
+
+    def matrix(self, texts: list[str]) -> np.ndarray:
+        """按 texts 顺序返回 L2 归一化后的向量矩阵 (点积即余弦相似度)。"""
+        matrix = np.stack([self.vectors[text] for text in texts]) if texts else np.empty((0, self.dimensions), np.float32)
+        norms = np.linalg.norm(matrix, axis=1, keepdims=True)
+        return matrix / np.where(norms > 0, norms, 1.0)
+
+    def save(self):
+        if not self.path or not self._dirty: return
+        texts = list(self.vectors)
+        values = pa.array(np.concatenate([self.vectors[text] for text in texts]) if texts else [], type=pa.float32())
+        table = pa.table({"text": texts, "vector": pa.FixedSizeListArray.from_arrays(values, self.dimensions)})
+        table = table.replace_schema_metadata({"model": self.model, "dimensions": str(self.dimensions)})
+        pq.write_table(table, self.path + ".tmp")
+        os.replace(self.path + ".tmp", self.path)
+        self._dirty = False
+
+
+def openai_embedder(client, model: str, dimensions: int) -> Callable[[list[str]], list[list[float]]]:
+    def embed(texts: list[str]) -> list[list[float]]:
+        response = client.embeddings.create(model=model, input=texts, dimensions=dimensions)
+        return [item.embedding for item in sorted(response.data, key=lambda item: item.index)]
+    return embed
+
+
+def embed_phrases(phrases: list[str], embed: Callable[[list[str]], list[list[float]]], store: EmbeddingStore,
+                  batch_size: int = 512, workers: int = 4) -> np.ndarray:
+    """只嵌入缓存中没有的短语，每个请求 batch_size 条、最多 workers 个并发请求；返回与 phrases 对齐的归一化矩阵。"""
+    missing = store.missing(phrases)
+    batches = [missing[i:i + batch_size] for i in range(0, len(missing), batch_size)]
+    if batches:
+        with ThreadPoolExecutor(max_workers=workers) as executor:
+            for batch, vectors in zip(batches, executor.map(embed, batches)):
+                store.add(batch, vectors)
+    return store.matrix(phrases)
+
+
+# --- 4. 向量化近邻聚类 ---
+def similar_pairs(vectors: np.ndarray, threshold: float, top_k: int = 10) -> tuple[np.ndarray, np.ndarray]:
+    """
+    分块计算余弦相似度 (每块不超过 BLOCK_ELEMENTS 个元素)，每行只在下标更大的短语中取相似度最高的 top_k 个，
+    返回相似度不低于 threshold 的 (i, j) 对，每对只出现一次。
+    """
+    n = len(vectors)
+    k = min(top_k, n - 1)
+    if k <= 0: return np.empty(0, dtype=np.int64), np.empty(0, dtype=np.int64)
+    block = max(1, BLOCK_ELEMENTS // n)
+    sources, targets = [], []
+    for start in range(0, n, block):
+        rows = np.arange(start, min(start + block, n))
+        similarity = vectors[rows] @ vectors.T
+        # 屏蔽自身与下标更小的列 (j <= i)，这些对已在前面的行中考虑过
+        similarity[:, :rows[-1] + 1][np.tri(len(rows), rows[-1] + 1, k=start, dtype=bool)] = -np.inf
+        neighbors = np.argpartition(-similarity, k - 1, axis=1)[:, :k]
+        keep = np.take_along_axis(similarity, neighbors, axis=1) >= threshold
+        sources.append(np.broadcast_to(rows[:, None], neighbors.shape)[keep])
+        targets.append(neighbors[keep])
+    return np.concatenate(sources), np.concatenate(targets)
+
+
+def connected_components(n: int, sources: np.ndarray, targets: np.ndarray) -> np.ndarray:
+    """以数组运算求连通分量 (边端点取较小标号 + 指针跳跃，直到不再变化)，返回每个节点所在分量的最小下标。"""
+    labels = np.arange(n)
+    while True:
+        lowest = np.minimum(labels[sources], labels[targets])
+        updated = labels.copy()
+        np.minimum.at(updated, sources, lowest)
+        np.minimum.at(updated, targets, lowest)
+        updated = updated[updated]
+        if np.array_equal(updated, labels): return labels
+        labels = updated
+
+
+def cluster_phrases(counts: Counter, vectors: np.ndarray, threshold: float = 0.9,
+                    top_k: int = 10) -> dict[str, list[str]]:
+    """
+    将近义短语聚为一簇: 相似度不低于 threshold 的近邻对连通即同簇。
+    规范名称取簇内出现次数最多者 (其次较短、字典序较小)，与其相似度过低的成员 (多跳串联所致) 不并入。
+    vectors 与 counts 的键顺序对齐，返回 {规范名称: [别名, ...]}，只包含有别名的簇。
+    """
+    phrases = list(counts)
+    labels = connected_components(len(phrases), *similar_pairs(vectors, threshold, top_k))
+    members: dict[int, list[int]] = {}
+    for i in sorted(range(len(phrases)), key=lambda i: (-counts[phrases[i]], len(phrases[i]), phrases[i])):
+        members.setdefault(labels[i], []).append(i)
+    clusters = {}
+    for canonical, *rest in members.values():
+        if not rest: continue
+        close = vectors[rest] @ vectors[canonical] >= threshold - CHAIN_SLACK
+        aliases = sorted(phrases[i] for i, keep in zip(rest, close) if keep)
+        if aliases: clusters[phrases[canonical]] = aliases
+    return clusters
+
+
+def canonicalize(phrases: dict[str, Counter], embed: Callable[[list[str]], list[list[float]]], store: EmbeddingStore,
+                 threshold: float = 0.9, top_k: int = 10, batch_size: int = 512, workers: int = 4) -> AspectAliases:
+    clusters = {}
+    for label, counts in phrases.items():
+        start_time = time.perf_counter()
+        try:
+            vectors = embed_phrases(list(counts), embed, store, batch_size, workers)
+        finally:
+            store.save()
+        embed_seconds = time.perf_counter() - start_time
+        start_time = time.perf_counter()
+        clusters[label] = cluster_phrases(counts, vectors, threshold, top_k)
+        merged = sum(len(aliases) for aliases in clusters[label].values())
+        print(f"  [{label}] {len(counts)} 个短语 -> {len(counts) - merged} 个节点 "
+              f"(减少 {merged / max(len(counts), 1):.0%}，{len(clusters[label])} 个簇)，"
+              f"嵌入 {embed_seconds:.1f} 秒，聚类 {time.perf_counter() - start_time:.1f} 秒。")
+    return AspectAliases(clusters, {"model": store.model, "dimensions": store.dimensions, "threshold": threshold})
+
+
+# --- 5. 主函数 ---
+def main():
+    load_dotenv()
+    parser = argparse.ArgumentParser(description="对摘要知识中的方面短语做语义聚类，生成加载器使用的别名表。")
+    parser.add_argument("--unstructured", default="unstructured_data_all.json",
+                        help="摘要知识数据集 (同名 .parquet 存在时优先使用)")
+    parser.add_argument("--output", default="aspect_aliases.json", help="别名表输出路径 (json_to_neo4j.py 默认读取)")
+    parser.add_argument("--labels", nargs="+", default=DEFAULT_LABELS,
+                        choices=[graph_model["label"] for graph_model in KEY_TO_GRAPH_MAP.values()],
+                        help="要规范化的方面标签")
+    parser.add_argument("--threshold", type=float, default=0.9, help="余弦相似度阈值，不低于该值的近邻短语合并")
+    parser.add_argument("--top-k", type=int, default=10, help="每个短语考察的最近邻个数")
+    parser.add_argument("--model", default="text-embedding-3-small", help="嵌入模型")
+    parser.add_argument("--dimensions", type=int, default=256, help="嵌入向量维度 (text-embedding-3 系列支持截短)")
+    parser.add_argument("--batch-size", type=int, default=512, help="每个嵌入请求包含的短语数")
+    parser.add_argument("--workers", type=int, default=int(os.getenv("EMBEDDING_WORKERS", "4")), help="并发嵌入请求数")
+    parser.add_argument("--embedding-store", default="aspect_embeddings.parquet", help="短语向量缓存文件")
+    parser.add_argument("--read-batch", type=int, default=10000, help="每次从数据集读入内存的记录数")
+    args = parser.parse_args()
+
+    from openai import OpenAI
+    unstructured_path = resolve_dataset_path(args.unstructured)
+    print(f"--- 方面短语规范化: '{unstructured_path}' ---")
+    phrases = collect_aspect_phrases(unstructured_path, args.labels, args.read_batch)
+    client = OpenAI(api_key=os.getenv("OPENAI_API_KEY"), base_url=os.getenv("OPENAI_BASE_URL"))
+    store = EmbeddingStore(args.embedding_store, args.model, args.dimensions)
+    aliases = canonicalize(phrases, openai_embedder(client, args.model, args.dimensions), store, args.threshold,
+                           args.top_k, args.batch_size, args.workers)
+    aliases.save(args.output)
+    print(f"\n别名表已写入 '{args.output}': {aliases.describe()}。")
+    print("别名表改变了方面节点的名称，请清空 Neo4j 后重新运行 json_to_neo4j.py (或离线导入) 以合并已有节点。")
+
+
+if __name__ == "__main__":
+    main()
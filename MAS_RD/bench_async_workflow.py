@@ -0,0 +1,114 @@
+# bench_async_workflow.py (使用桩 LLM 与桩图数据库，对比工作流同步 invoke 与异步 ainvoke 的墙钟时间)
+
+import argparse
+import asyncio
+import time
+from typing import Any, List, Optional
+
+from langchain_core.language_models.chat_models import BaseChatModel
+from langchain_core.messages import AIMessage, BaseMessage, ToolMessage
+from langchain_core.outputs import ChatGeneration, ChatResult
+
+import tools
+from main import arun_analysis, build_app, create_initial_state
+
+
+class StubChatModel(BaseChatModel):
+    """
+    模拟 LLM: 每次调用耗时 latency 秒。绑定了工具时，第一轮返回对第一个工具的调用，
+    拿到工具结果后返回最终答复；未绑定工具 (如 Critic) 时直接返回答复。
+    """
+    latency: float = 0.5
+    patent_list: List[str] = []
+    tool_names: List[str] = []
+
+    @property
+    def _llm_type(self) -> str:
+        return "stub-chat-model"
+
+    def bind_tools(self, tools_to_bind, **kwargs):
+        return self.model_copy(update={"tool_names": [t.name for t in tools_to_bind]})
+
+    def _respond(self, messages: List[BaseMessage]) -> ChatResult:
+        if self.tool_names and not isinstance(messages[-1], ToolMessage):
+            message = AIMessage(content="", tool_calls=[{
+                "name": self.tool_names[0], "args": {"patent_list": self.patent_list}, "id": "call_stub"
+            }])
+        else:
+            message = AIMessage(content=f"桩模型答复 (基于 {len(messages)} 条消息)")
+        return ChatResult(generations=[ChatGeneration(message=message)])
+
+    def _generate(self, messages: List[BaseMessage], stop: Optional[List[str]] = None,
+                  run_manager: Any = None, **kwargs) -> ChatResult:
+        time.sleep(self.latency)
+        return self._respond(messages)
+
+    async def _agenerate(self, messages: List[BaseMessage], stop: Optional[List[str]] = None,
+                         run_manager: Any = None, **kwargs) -> ChatResult:
+        await asyncio.sleep(self.latency)
+        return self._respond(messages)
+
+
+def install_stub_graph(latency: float):
+    """用固定延迟、返回空结果的桩替换 Cypher 查询 (Neo4j 图后端)，使各分析工具回退为逐个查询图数据库。"""
+    def run_cypher_query(query: str, params: dict = None) -> list[dict]:
+        time.sleep(latency)
+        return []
+
+    async def arun_cypher_query(query: str, params: dict = None) -> list[dict]:
+        await asyncio.sleep(latency)
+        return []
+
+    tools.run_cypher_query = run_cypher_query
+    tools.arun_cypher_query = arun_cypher_query
+    tools.registry.reset("graph_backend")  # 重新创建 Cypher 图后端，使其使用上面的桩
+
+
+def main():
+    parser = argparse.ArgumentParser(description="对比工作流同步 invoke 与异步 ainvoke 的墙钟时间。")
+    parser.add_argument("--llm-latency", type=float, default=0.5, help="桩 LLM 每次调用延迟 (秒)")
+    parser.add_argument("--graph-latency", type=float, default=0.2, help="桩图查询每次延迟 (秒)")
+    parser.add_argument("--patents", type=int, default=20, help="待分析专利数")
+    parser.add_argument("--sessions", type=int, default=4, help="并发分析会话数 (异步路径在单个事件循环中同时执行)")
+    args = parser.parse_args()
+
+    install_stub_graph(args.graph_latency)
+    patent_list = [f"CN{200510000000 + i}.0" for i in range(args.patents)]  # 申请号
+    graph = build_app(StubChatModel(latency=args.llm_latency, patent_list=patent_list))
+
+    # 关键路径: 特征预取 (1 次查询) + 最慢分析师分支 (2 次 LLM + 1 次查询) + Critic (1 次 LLM) + 评估 (2 次 LLM)
+    critical_path = 2 * args.graph_latency + 5 * args.llm_latency
+    # 全串行: 3 个分析师分支依次执行
+    serial_path = 4 * args.graph_latency + 9 * args.llm_latency
+    print(f"桩 LLM 延迟 {args.llm_latency}s，桩图查询延迟 {args.graph_latency}s，"
+          f"关键路径 ≈ {critical_path:.2f}s，全串行 ≈ {serial_path:.2f}s")
+
+    start_time = time.perf_counter()
+    graph.invoke(create_initial_state(patent_list))
+    sync_elapsed = time.perf_counter() - start_time
+
+    start_time = time.perf_counter()
+    result = asyncio.run(arun_analysis(patent_list, graph))
+    async_elapsed = time.perf_counter() - start_time
+
+    start_time = time.perf_counter()
+    for _ in range(args.sessions):
+        graph.invoke(create_initial_state(patent_list))
+    sync_sessions_elapsed = time.perf_counter() - start_time
+
+    async def run_sessions():
+        return await asyncio.gather(*(arun_analysis(patent_list, graph) for _ in range(args.sessions)))
+
+    start_time = time.perf_counter()
+    asyncio.run(run_sessions())
+    async_sessions_elapsed = time.perf_counter() - start_time
+
+    print(f"\n  单次分析 同步 invoke:   {sync_elapsed:6.2f} 秒")
+    print(f"  单次分析 异步 ainvoke:  {async_elapsed:6.2f} 秒 (关键路径的 {async_elapsed / critical_path:.2f} 倍)")
+    print(f"  {args.sessions} 个会话 同步逐个执行: {sync_sessions_elapsed:6.2f} 秒")
+    print(f"  {args.sessions} 个会话 异步 gather:  {async_sessions_elapsed:6.2f} 秒")
+    print(f"  分析师输出: {sorted(result['agent_outputs'])}，最终报告长度 {len(result['final_report'])}")
+
+
+if __name__ == "__main__":
+    main()
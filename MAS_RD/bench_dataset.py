@@ -0,0 +1,96 @@
+# bench_dataset.py (对比旧版缩进 JSON 与 Parquet 列式数据集的读取耗时和峰值内存)
+
+import argparse
+import json
+import os
+import subprocess
+import sys
+import tempfile
+import time
+
+from patent_dataset import PATENT_SCHEMA, STRUCTURED_FIELDS, iter_records, parse_dates, write_records
+
+# 在全新子进程中读取数据集，输出 (耗时秒数, 记录数, 峰值 RSS KB)，避免两种方式的内存占用相互影响
+READ_SNIPPET = """
+import json, resource, sys, time
+from patent_dataset import STRUCTURED_FIELDS, iter_records
+path, mode = sys.argv[1], sys.argv[2]
+start_time = time.perf_counter()
+count = 0
+if mode == "baseline":
+    pass
+elif mode == "json":
+    with open(path, 'r', encoding='utf-8') as f:
+        records = json.load(f)
+    count = sum(1 for record in records if record["申请号"])
+else:
+    for batch in iter_records(path, STRUCTURED_FIELDS):
+        count += sum(1 for record in batch if record["申请号"])
+print(time.perf_counter() - start_time, count, resource.getrusage(resource.RUSAGE_SELF).ru_maxrss)
+"""
+
+
+def synthetic_records(template_path: str, rows: int):
+    """以样例数据为模板循环生成 rows 条专利，申请号加序号保证唯一。"""
+    templates = [record for batch in iter_records(template_path) for record in batch]
+    for i in range(rows):
+        record = dict(templates[i % len(templates)])
+        record["申请号"] = f"{record['申请号']}-{i}"
+        yield record
+
+
+def measure_read(path: str, mode: str) -> tuple[float, int, int]:
+    output = subprocess.run([sys.executable, "-W", "ignore", "-c", READ_SNIPPET, path, mode],
+                            capture_output=True, text=True, check=True, cwd=os.path.dirname(os.path.abspath(__file__)))
+    seconds, count, max_rss_kb = output.stdout.split()
+    return float(seconds), int(count), int(max_rss_kb)
+
+
+def main():
+    parser = argparse.ArgumentParser(description="对比旧版 JSON 与 Parquet 数据集的读取耗时和峰值内存。")
+    parser.add_argument("--rows", type=int, default=100000, help="合成专利条数")
+    parser.add_argument("--template", default="structured_data_all.json", help="用作模板的样例数据")
+    parser.add_argument("--xlsx", help="可选: 同时对比该工作簿的 pd.read_excel 与一次性转换耗时")
+    args = parser.parse_args()
+
+    with tempfile.TemporaryDirectory() as tmp_dir:
+        json_path = os.path.join(tmp_dir, "patents.json")
+        parquet_path = os.path.join(tmp_dir, "patents.parquet")
+        records = list(synthetic_records(args.template, args.rows))
+        with open(json_path, 'w', encoding='utf-8') as f:
+            json.dump([{name: record.get(name, "") for name in STRUCTURED_FIELDS} for record in records], f,
+                      ensure_ascii=False, indent=2)
+        start_time = time.perf_counter()
+        write_records(parquet_path, ({**record, "申请日": parse_dates(record["申请日"])} for record in records),
+                      PATENT_SCHEMA)
+        write_seconds = time.perf_counter() - start_time
+        del records
+
+        print(f"{args.rows} 条合成专利: JSON {os.path.getsize(json_path) / 2**20:.1f} MB，"
+              f"Parquet {os.path.getsize(parquet_path) / 2**20:.1f} MB (写入 {write_seconds:.2f} 秒)")
+        for label, path, mode in (("仅导入 (基线)", json_path, "baseline"), ("JSON json.load", json_path, "json"),
+                                  ("Parquet 按批读取", parquet_path, "parquet")):
+            seconds, count, max_rss_kb = measure_read(path, mode)
+            print(f"  {label:<16s} {seconds:6.2f} 秒，{count} 条，峰值内存 {max_rss_kb / 1024:7.1f} MB")
+
+    if args.xlsx:
+        # 旧流程: 两个抽取脚本各自 pd.read_excel 一次；新流程: 转换一次，之后只读列式数据集
+        import pandas as pd
+        from patent_dataset import convert_workbook
+        start_time = time.perf_counter()
+        for columns in (STRUCTURED_FIELDS, ["申请号", "发明名称", "摘要"]):
+            pd.read_excel(args.xlsx, usecols=columns)
+        pandas_seconds = time.perf_counter() - start_time
+        with tempfile.TemporaryDirectory() as tmp_dir:
+            parquet_path = os.path.join(tmp_dir, "patents.parquet")
+            start_time = time.perf_counter()
+            convert_workbook(args.xlsx, parquet_path)
+            for columns in (STRUCTURED_FIELDS, ["申请号", "发明名称", "摘要"]):
+                for _ in iter_records(parquet_path, columns): pass
+            dataset_seconds = time.perf_counter() - start_time
+        print(f"\n工作簿 '{args.xlsx}': 两次 pd.read_excel {pandas_seconds:.2f} 秒，"
+              f"转换一次 + 两次读取数据集 {dataset_seconds:.2f} 秒")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,46 @@
+# bench_extraction.py (基于本地 mock 服务的抽取吞吐量离线压测)
+
+import argparse
+import time
+from openai import OpenAI
+
+from excel_to_json_Unstructured import RateLimiter, extract_concurrently, extract_patent_aspects
+from mock_openai_server import start_mock_server
+
+
+def main():
+    parser = argparse.ArgumentParser(description="对比串行与并发抽取在 mock 服务上的吞吐量。")
+    parser.add_argument("--rows", type=int, default=64, help="模拟摘要条数")
+    parser.add_argument("--latency", type=float, default=0.5, help="mock 服务平均延迟 (秒)")
+    parser.add_argument("--error-rate", type=float, default=0.05, help="mock 服务注入 429/503 的比例")
+    parser.add_argument("--in-flight", type=int, nargs="+", default=[4, 8, 16], help="要测试的并发上限")
+    parser.add_argument("--rpm", type=float, default=6000, help="每分钟请求数上限")
+    parser.add_argument("--skip-serial", action="store_true", help="跳过串行基线")
+    args = parser.parse_args()
+
+    server, base_url = start_mock_server(latency=args.latency, error_rate=args.error_rate)
+    client = OpenAI(api_key="mock-key", base_url=base_url, max_retries=0)
+    abstracts = [f"第 {i} 篇模拟专利摘要：一种散热装置，包括热管与鳍片。" for i in range(args.rows)]
+    print(f"Mock 服务: {base_url}，{args.rows} 条摘要，平均延迟 {args.latency}s，错误率 {args.error_rate:.0%}")
+
+    if not args.skip_serial:
+        start_time = time.perf_counter()
+        rate_limiter = RateLimiter(args.rpm)
+        results = [extract_patent_aspects(text, client, rate_limiter=rate_limiter) for text in abstracts]
+        elapsed = time.perf_counter() - start_time
+        print(f"  串行:        {elapsed:7.2f} 秒, {len(abstracts) / elapsed:7.2f} 条/秒, "
+              f"成功 {sum(r is not None for r in results)}/{len(abstracts)}")
+
+    for max_in_flight in args.in_flight:
+        start_time = time.perf_counter()
+        results = extract_concurrently(abstracts, client, max_in_flight=max_in_flight, requests_per_minute=args.rpm)
+        elapsed = time.perf_counter() - start_time
+        print(f"  并发={max_in_flight:<4d}   {elapsed:7.2f} 秒, {len(abstracts) / elapsed:7.2f} 条/秒, "
+              f"成功 {sum(r is not None for r in results)}/{len(abstracts)}")
+
+    print(f"Mock 服务统计: {server.RequestHandlerClass.stats}")
+    server.shutdown()
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,77 @@
+# bench_startup.py (模拟 Streamlit 重跑，对比冷启动、共享资源命中与每次重建的耗时)
+
+import argparse
+import subprocess
+import sys
+import threading
+import time
+
+RESOURCE_NAMES = ["chat_model", "agent_executors", "workflow_app", "openai_client", "chroma_collection"]
+
+COLD_START_SNIPPET = f"""
+import time
+start_time = time.perf_counter()
+import main, tools
+from resources import registry
+imported = time.perf_counter()
+registry.warm_up({RESOURCE_NAMES!r})
+print(imported - start_time, time.perf_counter() - imported)
+"""
+
+
+def measure_cold_start() -> tuple[float, float, float]:
+    """在全新子进程中导入并创建全部资源，返回 (进程总耗时, 导入耗时, 资源创建耗时)。"""
+    start_time = time.perf_counter()
+    output = subprocess.run([sys.executable, "-W", "ignore", "-c", COLD_START_SNIPPET],
+                            capture_output=True, text=True, check=True).stdout
+    total = time.perf_counter() - start_time
+    import_seconds, init_seconds = map(float, output.strip().splitlines()[-1].split())
+    return total, import_seconds, init_seconds
+
+
+def main():
+    parser = argparse.ArgumentParser(description="对比 ui.py 冷启动、共享资源命中和每次重建资源的耗时。")
+    parser.add_argument("--reruns", type=int, default=20, help="模拟的脚本重跑次数")
+    parser.add_argument("--sessions", type=int, default=8, help="模拟同时首次访问的会话数")
+    args = parser.parse_args()
+
+    total, import_seconds, init_seconds = measure_cold_start()
+    print(f"冷启动 (新进程): 总计 {total:.2f} 秒 = 导入 {import_seconds:.2f} 秒 + 创建资源 {init_seconds:.2f} 秒 + 解释器启动")
+
+    import main as _main  # noqa: F401  注册 main / tools 中的资源
+    from resources import registry
+
+    registry.warm_up(RESOURCE_NAMES)
+    start_time = time.perf_counter()
+    for _ in range(args.reruns):
+        registry.warm_up(RESOURCE_NAMES)
+    warm_seconds = (time.perf_counter() - start_time) / args.reruns
+    print(f"重跑 (共享资源命中):   每次 {warm_seconds * 1000:.3f} 毫秒")
+
+    start_time = time.perf_counter()
+    for _ in range(args.reruns):
+        registry.reset()
+        registry.warm_up(RESOURCE_NAMES)
+    rebuild_seconds = (time.perf_counter() - start_time) / args.reruns
+    print(f"重跑 (每次重建资源):   每次 {rebuild_seconds * 1000:.1f} 毫秒")
+
+    # 多个会话同时首次访问: 每个资源只应创建一次，且所有会话拿到同一实例
+    registry.reset()
+    barrier = threading.Barrier(args.sessions)
+    seen = [None] * args.sessions
+
+    def session(i):
+        barrier.wait()
+        seen[i] = tuple(id(registry.get(name)) for name in RESOURCE_NAMES)
+
+    threads = [threading.Thread(target=session, args=(i,)) for i in range(args.sessions)]
+    for t in threads: t.start()
+    for t in threads: t.join()
+    print(f"{args.sessions} 个并发会话共享同一组实例: {len(set(seen)) == 1}")
+    for name, stat in registry.stats().items():
+        if stat["init_seconds"] is not None:
+            print(f"  {name:<20s} 创建耗时 {stat['init_seconds'] * 1000:8.1f} 毫秒")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,211 @@
+# check_graph_backend.py (校验进程内图后端与 Neo4j 上 Cypher 查询 (或不依赖服务器的参考实现) 的结果一致，并对比工具延迟)
+
+import argparse
+import random
+import statistics
+import sys
+import time
+from collections import Counter, defaultdict
+from typing import Iterable
+
+from aspect_canonical import AspectAliases
+from graph_backend import CypherGraphBackend, GraphBackend, InMemoryGraphBackend, dataset_graph_items
+from patent_dataset import resolve_dataset_path
+
+
+# --- 1. 参考实现: 逐条转写各 Cypher 查询的 MATCH 语义，用于没有 Neo4j 的环境 (如 CI) ---
+class ReferenceGraphBackend(GraphBackend):
+    """
+    以集合字典实现的暴力遍历，与 InMemoryGraphBackend 不共享任何代码，只追求与 graph_backend 中 Cypher 查询逐句对应。
+    与加载器的 MATCH ... MERGE 一致，只保留两端节点都已创建的关系。
+    """
+    name = "reference"
+
+    def __init__(self, items: Iterable[tuple[list, list]]):
+        items = list(items)
+        self.nodes = {(label, key) for nodes, _ in items for label, key, _ in nodes}
+        self.out, self.inc = defaultdict(set), defaultdict(set)
+        for _, rels in items:
+            for source_label, source_key, target_label, target_key, rel_type in rels:
+                if (source_label, source_key) in self.nodes and (target_label, target_key) in self.nodes:
+                    self.out[rel_type, source_key].add(target_key)
+                    self.inc[rel_type, target_key].add(source_key)
+
+    def _patents(self, patent_list: list[str]) -> set:
+        return {app_no for app_no in patent_list if ("Patent", app_no) in self.nodes}
+
+    def _problem_stats(self, problem: str) -> tuple[int, str | None]:
+        """PROBLEM_STATS_SUBQUERY: 解决该问题的专利的去重技术实现数，以及频次降序、名称升序的第一个应用领域。"""
+        techs, scenes = set(), Counter()
+        for patent in self.inc["旨在解决", problem]:
+            techs |= self.out["实现方式是", patent]
+            scenes.update(self.out["应用于", patent])
+        top_scene = min(((-freq, scene) for scene, freq in scenes.items()), default=(0, None))[1]
+        return len(techs), top_scene
+
+    def _peer_techs(self, patent: str, selected: set) -> set:
+        return {(peer, tech) for scene in self.out["应用于", patent] for peer in self.inc["应用于", scene] - selected
+                for tech in self.out["实现方式是", peer]}
+
+    def patent_features(self, patent_list: list[str]) -> dict:
+        selected = self._patents(patent_list)
+        features = {"patents": {}, "problems": {}}
+        for patent in selected:
+            years = [date[:4] for date in self.out["发明于", patent]]
+            problems = sorted(self.out["旨在解决", patent])
+            features["patents"][patent] = {
+                "years": [int(y) for y in years if y.isdigit()],
+                "scenes": sorted(self.out["应用于", patent]),
+                "peer_techs": [list(pair) for pair in sorted(self._peer_techs(patent, selected))],
+                "problems": problems,
+            }
+            for problem in problems:
+                tech_count, top_scene = self._problem_stats(problem)
+                features["problems"][problem] = {"tech_count": tech_count, "top_scene": top_scene}
+        return features
+
+    def associated_technologies(self, patent_list: list[str], limit: int = 10) -> list[dict]:
+        selected = self._patents(patent_list)
+        peers_by_tech = defaultdict(set)
+        for patent in selected:
+            for peer, tech in self._peer_techs(patent, selected):
+                peers_by_tech[tech].add(peer)
+        ranked = sorted((-len(peers), tech) for tech, peers in peers_by_tech.items())[:limit]
+        return [{"associated_tech": tech, "association_strength": -negative} for negative, tech in ranked]
+
+    def technology_gaps(self, patent_list: list[str], limit: int = 10) -> list[dict]:
+        problems = {problem for patent in self._patents(patent_list) for problem in self.out["旨在解决", patent]}
+        stats = {problem: self._problem_stats(problem) for problem in problems}
+        ranked = sorted(problems, key=lambda problem: (stats[problem][0], problem))[:limit]
+        return [{"problem_name": problem, "tech_count": stats[problem][0], "top_scene_name": stats[problem][1] or '暂无'}
+                for problem in ranked]
+
+    def patent_year_rows(self) -> Iterable[tuple[str, str]]:
+        return [(patent, date[:4]) for (rel_type, patent), dates in self.out.items() if rel_type == "发明于"
+                for date in dates]
+
+
+def synthetic_graph_items(patent_count: int, seed: int) -> list[tuple[list, list]]:
+    """
+    生成与加载器输出格式相同的随机图谱: 少量应用领域充当跨领域枢纽 (单个领域连接数百件专利)，
+    约 7% 的摘要知识引用不存在的专利 (只留下孤立的方面节点)，并混入无法解析年份的申请日。
+    """
+    rng = random.Random(seed)
+    aspects = (("应用领域", "应用于", max(patent_count // 75, 2)), ("技术实现", "实现方式是", max(patent_count // 10, 2)),
+               ("待解决问题", "旨在解决", max(patent_count // 15, 2)))
+    items = []
+    for index in range(patent_count):
+        app_no = f"CN{index:09d}"
+        date = f"{rng.randint(2005, 2024)}-{rng.randint(1, 12):02d}-01" if rng.random() < 0.95 else "未知"
+        has_date = rng.random() < 0.9
+        items.append(([("Patent", app_no, {"name": app_no})] + ([("ApplicationDate", date, {})] if has_date else []),
+                      [("Patent", app_no, "ApplicationDate", date, "发明于")] if has_date else []))
+    for _ in range(int(patent_count * 1.1)):
+        app_no = f"CN{rng.randint(0, int(patent_count * 1.07)):09d}"
+        nodes, rels = [], []
+        for label, rel_type, size in aspects:
+            for _ in range(rng.randint(0, 3)):
+                name = f"{label}{rng.randint(0, size)}"
+                nodes.append((label, name, {"name": name}))
+                rels.append(("Patent", app_no, label, name, rel_type))
+        items.append((nodes, rels))
+    return items
+
+
+# --- 2. 比较与计时 ---
+def _normalize_features(features: dict) -> dict:
+    """Cypher 的 collect 结果没有确定顺序，比较前统一排序。"""
+    return {
+        "patents": {app_no: {"years": sorted(f["years"]), "scenes": sorted(f["scenes"]),
+                             "peer_techs": sorted(map(tuple, f["peer_techs"])), "problems": sorted(f["problems"])}
+                    for app_no, f in features["patents"].items()},
+        "problems": features["problems"],
+    }
+
+
+def _timed(latencies: list, function, *args):
+    start_time = time.perf_counter()
+    result = function(*args)
+    latencies.append(time.perf_counter() - start_time)
+    return result
+
+
+# --- 3. 主流程 ---
+def main() -> int:
+    parser = argparse.ArgumentParser(description="对比 GRAPH_BACKEND=memory 与 neo4j (或参考实现) 的分析工具查询结果与延迟。")
+    parser.add_argument("--structured", default="structured_data_all.json", help="结构化数据集 (同名 .parquet 存在时优先使用)")
+    parser.add_argument("--unstructured", default="unstructured_data_all.json", help="摘要知识数据集")
+    parser.add_argument("--aliases", default="aspect_aliases.json", help="加载 Neo4j 时使用的方面别名表 (存在时)")
+    parser.add_argument("--samples", type=int, default=50, help="随机抽取的专利列表个数")
+    parser.add_argument("--list-size", type=int, default=15, help="每个专利列表的长度 (与语义检索默认返回条数一致)")
+    parser.add_argument("--seed", type=int, default=0)
+    parser.add_argument("--against", choices=["neo4j", "reference"], default="neo4j",
+                        help="对照后端: neo4j 为已加载的 Neo4j；reference 为不依赖服务器的暴力参考实现 (适用于 CI)")
+    parser.add_argument("--synthetic", type=int, metavar="N",
+                        help="不读取数据集，改用 N 件专利的随机图谱 (含枢纽领域与悬空引用)，需配合 --against reference")
+    parser.add_argument("--memory-only", action="store_true", help="不做对照，只测量进程内后端的构建耗时与延迟")
+    args = parser.parse_args()
+    if args.synthetic and args.against == "neo4j" and not args.memory_only:
+        parser.error("--synthetic 生成的图谱不在 Neo4j 中，请使用 --against reference 或 --memory-only")
+
+    start_time = time.perf_counter()
+    if args.synthetic:
+        items = synthetic_graph_items(args.synthetic, args.seed)
+    else:
+        items = dataset_graph_items(resolve_dataset_path(args.structured), resolve_dataset_path(args.unstructured),
+                                    aliases=AspectAliases.load(args.aliases))
+    if args.against == "reference" and not args.memory_only:
+        items = list(items)  # 两个后端由同一份图数据构建
+    memory = InMemoryGraphBackend.from_items(items)
+    stats = memory.stats()
+    print(f"进程内图构建耗时 {time.perf_counter() - start_time:.2f} 秒: "
+          f"{sum(stats['nodes'].values())} 个节点，{sum(stats['relationships'].values())} 条关系")
+
+    backends = [memory]
+    if args.memory_only:
+        pass
+    elif args.against == "reference":
+        backends.append(ReferenceGraphBackend(items))
+    else:
+        import tools
+        if not tools.check_neo4j_health():
+            print("错误：无法连接 Neo4j，请检查 .env 中的 NEO4J_URI 等配置，或使用 --against reference / --memory-only。")
+            return 1
+        backends.append(CypherGraphBackend(tools.run_cypher_query, tools.arun_cypher_query))
+
+    rng = random.Random(args.seed)
+    patents = memory.names["Patent"]
+    patent_lists = [rng.sample(patents, min(args.list_size, len(patents))) for _ in range(args.samples)]
+    checks = {"associated_technologies": 0, "technology_gaps": 0, "patent_features": 0}
+    latencies = {backend.name: {name: [] for name in checks} for backend in backends}
+
+    for patent_list in patent_lists:
+        results = []
+        for backend in backends:
+            timings = latencies[backend.name]
+            results.append({name: _timed(timings[name], getattr(backend, name), patent_list) for name in checks})
+        if len(results) < 2: continue
+        actual, expected = results
+        checks["associated_technologies"] += expected["associated_technologies"] != actual["associated_technologies"]
+        checks["technology_gaps"] += expected["technology_gaps"] != actual["technology_gaps"]
+        checks["patent_features"] += _normalize_features(expected["patent_features"]) != _normalize_features(actual["patent_features"])
+
+    year_rows_match = True
+    if len(backends) > 1:
+        year_rows = [sorted(backend.patent_year_rows()) for backend in backends]
+        year_rows_match = year_rows[0] == year_rows[1]
+        print(f"\n申请年份索引: {len(year_rows[1])} 行，{'一致' if year_rows_match else '不一致'}")
+        for name, mismatches in checks.items():
+            print(f"  {name:<24s} {len(patent_lists) - mismatches}/{len(patent_lists)} 个专利列表一致")
+
+    print(f"\n每次调用延迟 (中位数 / 最大，毫秒，列表长度 {args.list_size}):")
+    for backend_name, timings in latencies.items():
+        for name, values in timings.items():
+            print(f"  {backend_name:<9s} {name:<24s} {statistics.median(values) * 1000:8.3f} / {max(values) * 1000:8.3f}")
+
+    # 任何不一致都以非零状态退出，便于在 CI 中运行 (--against reference)
+    return 0 if year_rows_match and not any(checks.values()) else 1
+
+
+if __name__ == "__main__":
+    sys.exit(main())
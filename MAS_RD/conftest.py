@@ -0,0 +1,5 @@
+# conftest.py (pytest 配置: 注册自定义标记)
+
+
+def pytest_configure(config):
+    config.addinivalue_line("markers", "integration: 需要外部服务 (如已加载数据集的 Neo4j) 的集成测试，条件不满足时跳过")
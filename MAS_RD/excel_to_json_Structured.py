@@ -1,17 +1,23 @@
 # extract_structured_data.py (with Range Selection)
 
-import pandas as pd
+import argparse
 import os
 
+import pyarrow as pa
+
+from patent_dataset import (PATENT_SCHEMA, add_row_selection_arguments, describe_row_selection, iter_patent_rows,
+                            shard_path, validate_row_selection, write_records)
+
 
 def main():
     """
-    读取 Excel 文件，只提取结构化字段，并保存为 JSON 文件。
-    支持选择部分行进行转换。
+    读取 Excel 文件，只提取结构化字段，并保存为 Parquet 列式数据集 (每个字段一列，申请日为日期类型)。
+    行范围与分片由命令行参数指定: 以只读模式流式读取，读到结束行即停止；工作簿数据集 (patents.parquet) 较新时直接读取它。
     """
     # ==================== 配置区 ====================
     input_excel_file = "patents.xlsx"
-    output_json_file = "structured_data_all.json"
+    workbook_dataset_file = "patents.parquet"  # 整个工作簿 (结构化字段 + 摘要) 的列式缓存
+    output_dataset_file = "structured_data_all.parquet"
 
     # 定义需要精确抽取的结构化字段列名
     columns_to_keep = [
@@ -26,45 +32,33 @@ def main():
         "文献类型",
         "申请人所在国（省）"
     ]
-
-    # 是否只转换部分行？ (True / False)
-    # 如果设为 False，将处理整个文件。
-    CONVERT_PARTIAL_DATA = True
-    # CONVERT_PARTIAL_DATA = False
-    # 如果 CONVERT_PARTIAL_DATA = True，请设置以下范围
-    # 注意：行号基于 Excel 中的 1-based 索引
-    start_row = 1  # 开始行 (包含此行)
-    end_row = 100  # 结束行 (包含此行)
     # ===============================================
 
+    parser = argparse.ArgumentParser(description="脚本 1: 从专利工作簿中抽取结构化字段。")
+    parser.add_argument("--input", default=input_excel_file, help="输入工作簿")
+    parser.add_argument("--output", default=output_dataset_file, help="输出 Parquet 文件 (分片时自动添加 .part-i-of-N 后缀)")
+    parser.add_argument("--dataset", default=workbook_dataset_file, help="工作簿的列式缓存")
+    add_row_selection_arguments(parser)
+    args = parser.parse_args()
+
     print("--- 脚本 1: 结构化数据抽取 ---")
 
-    if not os.path.exists(input_excel_file):
-        print(f"错误：找不到输入文件 '{input_excel_file}'")
+    if not os.path.exists(args.input):
+        print(f"错误：找不到输入文件 '{args.input}'")
+        return
+    error = validate_row_selection(args)
+    if error:
+        print(f"错误：{error}。请检查命令行参数。")
         return
 
     try:
-        print(f"正在读取 Excel 文件: '{input_excel_file}'...")
-        df = pd.read_excel(input_excel_file, usecols=columns_to_keep)
-        df = df.fillna('')
-        print(f"成功从 '{input_excel_file}' 初步读取 {len(df)} 条记录。")
-
-        # --- 新增：根据配置选择数据范围 ---
-        if CONVERT_PARTIAL_DATA:
-            if start_row > end_row or start_row < 1:
-                print(f"错误：无效的行范围 ({start_row}-{end_row})。请检查配置。")
-                return
-            # 使用 .iloc 进行切片，注意 Python 是 0-based 索引
-            df_to_process = df.iloc[start_row - 1: end_row]
-            print(f"根据配置，将处理从第 {start_row} 行到第 {end_row} 行，共 {len(df_to_process)} 条记录。")
-        else:
-            df_to_process = df
-            print(f"根据配置，将处理所有 {len(df_to_process)} 条记录。")
-
-        print(f"正在将 {len(df_to_process)} 条数据保存到: '{output_json_file}'...")
-        df_to_process.to_json(output_json_file, orient='records', indent=2, force_ascii=False)
-
-        print(f"结构化数据抽取成功！文件已保存为 '{output_json_file}'")
+        print(f"正在读取 Excel 文件: '{args.input}' ({describe_row_selection(args)})...")
+        rows = iter_patent_rows(args.input, args.dataset, columns_to_keep, args.start_row, args.end_row, args.shard,
+                                typed=True)
+        output_path = shard_path(args.output, args.shard)
+        schema = pa.schema([PATENT_SCHEMA.field(name) for name in columns_to_keep])
+        written = write_records(output_path, (record for _, record in rows), schema)
+        print(f"结构化数据抽取成功！{written} 条数据已保存为 '{output_path}'")
 
     except KeyError as e:
         print(f"\n错误：列名 {e} 不存在。请检查 'columns_to_keep' 列表中的名称是否与 Excel 文件中的列标题完全一致。")
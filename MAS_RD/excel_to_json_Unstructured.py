@@ -1,13 +1,22 @@
 # extract_unstructured_data.py (Final Version: Aspect-based Extraction + Range Selection)
 
-import pandas as pd
+import argparse
 import os
 import json
+import hashlib
+import random
+import threading
+import time
+from concurrent.futures import ThreadPoolExecutor
 from dotenv import load_dotenv
-from openai import OpenAI
+from openai import OpenAI, APIConnectionError, APIStatusError, APITimeoutError
 from pydantic import BaseModel, Field, ValidationError
 from typing import Optional
 
+from llm_cache import SQLiteCache, get_default_cache, make_cache_key
+from patent_dataset import (UNSTRUCTURED_SCHEMA, add_row_selection_arguments, describe_row_selection, iter_patent_rows,
+                            shard_files, shard_path, validate_row_selection, write_records)
+
 
 # --- 1. Pydantic 模型 (保持不变) ---
 class PatentAspects(BaseModel):
@@ -26,12 +35,17 @@ class PatentAspects(BaseModel):
 
 
 # --- 2. LLM 和环境设置 (保持不变) ---
-def setup_llm_client():
+def setup_llm_client(base_url: str = None):
+    """
+    初始化 LLM 客户端。重试由本脚本的 _call_with_retries 统一负责，因此关闭 SDK 自带的重试。
+    base_url 可指向本地 mock 服务 (见 mock_openai_server.py) 用于离线压测。
+    """
     load_dotenv()
     try:
         client = OpenAI(
             api_key=os.getenv("DASHSCOPE_API_KEY"),
-            base_url="https://dashscope.aliyuncs.com/compatible-mode/v1",
+            base_url=base_url or os.getenv("DASHSCOPE_BASE_URL", "https://dashscope.aliyuncs.com/compatible-mode/v1"),
+            max_retries=0,
         )
         print("LLM 客户端初始化成功。")
         return client
@@ -40,9 +54,8 @@ def setup_llm_client():
         return None
 
 
-# --- 3. 核心“填表式”知识抽取函数 (保持不变) ---
-def extract_patent_aspects(text: str, client: OpenAI) -> dict | None:
-    system_prompt = """
+# --- 3. 核心“填表式”知识抽取函数 ---
+SYSTEM_PROMPT = """
 你是一位顶级的专利分析专家，任务是阅读一份专利摘要，并像填写一份结构化分析报告一样，抽取出其中定义的十个关键方面。
 
 **抽取规则:**
@@ -65,13 +78,78 @@ def extract_patent_aspects(text: str, client: OpenAI) -> dict | None:
 - `component_relations`: 组件之间的运动关系 (描述组件如何连接、互动)。
 - `technical_implementation`: 技术实现知识 (实现的步骤或流程)。
 """
+EXTRACTION_MODEL = "qwen3-max"
+
+
+class RateLimiter:
+    """线程安全的匀速限流器: 保证任意两次请求的发出间隔不小于 60 / requests_per_minute 秒。"""
+
+    def __init__(self, requests_per_minute: float):
+        self.interval = 60.0 / requests_per_minute if requests_per_minute else 0.0
+        self._next_slot = 0.0
+        self._lock = threading.Lock()
+
+    def acquire(self):
+        if not self.interval: return
+        with self._lock:
+            now = time.monotonic()
+            slot = max(now, self._next_slot)
+            self._next_slot = slot + self.interval
+        if slot > now:
+            time.sleep(slot - now)
+
+
+def _is_retryable(error: Exception) -> bool:
+    """429 限流、5xx 服务端错误以及网络超时/连接错误可以重试，其余错误直接失败。"""
+    if isinstance(error, (APIConnectionError, APITimeoutError)):
+        return True
+    return isinstance(error, APIStatusError) and (error.status_code == 429 or error.status_code >= 500)
+
+
+def _call_with_retries(func, max_retries: int = 5, base_delay: float = 1.0, max_delay: float = 30.0,
+                       rate_limiter: RateLimiter = None):
+    """
+    调用 func()，对可重试错误做带抖动的指数退避重试；如服务端返回 Retry-After，则以其为准 (同样不超过 max_delay)。
+    每次尝试 (包括重试) 都会先经过 rate_limiter。
+    """
+    for attempt in range(max_retries + 1):
+        if rate_limiter: rate_limiter.acquire()
+        try:
+            return func()
+        except Exception as e:
+            if attempt >= max_retries or not _is_retryable(e):
+                raise
+            delay = min(max_delay, base_delay * (2 ** attempt)) * (0.5 + random.random() / 2)
+            retry_after = getattr(getattr(e, "response", None), "headers", {}).get("retry-after")
+            if retry_after and retry_after.replace(".", "", 1).isdigit():
+                delay = min(float(retry_after), max_delay)
+            print(f"  请求失败 ({type(e).__name__})，{delay:.1f} 秒后进行第 {attempt + 1}/{max_retries} 次重试。")
+            time.sleep(delay)
+
+
+def extract_patent_aspects(text: str, client: OpenAI, max_retries: int = 5,
+                           rate_limiter: RateLimiter = None, cache: SQLiteCache = None) -> dict | None:
+    """
+    抽取一篇摘要的十个方面。若提供 cache，则以 (模型, messages, temperature, response_format) 为键复用
+    历史响应；只有通过 Pydantic 验证的响应才会写入缓存。
+    """
+    response_json = None
     try:
-        messages = [{"role": "system", "content": system_prompt}, {"role": "user", "content": text}]
-        response = client.chat.completions.create(
-            model="qwen3-max", messages=messages, response_format={"type": "json_object"}
-        )
-        response_json = json.loads(response.choices[0].message.content)
+        messages = [{"role": "system", "content": SYSTEM_PROMPT}, {"role": "user", "content": text}]
+        request = {"model": EXTRACTION_MODEL, "messages": messages, "response_format": {"type": "json_object"}}
+        cache_key = make_cache_key(temperature=None, **request) if cache else None
+        content = cache.get(cache_key) if cache else None
+        from_cache = content is not None
+        if not from_cache:
+            response = _call_with_retries(
+                lambda: client.chat.completions.create(**request),
+                max_retries=max_retries, rate_limiter=rate_limiter
+            )
+            content = response.choices[0].message.content
+        response_json = json.loads(content)
         validated_aspects = PatentAspects(**response_json)
+        if cache and not from_cache:
+            cache.set(cache_key, content)
         return validated_aspects.model_dump(exclude_none=True)
     except ValidationError as e:
         print(f"  错误: LLM 输出未通过 Pydantic 验证。错误信息:\n{e}\n  原始输出: {response_json}")
@@ -81,72 +159,183 @@ def extract_patent_aspects(text: str, client: OpenAI) -> dict | None:
         return None
 
 
-# --- 4. 主流程 (已重新加入范围选择功能) ---
-def main():
-    print("--- 脚本 2 (领域知识建模版 + 范围选择): 非结构化数据抽取 ---")
+def extract_concurrently(abstracts: list[str], client: OpenAI, max_in_flight: int = 8,
+                         requests_per_minute: float = 300, max_retries: int = 5,
+                         on_result=None, cache: SQLiteCache = None) -> list[dict | None]:
+    """
+    并发抽取多条摘要: 同时在途的请求不超过 max_in_flight，发出速率不超过 requests_per_minute。
+    返回列表与输入 abstracts 一一对应 (顺序确定，与完成先后无关)。
+    on_result(i, aspects) 会在第 i 条完成时立即被调用 (在工作线程中)，用于流式写入检查点。
+    """
+    rate_limiter = RateLimiter(requests_per_minute)
+
+    def worker(i: int):
+        aspects = extract_patent_aspects(abstracts[i], client, max_retries=max_retries, rate_limiter=rate_limiter,
+                                         cache=cache)
+        if on_result: on_result(i, aspects)
+        return aspects
+
+    with ThreadPoolExecutor(max_workers=max_in_flight) as executor:
+        return list(executor.map(worker, range(len(abstracts))))
+
+
+# --- 4. 检查点: 以 申请号 + 摘要哈希 为键的追加式 JSONL ---
+def abstract_hash(text: str) -> str:
+    """摘要文本的内容哈希，摘要一旦修改即视为需要重新抽取。"""
+    return hashlib.sha256(text.strip().encode("utf-8")).hexdigest()
+
+
+def load_checkpoint(checkpoint_file: str) -> dict[str, dict]:
+    """
+    读取检查点文件及其所有分片 (.part-i-of-N)，返回 {申请号: 最新一条记录}。同一申请号出现多次时以最后一行为准；
+    崩溃时可能写了一半的末行会被忽略。合并分片使换一种分片方式或不分片重跑时仍能复用已抽取的结果
+    (各文件按修改时间从旧到新读取，记录还需与当前摘要哈希一致才会复用，因此残留的旧分片不会混入过期结果)。
+    """
+    done = {}
+    paths = [path for path in [checkpoint_file] + shard_files(checkpoint_file, allow_mixed=True) if os.path.exists(path)]
+    for path in sorted(paths, key=os.path.getmtime):
+        with open(path, 'r', encoding='utf-8') as f:
+            for line_no, line in enumerate(f, 1):
+                if not line.strip(): continue
+                try:
+                    entry = json.loads(line)
+                except json.JSONDecodeError:
+                    print(f"  警告: 检查点 '{path}' 第 {line_no} 行不完整，已忽略。")
+                    continue
+                done[entry["申请号"]] = entry
+    return done
 
+
+class CheckpointWriter:
+    """线程安全的追加式检查点写入器，每条记录写入后立即 flush 落盘。"""
+
+    def __init__(self, checkpoint_file: str):
+        self._file = open(checkpoint_file, 'a', encoding='utf-8')
+        self._lock = threading.Lock()
+
+    def write(self, entry: dict):
+        line = json.dumps(entry, ensure_ascii=False) + "\n"
+        with self._lock:
+            self._file.write(line)
+            self._file.flush()
+            os.fsync(self._file.fileno())
+
+    def close(self):
+        self._file.close()
+
+
+# --- 5. 主流程 (行范围与分片由命令行参数指定) ---
+def main():
     # ==================== 配置区 ====================
     input_excel_file = "patents.xlsx"
-    output_json_file = "unstructured_data_all.json"
-    columns_to_read = ["发明名称", "摘要"]
-
-    # 是否只抽取部分摘要？ (True / False)
-    # 如果设为 False，将处理整个文件。
-    EXTRACT_PARTIAL_DATA = True
-    # EXTRACT_PARTIAL_DATA = False
-    # 如果 EXTRACT_PARTIAL_DATA = True，请设置以下范围
-    # 注意：行号基于 Excel 中的 1-based 索引
-    start_row = 1  # 开始行 (包含此行)
-    end_row = 100  # 结束行 (包含此行)
+    workbook_dataset_file = "patents.parquet"  # 整个工作簿的列式缓存 (与结构化抽取脚本共用)
+    output_dataset_file = "unstructured_data_all.parquet"
+    # 追加式检查点: 每条抽取结果完成即写入，重启后跳过 申请号 与摘要哈希均未变化的行
+    checkpoint_file = "unstructured_data_all.checkpoint.jsonl"
+    columns_to_read = ["申请号", "发明名称", "摘要"]
+
+    # 是否并发抽取？ (True / False)
+    # 如果设为 False，将逐条串行调用 LLM。
+    CONCURRENT_EXTRACTION = True
+    MAX_IN_FLIGHT = 8  # 同时在途的最大请求数
+    REQUESTS_PER_MINUTE = 300  # 每分钟最多发出的请求数 (含重试)
+    MAX_RETRIES = 5  # 遇到 429 / 5xx 时的最大重试次数
+
+    # 是否启用 LLM 响应缓存？ (True / False)
+    # 缓存位置、TTL 和容量由环境变量 LLM_CACHE_PATH / LLM_CACHE_TTL_SECONDS / LLM_CACHE_MAX_ENTRIES 控制。
+    USE_LLM_CACHE = True
     # ===============================================
 
+    parser = argparse.ArgumentParser(description="脚本 2: 用 LLM 从专利摘要中抽取领域知识。")
+    parser.add_argument("--input", default=input_excel_file, help="输入工作簿")
+    parser.add_argument("--output", default=output_dataset_file, help="输出 Parquet 文件 (分片时自动添加 .part-i-of-N 后缀)")
+    parser.add_argument("--dataset", default=workbook_dataset_file, help="工作簿的列式缓存")
+    parser.add_argument("--checkpoint", default=checkpoint_file, help="追加式检查点 (分片时每个分片各写一份)")
+    add_row_selection_arguments(parser)
+    args = parser.parse_args()
+
+    print("--- 脚本 2 (领域知识建模版): 非结构化数据抽取 ---")
+
+    if not os.path.exists(args.input):
+        print(f"错误：找不到输入文件 '{args.input}'")
+        return
+    error = validate_row_selection(args)
+    if error:
+        print(f"错误：{error}。请检查命令行参数。")
+        return
+
     llm_client = setup_llm_client()
     if not llm_client: return
+    llm_cache = get_default_cache() if USE_LLM_CACHE else None
 
+    # --- 按命令行参数选择行范围与分片 (只读模式流式读取，读到结束行即停止) ---
+    print(f"将处理 {describe_row_selection(args)}。")
+    checkpoint = load_checkpoint(args.checkpoint)
+    tasks, pending = [], []
     try:
-        df = pd.read_excel(input_excel_file, usecols=columns_to_read)
-        df = df.fillna('')
-        print(f"成功从 '{input_excel_file}' 初步读取 {len(df)} 条记录。")
+        for row_number, row in iter_patent_rows(args.input, args.dataset, columns_to_read, args.start_row,
+                                                args.end_row, args.shard):
+            patent_name = row["发明名称"]
+            abstract_text = row["摘要"]
+            if not patent_name or not abstract_text:
+                print(f"  跳过 Excel 第 {row_number} 行，缺少发明名称或摘要。")
+                continue
+            key = str(row["申请号"]).strip() or patent_name
+            text_hash = abstract_hash(abstract_text)
+            task = (row_number, key, patent_name, abstract_text, text_hash)
+            tasks.append(task)
+            done = checkpoint.get(key)
+            if not done or done["abstract_hash"] != text_hash:
+                pending.append(task)
     except Exception as e:
         print(f"读取 Excel 文件时出错: {e}")
         return
+    print(f"检查点中已有 {len(tasks) - len(pending)} 条可复用，本次需抽取 {len(pending)} 条。")
 
-    # --- 根据配置选择数据范围 ---
-    if EXTRACT_PARTIAL_DATA:
-        if start_row > end_row or start_row < 1:
-            print(f"错误：无效的行范围 ({start_row}-{end_row})。请检查配置。")
+    checkpoint_writer = CheckpointWriter(shard_path(args.checkpoint, args.shard))
+
+    def save_result(i: int, patent_aspects: dict | None):
+        row_number, key, patent_name, _, text_hash = pending[i]
+        if not patent_aspects:
+            print(f"  Excel 第 {row_number} 行 ('{patent_name}') 未能从摘要中提取或验证分析报告。")
             return
-        df_to_process = df.iloc[start_row - 1: end_row]
-        print(f"根据配置，将处理从第 {start_row} 行到第 {end_row} 行，共 {len(df_to_process)} 条记录。")
-    else:
-        df_to_process = df
-        print(f"根据配置，将处理所有 {len(df_to_process)} 条记录。")
-
-    all_extractions = []
-    total_rows_to_process = len(df_to_process)
-    for index, row in df_to_process.iterrows():
-        patent_name = row["发明名称"]
-        abstract_text = row["摘要"]
-
-        print(
-            f"\n--- [ 正在处理 Excel 第 {index + 2} 行 / 本次任务共 {total_rows_to_process} 条 ] 专利: '{patent_name}' ---")
-
-        if not patent_name or not abstract_text:
-            print("  跳过记录，缺少发明名称或摘要。")
-            continue
-
-        patent_aspects = extract_patent_aspects(abstract_text, llm_client)
-
-        if patent_aspects:
-            print(f"  分析报告提取并验证成功，包含 {len(patent_aspects)} 个方面。")
-            record = {"发明名称": patent_name, "extracted_knowledge": patent_aspects}
-            all_extractions.append(record)
+        entry = {"申请号": key, "abstract_hash": text_hash, "发明名称": patent_name,
+                 "extracted_knowledge": patent_aspects}
+        checkpoint_writer.write(entry)
+        checkpoint[key] = entry
+
+    total_rows_to_process = len(pending)
+    try:
+        if CONCURRENT_EXTRACTION:
+            print(f"\n--- 并发抽取 {total_rows_to_process} 条摘要 (并发上限 {MAX_IN_FLIGHT}，"
+                  f"速率上限 {REQUESTS_PER_MINUTE} 次/分钟) ---")
+            start_time = time.perf_counter()
+            extract_concurrently([task[3] for task in pending], llm_client, MAX_IN_FLIGHT,
+                                 REQUESTS_PER_MINUTE, MAX_RETRIES, on_result=save_result, cache=llm_cache)
+            elapsed = time.perf_counter() - start_time
+            print(f"并发抽取完成，耗时 {elapsed:.1f} 秒 ({total_rows_to_process / max(elapsed, 1e-9):.2f} 条/秒)。")
         else:
-            print("  未能从摘要中提取或验证分析报告。")
+            rate_limiter = RateLimiter(REQUESTS_PER_MINUTE)
+            for i, (row_number, _, patent_name, abstract_text, _) in enumerate(pending):
+                print(
+                    f"\n--- [ 正在处理 Excel 第 {row_number} 行 / 本次任务共 {total_rows_to_process} 条 ] 专利: '{patent_name}' ---")
+                save_result(i, extract_patent_aspects(abstract_text, llm_client, MAX_RETRIES, rate_limiter,
+                                                      cache=llm_cache))
+    finally:
+        checkpoint_writer.close()
+    if llm_cache:
+        print(f"LLM 缓存统计: {llm_cache.stats()}")
+
+    # 按 Excel 行顺序，从检查点汇总本次范围内所有已完成 (且摘要未变化) 的记录，流式写入列式数据集
+    def completed_extractions():
+        for _, key, patent_name, _, text_hash in tasks:
+            entry = checkpoint.get(key)
+            if entry and entry["abstract_hash"] == text_hash:
+                yield {"申请号": key, "发明名称": patent_name, "extracted_knowledge": entry["extracted_knowledge"]}
 
-    print(f"\n正在将 {len(all_extractions)} 条分析报告保存到 '{output_json_file}'...")
-    with open(output_json_file, 'w', encoding='utf-8') as f:
-        json.dump(all_extractions, f, ensure_ascii=False, indent=2)
+    output_path = shard_path(args.output, args.shard)
+    written = write_records(output_path, completed_extractions(), UNSTRUCTURED_SCHEMA)
+    print(f"\n已将 {written} 条分析报告保存到 '{output_path}'。")
 
     print("非结构化数据(分析报告)抽取成功！")
 
@@ -0,0 +1,384 @@
+# graph_backend.py (分析工具的图后端: Neo4j Cypher 实现，以及由数据集在进程内构建的 CSR 邻接实现)
+
+from abc import ABC, abstractmethod
+from typing import Callable, Iterable, Iterator
+
+import numpy as np
+
+from graph_indexes import PROBLEM_STATS_MISSING_QUERY, PROBLEM_STATS_SUBQUERY, YEAR_INDEX_QUERY
+
+# --- 1. Cypher 查询 (CypherGraphBackend 使用；InMemoryGraphBackend 以相同语义原生实现) ---
+_FEATURE_QUERY_PATENT_PART = """
+MATCH (p:Patent) WHERE p.app_no IN $patent_list
+CALL {
+    WITH p
+    OPTIONAL MATCH (p)-[:发明于]->(ad:ApplicationDate) WHERE ad.name IS NOT NULL
+    RETURN collect(substring(ad.name, 0, 4)) AS years
+}
+CALL {
+    WITH p
+    OPTIONAL MATCH (p)-[:应用于]->(scene:应用领域)
+    OPTIONAL MATCH (scene)<-[:应用于]-(p2:Patent)-[:实现方式是]->(t:技术实现) WHERE NOT p2.app_no IN $patent_list
+    RETURN collect(DISTINCT scene.name) AS scenes, collect(DISTINCT [p2.app_no, t.name]) AS peer_techs
+}
+"""
+# 问题统计直接读取加载器维护的节点属性 (见 graph_indexes.PROBLEM_STATS_SUBQUERY)
+FEATURE_QUERY = _FEATURE_QUERY_PATENT_PART + """
+CALL {
+    WITH p
+    OPTIONAL MATCH (p)-[:旨在解决]->(problem:待解决问题)
+    RETURN collect([problem.name, problem.tech_count, problem.top_scene]) AS problems
+}
+RETURN p.app_no AS patent, years, scenes, peer_techs, problems
+"""
+GAP_QUERY = """
+MATCH (p:Patent)-[:旨在解决]->(problem:待解决问题) WHERE p.app_no IN $patent_list
+WITH DISTINCT problem
+RETURN problem.name AS problem_name, problem.tech_count AS tech_count,
+       COALESCE(problem.top_scene, '暂无') AS top_scene_name
+ORDER BY tech_count ASC, problem_name ASC LIMIT $limit
+"""
+# 图谱中尚有问题缺少统计属性 (旧版图谱) 时使用的等价查询: 在查询时展开全图谱计算
+FEATURE_SCAN_QUERY = _FEATURE_QUERY_PATENT_PART + """
+CALL {
+    WITH p
+    OPTIONAL MATCH (p)-[:旨在解决]->(problem:待解决问题)
+""" + PROBLEM_STATS_SUBQUERY + """
+    RETURN collect([problem.name, tech_count, top_scene]) AS problems
+}
+RETURN p.app_no AS patent, years, scenes, peer_techs, problems
+"""
+GAP_SCAN_QUERY = """
+MATCH (p:Patent)-[:旨在解决]->(problem:待解决问题) WHERE p.app_no IN $patent_list
+WITH DISTINCT problem
+""" + PROBLEM_STATS_SUBQUERY + """
+RETURN problem.name AS problem_name, tech_count, COALESCE(top_scene, '暂无') AS top_scene_name
+ORDER BY tech_count ASC, problem_name ASC LIMIT $limit
+"""
+ASSOCIATION_QUERY = """
+MATCH (p1:Patent)-[:应用于]->(scene:应用领域) WHERE p1.app_no IN $patent_list
+MATCH (scene)<-[:应用于]-(p2:Patent) WHERE NOT p2.app_no IN $patent_list
+MATCH (p2)-[:实现方式是]->(t:技术实现)
+RETURN t.name AS associated_tech, COUNT(DISTINCT p2) AS association_strength
+ORDER BY association_strength DESC, associated_tech ASC LIMIT $limit
+"""
+
+
+def features_from_rows(rows: list[dict]) -> dict:
+    features = {"patents": {}, "problems": {}}
+    for r in rows:
+        features["patents"][r["patent"]] = {
+            "years": [int(y) for y in r["years"] if y and str(y).isdigit()],
+            "scenes": r["scenes"],
+            "peer_techs": [pair for pair in r["peer_techs"] if pair[0] is not None and pair[1] is not None],
+            "problems": [name for name, _, _ in r["problems"] if name is not None],
+        }
+        for name, tech_count, top_scene in r["problems"]:
+            if name is not None:
+                features["problems"][name] = {"tech_count": tech_count, "top_scene": top_scene}
+    return features
+
+
+# --- 2. 后端接口 ---
+class GraphBackend(ABC):
+    """
+    分析工具所需的图遍历接口。返回值形态与对应 Cypher 查询的结果一致:
+    - patent_features: fetch_patent_features 的特征快照 (见 features_from_rows)
+    - associated_technologies: [{"associated_tech", "association_strength"}]，按强度降序、名称升序
+    - technology_gaps: [{"problem_name", "tech_count", "top_scene_name"}]，按方案数升序、名称升序
+    - patent_year_rows: (申请号, 年份字符串) 行，用于构建 PatentYearIndex
+    子类必须实现四个同步方法 (缺少任何一个时实例化即报错)；异步方法默认直接调用同步实现 (进程内后端没有 I/O)，
+    有网络往返的后端应覆盖它们。
+    """
+    name = "abstract"
+
+    @abstractmethod
+    def patent_features(self, patent_list: list[str]) -> dict:
+        ...
+
+    @abstractmethod
+    def associated_technologies(self, patent_list: list[str], limit: int = 10) -> list[dict]:
+        ...
+
+    @abstractmethod
+    def technology_gaps(self, patent_list: list[str], limit: int = 10) -> list[dict]:
+        ...
+
+    @abstractmethod
+    def patent_year_rows(self) -> Iterable[tuple[str, str]]:
+        ...
+
+    async def apatent_features(self, patent_list: list[str]) -> dict:
+        return self.patent_features(patent_list)
+
+    async def aassociated_technologies(self, patent_list: list[str], limit: int = 10) -> list[dict]:
+        return self.associated_technologies(patent_list, limit)
+
+    async def atechnology_gaps(self, patent_list: list[str], limit: int = 10) -> list[dict]:
+        return self.technology_gaps(patent_list, limit)
+
+
+class CypherGraphBackend(GraphBackend):
+    """
+    通过 run_query / arun_query (如 tools.run_cypher_query，在共享连接池上执行读事务) 查询 Neo4j。
+    问题统计读取加载器维护的节点属性；图谱中仍有问题缺少统计 (旧版图谱，尚未运行全量重建) 时回退到展开全图谱的等价查询，
+    检查到统计完整后不再重复检查。
+    """
+    name = "neo4j"
+
+    def __init__(self, run_query: Callable[[str, dict], list[dict]], arun_query: Callable = None):
+        self.run_query = run_query
+        self.arun_query = arun_query
+        self._problem_stats_ready = False
+
+    @staticmethod
+    def _stats_complete(rows: list[dict]) -> bool:
+        return not rows or not rows[0]["missing"]
+
+    def _selected_queries(self) -> tuple[str, str]:
+        return (FEATURE_QUERY, GAP_QUERY) if self._problem_stats_ready else (FEATURE_SCAN_QUERY, GAP_SCAN_QUERY)
+
+    def _queries(self) -> tuple[str, str]:
+        if not self._problem_stats_ready:
+            self._problem_stats_ready = self._stats_complete(self.run_query(PROBLEM_STATS_MISSING_QUERY, {}))
+        return self._selected_queries()
+
+    async def _aqueries(self) -> tuple[str, str]:
+        if not self._problem_stats_ready:
+            self._problem_stats_ready = self._stats_complete(await self.arun_query(PROBLEM_STATS_MISSING_QUERY, {}))
+        return self._selected_queries()
+
+    def patent_features(self, patent_list: list[str]) -> dict:
+        feature_query, _ = self._queries()
+        return features_from_rows(self.run_query(feature_query, {"patent_list": patent_list}))
+
+    def associated_technologies(self, patent_list: list[str], limit: int = 10) -> list[dict]:
+        return self.run_query(ASSOCIATION_QUERY, {"patent_list": patent_list, "limit": limit})
+
+    def technology_gaps(self, patent_list: list[str], limit: int = 10) -> list[dict]:
+        _, gap_query = self._queries()
+        return self.run_query(gap_query, {"patent_list": patent_list, "limit": limit})
+
+    def patent_year_rows(self) -> Iterable[tuple[str, str]]:
+        return ((r["patent"], r["year"]) for r in self.run_query(YEAR_INDEX_QUERY, {}))
+
+    async def apatent_features(self, patent_list: list[str]) -> dict:
+        feature_query, _ = await self._aqueries()
+        return features_from_rows(await self.arun_query(feature_query, {"patent_list": patent_list}))
+
+    async def aassociated_technologies(self, patent_list: list[str], limit: int = 10) -> list[dict]:
+        return await self.arun_query(ASSOCIATION_QUERY, {"patent_list": patent_list, "limit": limit})
+
+    async def atechnology_gaps(self, patent_list: list[str], limit: int = 10) -> list[dict]:
+        _, gap_query = await self._aqueries()
+        return await self.arun_query(gap_query, {"patent_list": patent_list, "limit": limit})
+
+
+# --- 3. 进程内实现: 每种关系一对 CSR 邻接数组 (正向 + 反向) ---
+TOOL_RELATIONSHIPS = {  # 分析工具遍历的关系类型 -> (起点标签, 终点标签)
+    "发明于": ("Patent", "ApplicationDate"),
+    "应用于": ("Patent", "应用领域"),
+    "实现方式是": ("Patent", "技术实现"),
+    "旨在解决": ("Patent", "待解决问题"),
+}
+_EMPTY = np.empty(0, dtype=np.int32)
+
+class CSRAdjacency:
+    """一种关系的压缩稀疏行邻接: 节点 i 的邻居为 targets[offsets[i]:offsets[i + 1]] (已去重、升序)。"""
+
+    def __init__(self, offsets: np.ndarray, targets: np.ndarray):
+        self.offsets = offsets
+        self.targets = targets
+
+    @classmethod
+    def from_pairs(cls, sources: np.ndarray, targets: np.ndarray, node_count: int) -> "CSRAdjacency":
+        order = np.lexsort((targets, sources))
+        sources, targets = sources[order], targets[order]
+        if len(sources):
+            keep = np.ones(len(sources), dtype=bool)
+            keep[1:] = (sources[1:] != sources[:-1]) | (targets[1:] != targets[:-1])
+            sources, targets = sources[keep], targets[keep]
+        offsets = np.zeros(node_count + 1, dtype=np.int64)
+        np.cumsum(np.bincount(sources, minlength=node_count), out=offsets[1:])
+        return cls(offsets, targets.astype(np.int32))
+
+    def neighbors(self, node: int) -> np.ndarray:
+        return self.targets[self.offsets[node]:self.offsets[node + 1]]
+
+    def gather(self, nodes: np.ndarray) -> tuple[np.ndarray, np.ndarray]:
+        """一次取出多个节点的全部邻居，返回 (每条边的起点, 邻居)，不经 Python 循环。"""
+        starts = self.offsets[nodes]
+        lengths = self.offsets[nodes + 1] - starts
+        total = int(lengths.sum())
+        if not total: return _EMPTY, _EMPTY
+        shift = np.repeat(starts - (np.cumsum(lengths) - lengths), lengths)
+        return np.repeat(nodes, lengths), self.targets[shift + np.arange(total)]
+
+
+def dataset_graph_items(structured_path: str, unstructured_path: str, read_batch_rows: int = 10000,
+                        aliases=None) -> Iterator[tuple[list, list]]:
+    """按 json_to_neo4j 加载器的顺序逐条产出 (节点列表, 关系列表)，即加载器写入 Neo4j 的同一份图数据。"""
+    from json_to_neo4j import _aspect_graph_items, _structured_graph_items, iter_aspect_batches
+    from patent_dataset import STRUCTURED_FIELDS, iter_records
+
+    for records in iter_records(structured_path, STRUCTURED_FIELDS, read_batch_rows):
+        yield from map(_structured_graph_items, records)
+    for records in iter_aspect_batches(unstructured_path, structured_path, read_batch_rows):
+        for record in records:
+            yield _aspect_graph_items(record, aliases)
+
+
+class InMemoryGraphBackend(GraphBackend):
+    """
+    由结构化 / 摘要知识数据集直接构建的进程内图: 节点与关系由 json_to_neo4j 的同一套拆解函数产生，
+    因此与加载到 Neo4j 的图谱一致 (包括 MATCH 语义: 端点不存在的关系不会创建)。
+    节点按标签编号 (ids / names)，每种关系保存正向 (out_edges) 与反向 (in_edges) CSR 邻接，
+    各分析工具的遍历以 numpy 数组运算完成，不需要 Neo4j 服务。
+    """
+    name = "memory"
+
+    def __init__(self, names: dict[str, list], edges: dict[str, tuple[str, str, np.ndarray, np.ndarray]]):
+        self.names = names
+        for label in {label for labels in TOOL_RELATIONSHIPS.values() for label in labels}:
+            names.setdefault(label, [])
+        for rel_type, (source_label, target_label) in TOOL_RELATIONSHIPS.items():
+            edges.setdefault(rel_type, (source_label, target_label, _EMPTY, _EMPTY))
+        self.ids = {label: {name: i for i, name in enumerate(label_names)} for label, label_names in names.items()}
+        self._name_arrays = {label: np.array(label_names, dtype=object) for label, label_names in names.items()}
+        self.out_edges, self.in_edges = {}, {}
+        for rel_type, (source_label, target_label, sources, targets) in edges.items():
+            self.out_edges[rel_type] = CSRAdjacency.from_pairs(sources, targets, len(names[source_label]))
+            self.in_edges[rel_type] = CSRAdjacency.from_pairs(targets, sources, len(names[target_label]))
+        self.problem_tech_count, self.problem_top_scene = self._build_problem_stats()
+        self._problem_rank = self._name_rank("待解决问题")
+
+    @classmethod
+    def from_items(cls, items: Iterable[tuple[list, list]]) -> "InMemoryGraphBackend":
+        """由 (节点列表, 关系列表) 序列构建，格式与 json_to_neo4j._structured_graph_items 的返回值相同。"""
+        ids: dict[str, dict] = {}
+        pending: dict[str, tuple[str, str, list]] = {}
+        for nodes, rels in items:
+            for label, key, _ in nodes:
+                label_ids = ids.setdefault(label, {})
+                if key not in label_ids: label_ids[key] = len(label_ids)
+            for source_label, source_key, target_label, target_key, rel_type in rels:
+                pending.setdefault(rel_type, (source_label, target_label, []))[2].append((source_key, target_key))
+
+        edges = {}
+        for rel_type, (source_label, target_label, pairs) in pending.items():
+            source_ids, target_ids = ids.get(source_label, {}), ids.get(target_label, {})
+            matched = [(source_ids[s], target_ids[t]) for s, t in pairs if s in source_ids and t in target_ids]
+            array = np.array(matched, dtype=np.int32).reshape(-1, 2)
+            edges[rel_type] = (source_label, target_label, array[:, 0], array[:, 1])
+        names = {label: list(label_ids) for label, label_ids in ids.items()}
+        return cls(names, edges)
+
+    @classmethod
+    def from_datasets(cls, structured_path: str, unstructured_path: str, read_batch_rows: int = 10000,
+                      aliases=None) -> "InMemoryGraphBackend":
+        """aliases (aspect_canonical.AspectAliases) 与加载器使用同一别名表时，近义方面短语同样合并为规范节点。"""
+        return cls.from_items(dataset_graph_items(structured_path, unstructured_path, read_batch_rows, aliases))
+
+    # --- 遍历辅助 ---
+    def _label_ids(self, label: str, keys: Iterable[str]) -> np.ndarray:
+        label_ids = self.ids.get(label, {})
+        return np.array(sorted({label_ids[k] for k in keys if k in label_ids}), dtype=np.int32)
+
+    def _adjacency(self, rel_type: str, reverse: bool = False) -> CSRAdjacency:
+        return (self.in_edges if reverse else self.out_edges)[rel_type]
+
+    def _names(self, label: str, ids: np.ndarray) -> list:
+        return self._name_arrays[label][ids].tolist()
+
+    def _name_rank(self, label: str) -> np.ndarray:
+        """每个节点名称的字典序名次，用于以数组运算实现 ORDER BY name。"""
+        rank = np.empty(len(self.names[label]), dtype=np.int64)
+        rank[np.argsort(self._name_arrays[label], kind="stable")] = np.arange(len(rank))
+        return rank
+
+    def _problem_pairs(self, rel_type: str) -> tuple[np.ndarray, np.ndarray]:
+        """(问题, 解决该问题的专利) 与专利的 rel_type 出边连接，返回每条路径的 (问题, 终点)。"""
+        solved_by = self._adjacency("旨在解决", reverse=True)
+        problems = np.repeat(np.arange(len(solved_by.offsets) - 1), np.diff(solved_by.offsets))
+        adjacency = self._adjacency(rel_type)
+        solvers = solved_by.targets
+        return np.repeat(problems, adjacency.offsets[solvers + 1] - adjacency.offsets[solvers]), \
+            adjacency.gather(solvers)[1]
+
+    def _build_problem_stats(self) -> tuple[np.ndarray, np.ndarray]:
+        """
+        一次性计算全部问题的统计 (与 graph_indexes.PROBLEM_STATS_SUBQUERY 语义相同):
+        tech_count 为去重的技术实现数；top_scene 为应用领域编号 (频次降序、名称升序的第一个，没有时为 -1)。
+        """
+        problem_count = len(self.names["待解决问题"])
+        tech_total, scene_total = len(self.names["技术实现"]), len(self.names["应用领域"])
+        problems, techs = self._problem_pairs("实现方式是")
+        distinct = np.unique(problems.astype(np.int64) * tech_total + techs)
+        tech_count = np.bincount(distinct // max(tech_total, 1), minlength=problem_count)
+
+        problems, scenes = self._problem_pairs("应用于")
+        keys, freq = np.unique(problems.astype(np.int64) * scene_total + scenes, return_counts=True)
+        key_problems, key_scenes = keys // max(scene_total, 1), keys % max(scene_total, 1)
+        order = np.lexsort((self._name_rank("应用领域")[key_scenes], -freq, key_problems))
+        key_problems, key_scenes = key_problems[order], key_scenes[order]
+        first = np.ones(len(order), dtype=bool)
+        first[1:] = key_problems[1:] != key_problems[:-1]
+        top_scene = np.full(problem_count, -1, dtype=np.int64)
+        top_scene[key_problems[first]] = key_scenes[first]
+        return tech_count, top_scene
+
+    def _top_scene_name(self, problem: int) -> str | None:
+        scene = self.problem_top_scene[problem]
+        return self.names["应用领域"][scene] if scene >= 0 else None
+
+    # --- 接口实现 ---
+    def associated_technologies(self, patent_list: list[str], limit: int = 10) -> list[dict]:
+        selected = self._label_ids("Patent", patent_list)
+        scenes = np.unique(self._adjacency("应用于").gather(selected)[1])
+        peers = np.setdiff1d(self._adjacency("应用于", reverse=True).gather(scenes)[1], selected)
+        # 邻接已去重，每个 (同领域专利, 技术实现) 只出现一次，计数即 COUNT(DISTINCT p2)
+        techs, strength = np.unique(self._adjacency("实现方式是").gather(peers)[1], return_counts=True)
+        ranked = sorted(zip(-strength, self._names("技术实现", techs)))[:limit]
+        return [{"associated_tech": tech, "association_strength": int(-negative)} for negative, tech in ranked]
+
+    def technology_gaps(self, patent_list: list[str], limit: int = 10) -> list[dict]:
+        selected = self._label_ids("Patent", patent_list)
+        problems = np.unique(self._adjacency("旨在解决").gather(selected)[1])
+        # 统计已预计算: 只需对所选专利涉及的问题按 (方案数, 名称) 取前 limit 个
+        problems = problems[np.lexsort((self._problem_rank[problems], self.problem_tech_count[problems]))[:limit]]
+        return [{"problem_name": name, "tech_count": int(self.problem_tech_count[problem]),
+                 "top_scene_name": self._top_scene_name(problem) or '暂无'}
+                for problem, name in zip(problems, self._names("待解决问题", problems))]
+
+    def patent_year_rows(self) -> Iterator[tuple[str, str]]:
+        patents, dates = self._adjacency("发明于").gather(np.arange(len(self.names["Patent"]), dtype=np.int32))
+        patent_names, date_names = self.names["Patent"], self.names["ApplicationDate"]
+        for patent, date in zip(patents, dates):
+            yield patent_names[patent], date_names[date][:4]
+
+    def patent_features(self, patent_list: list[str]) -> dict:
+        selected = self._label_ids("Patent", patent_list)
+        applied_to, implemented_by = self._adjacency("应用于"), self._adjacency("实现方式是")
+        features = {"patents": {}, "problems": {}}
+        for patent in selected:
+            scenes = applied_to.neighbors(patent)
+            peers = np.setdiff1d(self._adjacency("应用于", reverse=True).gather(scenes)[1], selected)
+            # 同领域专利已去重、邻接已去重，(专利, 技术实现) 对天然唯一，可直接整体转换 (同领域专利可达数万)
+            peer_ids, techs = implemented_by.gather(peers)
+            peer_techs = np.stack((self._name_arrays["Patent"][peer_ids], self._name_arrays["技术实现"][techs]), axis=1)
+            problems = self._adjacency("旨在解决").neighbors(patent)
+            years = [date[:4] for date in self._names("ApplicationDate", self._adjacency("发明于").neighbors(patent))]
+            features["patents"][self.names["Patent"][patent]] = {
+                "years": [int(y) for y in years if y.isdigit()],
+                "scenes": self._names("应用领域", scenes),
+                "peer_techs": peer_techs.tolist(),
+                "problems": self._names("待解决问题", problems),
+            }
+            for problem, name in zip(problems, self._names("待解决问题", problems)):
+                features["problems"][name] = {"tech_count": int(self.problem_tech_count[problem]),
+                                              "top_scene": self._top_scene_name(problem)}
+        return features
+
+    def stats(self) -> dict:
+        return {"nodes": {label: len(label_names) for label, label_names in self.names.items()},
+                "relationships": {rel_type: len(adjacency.targets) for rel_type, adjacency in self.out_edges.items()}}
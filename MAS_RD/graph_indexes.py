@@ -0,0 +1,116 @@
+# graph_indexes.py (分析工具使用的进程内预计算索引)
+
+import threading
+import time
+from typing import Callable, Iterable
+
+import numpy as np
+
+YEAR_INDEX_QUERY = """
+MATCH (p:Patent)-[:发明于]->(ad:ApplicationDate)
+WHERE ad.name IS NOT NULL AND p.app_no IS NOT NULL
+RETURN p.app_no AS patent, substring(ad.name, 0, 4) AS year
+"""
+
+# 图内预计算索引: 待解决问题节点上的 tech_count (解决该问题的专利去重后的技术实现数) 与
+# top_scene (这些专利最常见的应用领域，频次降序、名称升序)。由加载器在写入摘要知识后增量维护，
+# 分析工具直接读取属性，查询代价只与所选专利有关，不再随全图谱增长。
+PROBLEM_STATS_SUBQUERY = """
+CALL {
+    WITH problem
+    OPTIONAL MATCH (problem)<-[:旨在解决]-(:Patent)-[:实现方式是]->(tech:技术实现)
+    RETURN COUNT(DISTINCT tech) AS tech_count
+}
+CALL {
+    WITH problem
+    OPTIONAL MATCH (problem)<-[:旨在解决]-(:Patent)-[:应用于]->(scene:应用领域)
+    WITH scene, COUNT(scene) AS scene_freq ORDER BY scene_freq DESC, scene.name ASC
+    RETURN COLLECT(scene.name)[0] AS top_scene
+}
+"""
+# 增量更新: 只有写入了摘要知识的专利所解决的问题，其统计才可能变化 (三种关系都只由摘要知识按申请号写入)
+PROBLEM_STATS_REFRESH_QUERY = """
+UNWIND $patents AS app_no
+MATCH (:Patent {app_no: app_no})-[:旨在解决]->(problem:待解决问题)
+WITH DISTINCT problem
+""" + PROBLEM_STATS_SUBQUERY + """
+SET problem.tech_count = tech_count, problem.top_scene = top_scene
+RETURN count(problem) AS refreshed
+"""
+# 全量重建 (离线导入后或旧版图谱): 需在自动提交事务中执行
+PROBLEM_STATS_REBUILD_QUERY = """
+MATCH (problem:待解决问题)
+CALL {
+    WITH problem
+""" + PROBLEM_STATS_SUBQUERY + """
+    SET problem.tech_count = tech_count, problem.top_scene = top_scene
+} IN TRANSACTIONS OF 1000 ROWS
+"""
+# 缺少统计的问题数 (决定加载结束时是否全量重建、分析工具是否回退到扫描查询)。摘要知识的专利不在图谱中时
+# 会留下没有 旨在解决 关系的孤立问题节点: 增量更新从专利出发，永远不会为它们写入统计，技术空白分析也不会选到它们，
+# 因此不计入，否则每次加载都会触发全量重建。
+PROBLEM_STATS_MISSING_QUERY = """
+MATCH (problem:待解决问题) WHERE problem.tech_count IS NULL
+  AND EXISTS { MATCH (problem)<-[:旨在解决]-(:Patent) }
+RETURN count(problem) AS missing
+"""
+
+
+class PatentYearIndex:
+    """
+    专利 (申请号) -> 申请年份 的紧凑索引 (CSR 结构):
+    第 i 个专利的年份为 years[offsets[i]:offsets[i + 1]]。按申请号建模后每个 Patent 通常只有一个 ApplicationDate，
+    仍保留与 Cypher 逐行匹配相同的多值语义。
+    """
+
+    def __init__(self, patent_ids: dict[str, int], offsets: np.ndarray, years: np.ndarray):
+        self.patent_ids = patent_ids
+        self.offsets = offsets
+        self.years = years
+
+    @classmethod
+    def from_rows(cls, rows: Iterable[tuple[str, str]]) -> "PatentYearIndex":
+        """由 (申请号, 年份字符串) 行构建索引，非数字年份会被丢弃。"""
+        grouped: dict[str, list[int]] = {}
+        for patent, year in rows:
+            if patent is None or not year or not str(year).isdigit(): continue
+            grouped.setdefault(patent, []).append(int(year))
+        patent_ids = {patent: i for i, patent in enumerate(grouped)}
+        counts = np.fromiter((len(v) for v in grouped.values()), dtype=np.int64, count=len(grouped))
+        offsets = np.zeros(len(grouped) + 1, dtype=np.int64)
+        np.cumsum(counts, out=offsets[1:])
+        years = np.fromiter((y for v in grouped.values() for y in v), dtype=np.int16, count=int(offsets[-1]))
+        return cls(patent_ids, offsets, years)
+
+    def years_for(self, patent_list: list[str]) -> np.ndarray:
+        """返回给定专利列表 (自动去重) 的全部年份。"""
+        rows = sorted({self.patent_ids[p] for p in patent_list if p in self.patent_ids})
+        if not rows: return np.empty(0, dtype=np.int16)
+        return np.concatenate([self.years[self.offsets[i]:self.offsets[i + 1]] for i in rows])
+
+    def year_histogram(self, patent_list: list[str]) -> tuple[np.ndarray, np.ndarray]:
+        """返回 (升序年份, 每年专利数)。"""
+        return np.unique(self.years_for(patent_list), return_counts=True)
+
+
+class LazyIndex:
+    """线程安全的惰性索引: 首次访问时构建，超过 ttl_seconds 后在下一次访问时重建。"""
+
+    def __init__(self, builder: Callable[[], object], ttl_seconds: float = 600):
+        self.builder = builder
+        self.ttl_seconds = ttl_seconds
+        self._value = None
+        self._built_at = 0.0
+        self._lock = threading.Lock()
+
+    def get(self):
+        if self._value is None or time.monotonic() - self._built_at > self.ttl_seconds:
+            with self._lock:
+                if self._value is None or time.monotonic() - self._built_at > self.ttl_seconds:
+                    self._value = self.builder()
+                    self._built_at = time.monotonic()
+        return self._value
+
+    def invalidate(self):
+        with self._lock:
+            self._value = None
@@ -1,10 +1,20 @@
 # build_knowledge_graph.py (Final Version: Application Date as a Node)
 
 import os
-import json
+import random
 import re
+import time
+import zlib
+from collections import defaultdict
+from concurrent.futures import ThreadPoolExecutor
+from functools import partial
+from typing import Callable, Iterable, Iterator
 from dotenv import load_dotenv
 from neo4j import GraphDatabase
+from neo4j.exceptions import TransientError
+
+from graph_indexes import PROBLEM_STATS_MISSING_QUERY, PROBLEM_STATS_REBUILD_QUERY, PROBLEM_STATS_REFRESH_QUERY
+from patent_dataset import STRUCTURED_FIELDS, dataset_files, iter_records, resolve_dataset_path
 
 
 # --- 1. Neo4j 连接 (保持不变) ---
@@ -24,33 +34,58 @@ def setup_driver():
         return None
 
 
-# --- 2. Cypher 辅助函数 (将 _create_node 恢复为简单版) ---
-def _create_node(tx, label, properties: dict):
-    """使用 MERGE 创建一个只带 name 属性的节点。"""
-    query = f"MERGE (n:`{label}` {{name: $name}})"
-    tx.run(query, name=properties.get("name"))
+# --- 2. Cypher 辅助函数 ---
+# 各标签的唯一键属性: Patent 以 申请号 (app_no) 为键，发明名称只作为展示属性 name (同名专利互不合并)；
+# 其余标签仍以 name 为键
+NODE_KEYS = {"Patent": "app_no"}
+
+
+def node_key(label: str) -> str:
+    return NODE_KEYS.get(label, "name")
+
 
+def _create_node(tx, label, key, properties: dict = None):
+    """按标签的唯一键 MERGE 节点，并写入附加属性 (如 Patent 的展示名称)。"""
+    query = f"MERGE (n:`{label}` {{`{node_key(label)}`: $key}}) SET n += $properties"
+    tx.run(query, key=key, properties=properties or {})
 
-def _create_relationship(tx, source_label, source_name, target_label, target_name, rel_type):
+
+def _create_relationship(tx, source_label, source_key, target_label, target_key, rel_type):
     """使用 MERGE 创建关系，支持中文。"""
     query = (
-        f"MATCH (a:`{source_label}` {{name: $source_name}}) "
-        f"MATCH (b:`{target_label}` {{name: $target_name}}) "
+        f"MATCH (a:`{source_label}` {{`{node_key(source_label)}`: $source_key}}) "
+        f"MATCH (b:`{target_label}` {{`{node_key(target_label)}`: $target_key}}) "
         f"MERGE (a)-[r:`{rel_type}`]->(b)"
     )
-    tx.run(query, source_name=source_name, target_name=target_name)
+    tx.run(query, source_key=source_key, target_key=target_key)
 
 
-# --- 3. 核心函数 1: 构建图谱骨架 (已按新模型重写) ---
-def build_structured_kg(patent_record: dict, driver: GraphDatabase.driver):
+# --- 3. 图谱模型: 记录 -> 节点/关系 拆解 (逐条写入与批量写入共用) ---
+KEY_TO_GRAPH_MAP = {
+    "object": {"label": "发明对象", "rel": "研究对象是"},
+    "problem": {"label": "待解决问题", "rel": "旨在解决"},
+    "innovation": {"label": "创新点", "rel": "核心创新是"},
+    "principle": {"label": "原理知识", "rel": "基于原理"},
+    "benefit": {"label": "效益", "rel": "实现效益"},
+    "sub_functions": {"label": "子功能", "rel": "包含功能"},
+    "application": {"label": "应用领域", "rel": "应用于"},
+    "components": {"label": "组件", "rel": "包含组件"},
+    "component_relations": {"label": "组件关系", "rel": "组件间关系"},
+    "technical_implementation": {"label": "技术实现", "rel": "实现方式是"}
+}
+
+
+def _structured_graph_items(patent_record: dict) -> tuple[list, list]:
     """
-    构建知识图谱的结构化部分，将“申请日”创建为一个独立的节点。
+    将一条结构化专利记录拆解为节点 (label, key, properties) 和关系
+    (source_label, source_key, target_label, target_key, rel_type) 两个列表。
+    key 为该标签唯一键 (见 NODE_KEYS) 的取值: Patent 为申请号，其余为 name。
     """
+    app_number = str(patent_record.get("申请号") or "").strip()
+    if not app_number: return [], []
     patent_name = patent_record.get("发明名称")
-    if not patent_name: return
 
     application_date = patent_record.get("申请日")
-    app_number = patent_record.get("申请号")
     applicant = patent_record.get("申请（专利权）人")
     inventors_str = patent_record.get("发明人", "")
     agents_str = patent_record.get("代理人", "")
@@ -62,119 +97,492 @@ def build_structured_kg(patent_record: dict, driver: GraphDatabase.driver):
     inventors = [inv.strip() for inv in re.split(r'[;\s]+', inventors_str) if inv.strip()]
     agents = [agent.strip() for agent in agents_str.split() if agent.strip()]
     ipc_codes = [ipc.strip() for ipc in re.split(r'[;\s]+', ipc_str) if ipc.strip()]
+    date_str = str(application_date).strip() if application_date else None
+
+    # 步骤 1: 所有实体节点
+    nodes = [("Patent", app_number, {"name": patent_name} if patent_name else {})]
+    if date_str: nodes.append(("ApplicationDate", date_str, {}))
+    nodes.append(("ApplicationNumber", app_number, {}))
+    if applicant: nodes.append(("Company", applicant, {}))
+    if agency: nodes.append(("Agency", agency, {}))
+    if doc_type: nodes.append(("DocType", doc_type, {}))
+    if location: nodes.append(("Location", location, {}))
+    nodes.extend(("Person", inventor, {}) for inventor in inventors)
+    nodes.extend(("Person", agent, {}) for agent in agents)
+    nodes.extend(("IPCNumber", ipc, {}) for ipc in ipc_codes)
+
+    # 步骤 2: 所有关系
+    rels = []
+    if date_str: rels.append(("Patent", app_number, "ApplicationDate", date_str, "发明于"))
+    rels.append(("Patent", app_number, "ApplicationNumber", app_number, "申请号是"))
+    if applicant: rels.append(("Company", applicant, "Patent", app_number, "申请"))
+    if agency: rels.append(("Agency", agency, "Patent", app_number, "代理申请"))
+    if doc_type: rels.append(("Patent", app_number, "DocType", doc_type, "文献类型为"))
+    rels.extend(("Person", inventor, "Patent", app_number, "发明") for inventor in inventors)
+    rels.extend(("Person", agent, "Patent", app_number, "经办") for agent in agents)
+    rels.extend(("Patent", app_number, "IPCNumber", ipc, "IPC分类为") for ipc in ipc_codes)
+    if applicant:
+        if location: rels.append(("Company", applicant, "Location", location, "位于"))
+        if agency: rels.append(("Company", applicant, "Agency", agency, "委托"))
+        rels.extend(("Company", applicant, "Person", inventor, "雇佣或受让") for inventor in inventors)
+    if agency:
+        rels.extend(("Agency", agency, "Person", agent, "指派") for agent in agents)
+    return nodes, rels
+
+
+def aspect_items(llm_record: dict) -> Iterator[tuple[str, str, str]]:
+    """逐个产出一条 LLM 分析报告中的 (标签, 关系类型, 方面短语)；子功能、组件按 ';' 拆分为多项。"""
+    for key, value in (llm_record.get("extracted_knowledge") or {}).items():
+        if key not in KEY_TO_GRAPH_MAP: continue
+        graph_model = KEY_TO_GRAPH_MAP[key]
+        items = [item.strip() for item in value.split(';') if item.strip()] if key in ["sub_functions",
+                                                                                       "components"] else [value]
+        for item_name in items:
+            yield graph_model["label"], graph_model["rel"], item_name
+
+
+def _aspect_graph_items(llm_record: dict, aliases=None) -> tuple[list, list]:
+    """
+    将一条 LLM 抽取的分析报告拆解为方面节点及其与 Patent 的关系 (按申请号关联到专利)。
+    给出 aliases (aspect_canonical.AspectAliases) 时，近义的方面短语合并为规范节点，规范节点带 aliases 属性 (全部别名)。
+    """
+    app_number = str(llm_record.get("申请号") or "").strip()
+    if not app_number or not llm_record.get("extracted_knowledge"): return [], []
+
+    nodes, rels = [], []
+    for label, rel_type, item_name in aspect_items(llm_record):
+        properties = {}
+        if aliases:
+            item_name = aliases.canonical(label, item_name)
+            if aliases.aliases(label, item_name): properties = {"aliases": aliases.aliases(label, item_name)}
+        nodes.append((label, item_name, properties))
+        rels.append(("Patent", app_number, label, item_name, rel_type))
+    return nodes, rels
+
+
+def attach_application_numbers(llm_records: list, structured_records: list) -> tuple[int, list]:
+    """
+    为缺少 申请号 的旧版摘要知识记录补全申请号: 仅当其发明名称在结构化数据中唯一时才能确定归属。
+    返回 (补全条数, 因同名无法确定归属而跳过的发明名称列表)。
+    """
+    numbers_by_title = defaultdict(set)
+    for record in structured_records:
+        if record.get("申请号") and record.get("发明名称"):
+            numbers_by_title[record["发明名称"]].add(str(record["申请号"]).strip())
+    attached, ambiguous = 0, []
+    for record in llm_records:
+        if record.get("申请号"): continue
+        candidates = numbers_by_title.get(record.get("发明名称"), set())
+        if len(candidates) == 1:
+            record["申请号"] = next(iter(candidates))
+            attached += 1
+        else:
+            ambiguous.append(record.get("发明名称"))
+    return attached, ambiguous
+
+
+def iter_aspect_batches(unstructured_path: str, structured_path: str, batch_size: int) -> Iterable[list]:
+    """
+    按批读取摘要知识。列式数据集直接流式读取 (其中每条都带申请号)；
+    旧版 JSON 需整体读入，按 attach_application_numbers 补全申请号后再分批。
+    """
+    if unstructured_path.endswith(".parquet"):
+        yield from iter_records(unstructured_path, batch_size=batch_size)
+        return
+    records = [record for batch in iter_records(unstructured_path) for record in batch]
+    structured = [record for batch in iter_records(structured_path, ["申请号", "发明名称"]) for record in batch]
+    attached, ambiguous = attach_application_numbers(records, structured)
+    if attached: print(f"  为 {attached} 条旧版摘要知识按唯一的发明名称补全了申请号。")
+    if ambiguous: print(f"  [警告] {len(ambiguous)} 条摘要知识缺少申请号且发明名称不唯一，已跳过: {ambiguous[:5]}")
+    for i in range(0, len(records), batch_size):
+        yield records[i:i + batch_size]
+
+
+# 加载器写入的全部节点标签 (结构化骨架 + 摘要方面)
+STRUCTURED_LABELS = ["Patent", "ApplicationDate", "ApplicationNumber", "Company", "Agency", "DocType", "Location",
+                     "Person", "IPCNumber"]
+ALL_LABELS = STRUCTURED_LABELS + [graph_model["label"] for graph_model in KEY_TO_GRAPH_MAP.values()]
+
+
+# --- 4. Schema 初始化: 在加载前为每个标签的唯一键建立唯一约束 (幂等) ---
+def ensure_schema(driver: GraphDatabase.driver, labels: list = None) -> list[str]:
+    """
+    为每个标签的唯一键 (见 NODE_KEYS) 创建唯一约束 (同时会创建其背后的索引)，使 MERGE/MATCH 走索引而非标签扫描。
+    以申请号为键的标签另建 name 普通索引供按名称展示/查找，并删除旧版的 name 唯一约束 (同名专利不再合并)。
+    使用 IF NOT EXISTS 保证可重复执行，返回本次新建的约束名称列表。
+    """
+    labels = labels or ALL_LABELS
+    created = []
+    with driver.session() as session:
+        for label in labels:
+            key = node_key(label)
+            constraint_name = f"{label}_{key}_unique"
+            if key != "name":
+                session.run(f"DROP CONSTRAINT `{label}_name_unique` IF EXISTS").consume()
+                session.run(f"CREATE INDEX `{label}_name_index` IF NOT EXISTS FOR (n:`{label}`) ON (n.name)").consume()
+            query = (
+                f"CREATE CONSTRAINT `{constraint_name}` IF NOT EXISTS "
+                f"FOR (n:`{label}`) REQUIRE n.`{key}` IS UNIQUE"
+            )
+            try:
+                summary = session.run(query).consume()
+            except Exception as e:
+                print(f"  创建约束 '{constraint_name}' 时出错 (可能已存在重复的 {key}): {e}")
+                continue
+            if summary.counters.constraints_added:
+                created.append(constraint_name)
+
+        owned_indexes = {
+            record["name"]: record["ownedIndex"]
+            for record in session.run("SHOW CONSTRAINTS YIELD name, ownedIndex")
+        }
+
+        # 旧版图谱中的 Patent 以发明名称合并，没有 app_no，无法按申请号拆分，需要清空后重新加载
+        legacy_patents = session.run("MATCH (p:Patent) WHERE p.app_no IS NULL RETURN count(p) AS n").single()["n"]
+
+    for constraint_name in created:
+        print(f"  已创建约束: {constraint_name} (索引: {owned_indexes.get(constraint_name, '未知')})")
+    if legacy_patents:
+        print(f"  [警告] 图谱中有 {legacy_patents} 个旧版 Patent 节点 (按发明名称合并、缺少 app_no)，"
+              f"分析工具将忽略它们，请清空数据库后重新运行本脚本。")
+    print(f"Schema 初始化完成: 新建 {len(created)} 个约束，{len(labels) - len(created)} 个标签无需变更。")
+    return created
+
+
+# --- 5. 逐条写入模式: 构建图谱骨架 / 丰富图谱 ---
+def build_structured_kg(patent_record: dict, driver: GraphDatabase.driver):
+    """
+    构建知识图谱的结构化部分，将“申请日”创建为一个独立的节点。
+    """
+    nodes, rels = _structured_graph_items(patent_record)
+    if not nodes: return
 
     with driver.session() as session:
-        # 步骤 1: 创建所有实体节点
-        session.execute_write(_create_node, "Patent", {"name": patent_name})
-
-        # --- 核心修改点 1: 创建 ApplicationDate 节点 ---
-        if application_date:
-            date_str = str(application_date).strip()
-            session.execute_write(_create_node, "ApplicationDate", {"name": date_str})
-
-        if app_number: session.execute_write(_create_node, "ApplicationNumber", {"name": app_number})
-        if applicant: session.execute_write(_create_node, "Company", {"name": applicant})
-        # ... (其余节点创建代码保持不变) ...
-        if agency: session.execute_write(_create_node, "Agency", {"name": agency})
-        if doc_type: session.execute_write(_create_node, "DocType", {"name": doc_type})
-        if location: session.execute_write(_create_node, "Location", {"name": location})
-        for inventor in inventors: session.execute_write(_create_node, "Person", {"name": inventor})
-        for agent in agents: session.execute_write(_create_node, "Person", {"name": agent})
-        for ipc in ipc_codes: session.execute_write(_create_node, "IPCNumber", {"name": ipc})
-
-        # 步骤 2: 创建关系
-        # --- 核心修改点 2: 创建 Patent 到 ApplicationDate 的关系 ---
-        if application_date:
-            date_str = str(application_date).strip()
-            session.execute_write(_create_relationship, "Patent", patent_name, "ApplicationDate", date_str, "发明于")
-
-        # 创建其他关系 (保持不变)
-        if app_number: session.execute_write(_create_relationship, "Patent", patent_name, "ApplicationNumber",
-                                             app_number, "申请号是")
-        if applicant: session.execute_write(_create_relationship, "Company", applicant, "Patent", patent_name, "申请")
-        # ... (其余关系创建代码与最终版完全相同，为简洁省略) ...
-        if agency: session.execute_write(_create_relationship, "Agency", agency, "Patent", patent_name, "代理申请")
-        if doc_type: session.execute_write(_create_relationship, "Patent", patent_name, "DocType", doc_type,
-                                           "文献类型为")
-        for inventor in inventors: session.execute_write(_create_relationship, "Person", inventor, "Patent",
-                                                         patent_name, "发明")
-        for agent in agents: session.execute_write(_create_relationship, "Person", agent, "Patent", patent_name, "经办")
-        for ipc in ipc_codes: session.execute_write(_create_relationship, "Patent", patent_name, "IPCNumber", ipc,
-                                                    "IPC分类为")
-        if applicant:
-            if location: session.execute_write(_create_relationship, "Company", applicant, "Location", location, "位于")
-            if agency: session.execute_write(_create_relationship, "Company", applicant, "Agency", agency, "委托")
-            for inventor in inventors: session.execute_write(_create_relationship, "Company", applicant, "Person",
-                                                             inventor, "雇佣或受让")
-        if agency:
-            for agent in agents: session.execute_write(_create_relationship, "Agency", agency, "Person", agent, "指派")
-
-
-# --- 4. 核心函数 2: 丰富图谱 (保持不变) ---
-def enrich_kg_with_patent_aspects(llm_record: dict, driver: GraphDatabase.driver):
-    patent_name = llm_record.get("发明名称")
-    aspects_data = llm_record.get("extracted_knowledge")
-    if not patent_name or not aspects_data: return
-
-    key_to_graph_map = {
-        "object": {"label": "发明对象", "rel": "研究对象是"},
-        "problem": {"label": "待解决问题", "rel": "旨在解决"},
-        "innovation": {"label": "创新点", "rel": "核心创新是"},
-        "principle": {"label": "原理知识", "rel": "基于原理"},
-        "benefit": {"label": "效益", "rel": "实现效益"},
-        "sub_functions": {"label": "子功能", "rel": "包含功能"},
-        "application": {"label": "应用领域", "rel": "应用于"},
-        "components": {"label": "组件", "rel": "包含组件"},
-        "component_relations": {"label": "组件关系", "rel": "组件间关系"},
-        "technical_implementation": {"label": "技术实现", "rel": "实现方式是"}
-    }
+        for label, key, properties in nodes:
+            session.execute_write(_create_node, label, key, properties)
+        for source_label, source_key, target_label, target_key, rel_type in rels:
+            session.execute_write(_create_relationship, source_label, source_key, target_label, target_key,
+                                  rel_type)
+
+
+def enrich_kg_with_patent_aspects(llm_record: dict, driver: GraphDatabase.driver, aliases=None):
+    nodes, rels = _aspect_graph_items(llm_record, aliases)
+    if not nodes: return
 
     with driver.session() as session:
-        for key, value in aspects_data.items():
-            if key not in key_to_graph_map: continue
-            graph_model = key_to_graph_map[key]
-            label = graph_model["label"]
-            rel_type = graph_model["rel"]
-            items = [item.strip() for item in value.split(';') if item.strip()] if key in ["sub_functions",
-                                                                                           "components"] else [value]
-            for item_name in items:
-                session.execute_write(_create_node, label, {"name": item_name})
-                session.execute_write(_create_relationship, "Patent", patent_name, label, item_name, rel_type)
-
-
-# --- 5. 主函数 (保持不变) ---
+        for (label, item_name, properties), rel in zip(nodes, rels):
+            session.execute_write(_create_node, label, item_name, properties)
+            session.execute_write(_create_relationship, *rel)
+
+
+# --- 6. 批量写入模式: 按标签/关系类型分组, 以 UNWIND $rows 分批写入 ---
+def _merge_nodes_batch(tx, label, rows: list):
+    """以一个参数化 UNWIND 语句批量 MERGE 同一标签的节点，rows 为 [{"key", "properties"}]。"""
+    query = f"UNWIND $rows AS row MERGE (n:`{label}` {{`{node_key(label)}`: row.key}}) SET n += row.properties"
+    tx.run(query, rows=rows)
+
+
+def _merge_relationships_batch(tx, source_label, target_label, rel_type, rows: list):
+    """批量 MERGE 同一 (起点标签, 终点标签, 关系类型) 的关系，匹配语义与 _create_relationship 一致。"""
+    query = (
+        f"UNWIND $rows AS row "
+        f"MATCH (a:`{source_label}` {{`{node_key(source_label)}`: row.source}}) "
+        f"MATCH (b:`{target_label}` {{`{node_key(target_label)}`: row.target}}) "
+        f"MERGE (a)-[r:`{rel_type}`]->(b)"
+    )
+    tx.run(query, rows=rows)
+
+
+def group_graph_items(records: list, item_builder) -> tuple[dict, dict]:
+    """
+    对所有记录调用 item_builder 并去重分组:
+    节点按 label 分组 ({key: properties}，同一节点的属性合并), 关系按 (source_label, target_label, rel_type) 分组,
+    组内保持首次出现的顺序。
+    """
+    grouped_nodes = defaultdict(dict)
+    grouped_rels = defaultdict(dict)
+    for record in records:
+        nodes, rels = item_builder(record)
+        for label, key, properties in nodes:
+            grouped_nodes[label].setdefault(key, {}).update(properties)
+        for source_label, source_key, target_label, target_key, rel_type in rels:
+            grouped_rels[(source_label, target_label, rel_type)][(source_key, target_key)] = None
+    return grouped_nodes, grouped_rels
+
+
+def _write_with_retry(session, work, *args, max_retries: int = 5) -> int:
+    """
+    执行一个写事务；遇到死锁等瞬时错误 (TransientError) 时回滚并以指数退避 + 随机抖动重试。
+    驱动的 execute_write 自身也会在超时时间内重试，这些重试同样计入返回的重试次数。
+    """
+    attempts = 0
+
+    def counted_work(tx, *work_args):
+        nonlocal attempts
+        attempts += 1
+        return work(tx, *work_args)
+
+    for retry in range(max_retries + 1):
+        try:
+            session.execute_write(counted_work, *args)
+            return attempts - 1
+        except TransientError:
+            if retry == max_retries: raise
+            time.sleep(min(0.1 * 2 ** retry, 5.0) * random.uniform(0.5, 1.5))
+
+
+def _write_chunks(tx, write_batch, chunks: list):
+    for group_key, rows in chunks:
+        write_batch(tx, group_key, rows)
+
+
+def _write_in_batches(driver, groups: dict, write_batch, batch_size: int,
+                      max_retries: int = 5) -> tuple[int, float, int]:
+    """
+    将分组后的行按 batch_size 切片写入，返回 (写入行数, 耗时秒数, 瞬时错误重试次数)。
+    每个事务最多 batch_size 行: 行数较少的相邻分组合并到同一事务中 (每组仍是一条 UNWIND 语句)，减少事务往返次数。
+    """
+    total_rows = retries = 0
+    start_time = time.perf_counter()
+    with driver.session() as session:
+        chunks, chunk_rows = [], 0
+        for group_key, rows in groups.items():
+            rows = list(rows)
+            for i in range(0, len(rows), batch_size):
+                chunk = rows[i:i + batch_size]
+                if chunks and chunk_rows + len(chunk) > batch_size:
+                    retries += _write_with_retry(session, _write_chunks, write_batch, chunks, max_retries=max_retries)
+                    chunks, chunk_rows = [], 0
+                chunks.append((group_key, chunk))
+                chunk_rows += len(chunk)
+            total_rows += len(rows)
+        if chunks:
+            retries += _write_with_retry(session, _write_chunks, write_batch, chunks, max_retries=max_retries)
+    return total_rows, time.perf_counter() - start_time, retries
+
+
+# --- 7. 并行写入模式: 按节点哈希分区，同时运行的事务永远不会触及同一节点 ---
+def _node_bucket(label: str, key, buckets: int) -> int:
+    """节点 (label, key) 的稳定哈希桶 (不受 PYTHONHASHSEED 影响)。"""
+    return zlib.crc32(f"{label}\x00{key}".encode("utf-8")) % buckets
+
+
+def partition_nodes(grouped_nodes: dict, workers: int) -> list[dict]:
+    """节点按哈希分为 workers 个分区 ({label: [key]})，同一节点只属于一个分区，因此各分区可以同时 MERGE。"""
+    partitions = [defaultdict(list) for _ in range(workers)]
+    for label, nodes in grouped_nodes.items():
+        for key in nodes:
+            partitions[_node_bucket(label, key, workers)][label].append(key)
+    return partitions
+
+
+def schedule_relationships(grouped_rels: dict, workers: int) -> list[list[dict]]:
+    """
+    将关系安排为若干轮，每轮由若干互不相交的分区 ({rel_key: [(source_key, target_key)]}) 组成。
+    节点按哈希分到 B = 4 * workers - 1 (奇数) 个桶；两端所在桶为 (a, b) 的关系放入第 (a + b) % B 轮中无序对 {a, b}
+    对应的分区。同一轮中和相同的不同无序对没有公共桶，所以同一轮内的并发事务不会锁定同一节点——
+    包括 Company / Agency / IPCNumber / ApplicationDate 等高度数节点，也包括作为关系另一端的 Patent，从根源上避免死锁。
+    每轮有 (B + 1) / 2 = 2 * workers 个分区供 workers 个线程领取，大小不一的分区 (如 {a, a}) 不会拖慢整轮；
+    高度数节点的关系按另一端所在的桶分散到各轮，不会集中到某一个分区。
+    """
+    buckets = 4 * workers - 1
+    rounds = [defaultdict(lambda: defaultdict(list)) for _ in range(buckets)]
+    bucket_cache = {}  # 同一节点 (尤其是高度数节点) 会作为许多关系的端点，只计算一次哈希
+    for rel_key, pairs in grouped_rels.items():
+        source_label, target_label, _ = rel_key
+        for source_key, target_key in pairs:
+            a = bucket_cache.get((source_label, source_key))
+            if a is None: a = bucket_cache[source_label, source_key] = _node_bucket(source_label, source_key, buckets)
+            b = bucket_cache.get((target_label, target_key))
+            if b is None: b = bucket_cache[target_label, target_key] = _node_bucket(target_label, target_key, buckets)
+            # 同一轮中 a + b 固定，较小的桶号即可确定无序对 {a, b}
+            rounds[(a + b) % buckets][a if a <= b else b][rel_key].append((source_key, target_key))
+    return [list(partitions.values()) for partitions in rounds]
+
+
+def _write_rounds(executor: ThreadPoolExecutor, driver, rounds: list[list[dict]], write_batch, batch_size: int,
+                  max_retries: int) -> tuple[int, float, int]:
+    """
+    逐轮并发写入: 同一轮的分区由线程池领取 (行数多的先提交)，全部完成后才开始下一轮。
+    返回 (写入行数, 耗时秒数, 重试次数)。
+    """
+    total_rows = retries = 0
+    start_time = time.perf_counter()
+    for partitions in rounds:
+        partitions = sorted((partition for partition in partitions if partition),
+                            key=lambda partition: sum(len(rows) for rows in partition.values()), reverse=True)
+        futures = [executor.submit(_write_in_batches, driver, partition, write_batch, batch_size, max_retries)
+                   for partition in partitions]
+        for future in futures:
+            rows, _, partition_retries = future.result()
+            total_rows += rows
+            retries += partition_retries
+    return total_rows, time.perf_counter() - start_time, retries
+
+
+def bulk_load(record_batches: Iterable[list], item_builder, driver: GraphDatabase.driver, phase_name: str,
+              batch_size: int = 1000, workers: int = 1, max_retries: int = 5,
+              after_batch: Callable[[GraphDatabase.driver, list], int] = None) -> int:
+    """
+    批量写入模式: 按记录批次流式处理，每批先写入节点再写入关系 (MERGE 幂等，跨批次重复的节点只会创建一次)，
+    内存占用只与记录批次大小有关，最终图谱与逐条写入模式一致。
+    workers > 1 时以多个线程并行写入: 节点按 partition_nodes、关系按 schedule_relationships 分区，
+    并发事务之间没有共享节点；仍出现的瞬时错误 (如其他客户端造成的死锁) 会自动重试。
+    after_batch(driver, records) 在每批写入完成后调用 (如增量维护问题统计)，返回更新的行数。
+    打印各阶段吞吐量 (行/秒)，返回处理的记录数。
+    """
+    totals = {"节点": [0, 0.0], "关系": [0, 0.0]}
+    if after_batch: totals["索引"] = [0, 0.0]
+    retries = record_count = 0
+    executor = ThreadPoolExecutor(max_workers=workers, thread_name_prefix="graph-writer") if workers > 1 else None
+    try:
+        for records in record_batches:
+            grouped_nodes, grouped_rels = group_graph_items(records, item_builder)
+
+            def write_nodes(tx, label, keys):
+                rows = [{"key": key, "properties": grouped_nodes[label][key]} for key in keys]
+                _merge_nodes_batch(tx, label, rows)
+
+            def write_rels(tx, rel_key, pairs):
+                source_label, target_label, rel_type = rel_key
+                rows = [{"source": source, "target": target} for source, target in pairs]
+                _merge_relationships_batch(tx, source_label, target_label, rel_type, rows)
+
+            if executor:
+                phases = (("节点", [partition_nodes(grouped_nodes, workers)], write_nodes),
+                          ("关系", schedule_relationships(grouped_rels, workers), write_rels))
+                for kind, rounds, write_batch in phases:
+                    rows, seconds, phase_retries = _write_rounds(executor, driver, rounds, write_batch, batch_size,
+                                                                 max_retries)
+                    totals[kind][0] += rows
+                    totals[kind][1] += seconds
+                    retries += phase_retries
+            else:
+                for kind, groups, write_batch in (("节点", grouped_nodes, write_nodes),
+                                                  ("关系", grouped_rels, write_rels)):
+                    rows, seconds, phase_retries = _write_in_batches(driver, groups, write_batch, batch_size,
+                                                                     max_retries)
+                    totals[kind][0] += rows
+                    totals[kind][1] += seconds
+                    retries += phase_retries
+            if after_batch:
+                start_time = time.perf_counter()
+                totals["索引"][0] += after_batch(driver, records)
+                totals["索引"][1] += time.perf_counter() - start_time
+            record_count += len(records)
+    finally:
+        if executor: executor.shutdown()
+
+    for kind, (rows, seconds) in totals.items():
+        rate = rows / seconds if seconds > 0 else float("inf")
+        print(f"  [{phase_name}-{kind}] {record_count} 条记录共写入 {rows} 行，耗时 {seconds:.2f} 秒，{rate:.0f} 行/秒"
+              f" (并发 {workers})。")
+    if retries: print(f"  [{phase_name}] 瞬时错误 (死锁等) 自动重试 {retries} 次。")
+    return record_count
+
+
+# --- 8. 问题统计索引: 待解决问题的技术方案数与最常见应用领域 (节点属性，供技术空白分析直接读取) ---
+def refresh_problem_stats(driver: GraphDatabase.driver, patents: list = None, max_retries: int = 5) -> int:
+    """
+    重新计算给定专利 (申请号) 所解决问题的 tech_count / top_scene，返回更新的问题数。
+    写入摘要知识后对本批专利调用即可保持索引最新；patents 为 None 时在自动提交事务中分批全量重建。
+    """
+    if patents is None:
+        with driver.session() as session:
+            session.run(PROBLEM_STATS_REBUILD_QUERY).consume()
+            return session.run("MATCH (problem:待解决问题) RETURN count(problem) AS n").single()["n"]
+
+    patents = [app_no for app_no in dict.fromkeys(str(p or "").strip() for p in patents) if app_no]
+    if not patents: return 0
+    refreshed = []
+
+    def refresh(tx, app_nos):
+        refreshed.append(tx.run(PROBLEM_STATS_REFRESH_QUERY, patents=app_nos).single()["refreshed"])
+
+    with driver.session() as session:
+        _write_with_retry(session, refresh, patents, max_retries=max_retries)
+    return refreshed[-1] if refreshed else 0
+
+
+def count_missing_problem_stats(driver: GraphDatabase.driver) -> int:
+    """被专利引用却缺少统计的问题数 (孤立问题节点不计入，见 PROBLEM_STATS_MISSING_QUERY)。"""
+    with driver.session() as session:
+        return session.run(PROBLEM_STATS_MISSING_QUERY).single()["missing"]
+
+
+# --- 9. 主函数 ---
 def main():
+    from aspect_canonical import AspectAliases  # aspect_canonical 依赖本模块的图谱模型，在此处导入以避免循环导入
+
     print("--- 脚本 3 (最终版 - 申请日为节点): 知识图谱构建 ---")
 
+    # ==================== 配置区 ====================
+    # 是否使用 UNWIND 批量写入模式？ (True / False)
+    # 如果设为 False，将逐条记录、逐个节点/关系提交事务 (与旧版行为一致)。
+    BULK_LOAD = True
+    # 批量写入模式下，每个 UNWIND 事务包含的行数
+    BULK_BATCH_SIZE = 1000
+    # 批量写入模式下的并发写入线程数 (1 为串行)；并发事务按节点分区，互不触及同一节点
+    LOAD_WORKERS = 4
+    # 死锁等瞬时错误的最大重试次数
+    MAX_RETRIES = 5
+    # 输入数据集: 优先读取同名的 .parquet 列式数据集 (按批流式读取)，不存在时回退到旧版 JSON
+    STRUCTURED_DATA_PATH = resolve_dataset_path("structured_data_all.json")
+    UNSTRUCTURED_DATA_PATH = resolve_dataset_path("unstructured_data_all.json")
+    # 每次从数据集读入内存的记录数
+    READ_BATCH_ROWS = 10000
+    # 方面短语别名表 (由 aspect_canonical.py 生成)；存在时近义短语合并为同一个规范节点
+    ASPECT_ALIASES_PATH = "aspect_aliases.json"
+    # ===============================================
+
+    missing = [path for path in (STRUCTURED_DATA_PATH, UNSTRUCTURED_DATA_PATH) if not dataset_files(path)]
+    if missing:
+        print(f"错误：找不到所需的数据文件 {missing}。请先运行脚本1和脚本2。")
+        return
+    print(f"结构化数据: '{STRUCTURED_DATA_PATH}'，非结构化(摘要)知识: '{UNSTRUCTURED_DATA_PATH}'。")
+
     neo4j_driver = setup_driver()
     if not neo4j_driver: return
 
-    try:
-        with open('structured_data_all.json', 'r', encoding='utf-8') as f:
-            structured_data = json.load(f)
-        print(f"成功加载 {len(structured_data)} 条结构化数据。")
-        with open('unstructured_data_all.json', 'r', encoding='utf-8') as f:
-            unstructured_data = json.load(f)
-        print(f"成功加载 {len(unstructured_data)} 条非结构化(摘要)知识。")
-    except FileNotFoundError as e:
-        print(f"错误：找不到所需的数据文件 {e.filename}。请先运行脚本1和脚本2。")
-        if neo4j_driver: neo4j_driver.close()
-        return
+    structured_batches = iter_records(STRUCTURED_DATA_PATH, STRUCTURED_FIELDS, READ_BATCH_ROWS)
+    aspect_batches = iter_aspect_batches(UNSTRUCTURED_DATA_PATH, STRUCTURED_DATA_PATH, READ_BATCH_ROWS)
+    aspect_aliases = AspectAliases.load(ASPECT_ALIASES_PATH)
+    if aspect_aliases: print(f"已加载方面别名表 '{ASPECT_ALIASES_PATH}': {aspect_aliases.describe()}。")
+
+    print("\n--- [准备] 初始化图谱 Schema (唯一约束与索引) ---")
+    ensure_schema(neo4j_driver)
 
-    print("\n--- [阶段 1/2] 开始构建以“发明名称”为核心的图谱骨架 ---")
-    for patent in structured_data:
-        patent_name = patent.get("发明名称", "未知标题")
-        print(f"  正在处理: '{patent_name}'")
-        build_structured_kg(patent, neo4j_driver)
+    print("\n--- [阶段 1/2] 开始构建以“申请号”为核心的图谱骨架 ---")
+    if BULK_LOAD:
+        bulk_load(structured_batches, _structured_graph_items, neo4j_driver, "图谱骨架", BULK_BATCH_SIZE, LOAD_WORKERS,
+                  MAX_RETRIES)
+    else:
+        for patent in (patent for batch in structured_batches for patent in batch):
+            patent_name = patent.get("发明名称", "未知标题")
+            print(f"  正在处理: '{patent_name}' ({patent.get('申请号')})")
+            build_structured_kg(patent, neo4j_driver)
     print("知识图谱骨架构建完成。")
 
     print("\n--- [阶段 2/2] 开始将摘要知识汇入图谱 ---")
-    for record in unstructured_data:
-        patent_name = record.get("发明名称", "未知标题")
-        print(f"  正在丰富: '{patent_name}'")
-        enrich_kg_with_patent_aspects(record, neo4j_driver)
+    if BULK_LOAD:
+        # 每批摘要知识写入后，增量更新这些专利所解决问题的统计 (技术空白分析读取的索引)
+        bulk_load(aspect_batches, partial(_aspect_graph_items, aliases=aspect_aliases), neo4j_driver, "摘要知识",
+                  BULK_BATCH_SIZE, LOAD_WORKERS, MAX_RETRIES, after_batch=lambda driver, records: refresh_problem_stats(
+                      driver, [record.get("申请号") for record in records], MAX_RETRIES))
+    else:
+        for record in (record for batch in aspect_batches for record in batch):
+            patent_name = record.get("发明名称", "未知标题")
+            print(f"  正在丰富: '{patent_name}' ({record.get('申请号')})")
+            enrich_kg_with_patent_aspects(record, neo4j_driver, aspect_aliases)
+            refresh_problem_stats(neo4j_driver, [record.get("申请号")], MAX_RETRIES)
     print("知识图谱丰富完成。")
 
+    # 旧版图谱中未被本次加载触及的问题没有统计属性，补建一次 (之后随加载增量维护)
+    missing = count_missing_problem_stats(neo4j_driver)
+    if missing:
+        print(f"\n--- [索引] {missing} 个问题缺少统计，全量重建问题统计索引 ---")
+        refresh_problem_stats(neo4j_driver)
+
     print("\n--- 知识图谱构建任务全部完成 ---")
     neo4j_driver.close()
 
@@ -0,0 +1,233 @@
+# json_to_neo4j_import.py (离线批量导入: 将数据集转换为 neo4j-admin database import 所需的节点/关系 CSV)
+
+import argparse
+import csv
+import json
+import os
+import shlex
+import shutil
+import tempfile
+import time
+import zlib
+from collections import defaultdict
+from functools import partial
+
+from aspect_canonical import AspectAliases
+from json_to_neo4j import (_aspect_graph_items, _structured_graph_items, ensure_schema, group_graph_items,
+                           iter_aspect_batches, node_key, refresh_problem_stats, setup_driver)
+from patent_dataset import STRUCTURED_FIELDS, dataset_files, iter_records, resolve_dataset_path
+
+
+# --- 1. 第一遍: 流式读取记录，批内去重后按哈希写入溢出分区 ---
+class SpillPartitions:
+    """
+    将节点/关系行按哈希追加到 partitions 个临时 JSON Lines 文件。同一节点 (label, key) 或同一关系总是落在同一分区，
+    因此第二遍逐个分区在内存中去重即可得到全局去重的结果，内存占用约为总行数 / partitions。
+    """
+
+    def __init__(self, directory: str, partitions: int):
+        self.paths = [os.path.join(directory, f"part-{i:04d}.jsonl") for i in range(partitions)]
+        self._files = [open(path, 'w', encoding='utf-8') for path in self.paths]
+        self.node_properties = defaultdict(dict)  # label -> {属性名: 是否为列表}，按首次出现顺序作为 CSV 列
+        self.rows = 0
+
+    def _write(self, bucket_text: str, entry: list):
+        partition = zlib.crc32(bucket_text.encode("utf-8")) % len(self._files)
+        self._files[partition].write(json.dumps(entry, ensure_ascii=False) + "\n")
+        self.rows += 1
+
+    def add(self, grouped_nodes: dict, grouped_rels: dict):
+        for label, nodes in grouped_nodes.items():
+            for key, properties in nodes.items():
+                for name, value in properties.items():
+                    self.node_properties[label][name] = self.node_properties[label].get(name) or isinstance(value, list)
+                self._write(f"{label}\x00{key}", ["n", label, key, properties])
+        for (source_label, target_label, rel_type), pairs in grouped_rels.items():
+            for source_key, target_key in pairs:
+                self._write(f"{rel_type}\x00{source_key}\x00{target_key}",
+                            ["r", source_label, target_label, rel_type, source_key, target_key])
+
+    def close(self):
+        for f in self._files:
+            f.close()
+
+
+# --- 2. 第二遍: 逐个分区去重，追加写入 neo4j-admin 格式的 CSV ---
+ARRAY_DELIMITER = "\x1f"  # 列表属性 (如方面节点的 aliases) 的元素分隔符，不会出现在文本中
+
+
+class ImportCsvWriter:
+    """
+    每个标签一个节点文件 (表头如 app_no:ID(Patent),name)，每个 (起点标签, 关系类型, 终点标签) 一个关系文件
+    (表头 :START_ID(Company),:END_ID(Patent))。每个标签使用独立的 ID 空间，与 Cypher 加载器中各标签的唯一键一致。
+    列表属性写为 string[] 列，元素以 ARRAY_DELIMITER 分隔。
+    """
+
+    def __init__(self, output_dir: str, node_properties: dict):
+        self.output_dir = output_dir
+        self.node_properties = {label: list(names) for label, names in node_properties.items()}
+        self.array_properties = {label: {name for name, is_array in names.items() if is_array}
+                                 for label, names in node_properties.items()}
+        self.node_files = {}  # label -> 相对路径
+        self.rel_files = {}  # (source_label, target_label, rel_type) -> 相对路径
+        self.counts = defaultdict(int)
+        self._writers = {}
+        self._files = []
+        os.makedirs(os.path.join(output_dir, "nodes"), exist_ok=True)
+        os.makedirs(os.path.join(output_dir, "relationships"), exist_ok=True)
+
+    def _writer(self, group, relative_path: str, header: list):
+        if group not in self._writers:
+            f = open(os.path.join(self.output_dir, relative_path), 'w', encoding='utf-8', newline='')
+            self._files.append(f)
+            self._writers[group] = csv.writer(f)
+            self._writers[group].writerow(header)
+        return self._writers[group]
+
+    def write_node(self, label: str, key: str, properties: dict):
+        names, arrays = self.node_properties.get(label, []), self.array_properties.get(label, set())
+        self.node_files[label] = os.path.join("nodes", f"{label}.csv")
+        header = [f"{node_key(label)}:ID({label})"] + [f"{name}:string[]" if name in arrays else name for name in names]
+        writer = self._writer(label, self.node_files[label], header)
+        values = (properties.get(name, "") for name in names)
+        writer.writerow([key] + [ARRAY_DELIMITER.join(value) if isinstance(value, list) else value for value in values])
+        self.counts[label] += 1
+
+    def write_relationship(self, source_label: str, target_label: str, rel_type: str, source_key: str,
+                           target_key: str):
+        group = (source_label, target_label, rel_type)
+        self.rel_files[group] = os.path.join("relationships", f"{source_label}-{rel_type}-{target_label}.csv")
+        writer = self._writer(group, self.rel_files[group], [f":START_ID({source_label})", f":END_ID({target_label})"])
+        writer.writerow([source_key, target_key])
+        self.counts[rel_type] += 1
+
+    def close(self):
+        for f in self._files:
+            f.close()
+
+
+def dedupe_partition(path: str, writer: ImportCsvWriter) -> int:
+    """读入一个分区，节点按 (label, key) 合并属性 (与 group_graph_items 相同，后出现的覆盖先出现的)，关系按五元组去重。"""
+    nodes, rels = {}, {}
+    with open(path, 'r', encoding='utf-8') as f:
+        for line in f:
+            entry = json.loads(line)
+            if entry[0] == "n":
+                _, label, key, properties = entry
+                nodes.setdefault((label, key), {}).update(properties)
+            else:
+                rels[tuple(entry[1:])] = None
+    for (label, key), properties in nodes.items():
+        writer.write_node(label, key, properties)
+    for rel in rels:
+        writer.write_relationship(*rel)
+    return len(nodes) + len(rels)
+
+
+def import_command(writer: ImportCsvWriter, database: str) -> str:
+    """生成 neo4j-admin database import full 命令 (在输出目录中执行)。"""
+    args = ["neo4j-admin", "database", "import", "full", "--multiline-fields=true",
+            # 缺失的属性写为空字段，导入时忽略，与 Cypher 加载器不设置该属性一致
+            "--ignore-empty-strings=true",
+            # 与 Cypher 加载器的 MATCH 语义一致: 端点不存在的关系 (如摘要知识对应的专利不在结构化数据中) 直接跳过
+            "--skip-bad-relationships=true", f"--array-delimiter=U+{ord(ARRAY_DELIMITER):04X}"]
+    args += [f"--nodes={label}={path}" for label, path in sorted(writer.node_files.items())]
+    args += [f"--relationships={group[2]}={path}" for group, path in sorted(writer.rel_files.items())]
+    args.append(database)
+    return " ".join(shlex.quote(arg) for arg in args)
+
+
+def export_import_files(structured_path: str, unstructured_path: str, output_dir: str, partitions: int = 64,
+                        read_batch_rows: int = 10000, database: str = "neo4j", aliases=None) -> ImportCsvWriter:
+    """
+    两遍流式转换: 第一遍读取数据集并按哈希溢出到临时分区，第二遍逐个分区去重写出 CSV 与 import.sh。
+    aliases (aspect_canonical.AspectAliases) 与 json_to_neo4j.py 中的别名表作用相同。
+    """
+    spill_dir = tempfile.mkdtemp(prefix="neo4j-import-", dir=output_dir)
+    try:
+        start_time = time.perf_counter()
+        spill = SpillPartitions(spill_dir, partitions)
+        record_count = 0
+        try:
+            phases = ((iter_records(structured_path, STRUCTURED_FIELDS, read_batch_rows), _structured_graph_items),
+                      (iter_aspect_batches(unstructured_path, structured_path, read_batch_rows),
+                       partial(_aspect_graph_items, aliases=aliases)))
+            for record_batches, item_builder in phases:
+                for records in record_batches:
+                    spill.add(*group_graph_items(records, item_builder))
+                    record_count += len(records)
+        finally:
+            spill.close()
+        print(f"  [第一遍] {record_count} 条记录拆解为 {spill.rows} 行 (批内去重后)，"
+              f"写入 {partitions} 个临时分区，耗时 {time.perf_counter() - start_time:.1f} 秒。")
+
+        start_time = time.perf_counter()
+        writer = ImportCsvWriter(output_dir, spill.node_properties)
+        try:
+            written = sum(dedupe_partition(path, writer) for path in spill.paths)
+        finally:
+            writer.close()
+        print(f"  [第二遍] 全局去重后写出 {written} 行，耗时 {time.perf_counter() - start_time:.1f} 秒。")
+    finally:
+        shutil.rmtree(spill_dir, ignore_errors=True)
+
+    script_path = os.path.join(output_dir, "import.sh")
+    with open(script_path, 'w', encoding='utf-8') as f:
+        f.write("#!/bin/sh\n# 需先停止 Neo4j 服务；目标数据库须为空 (或追加 --overwrite-destination=true)\n")
+        f.write('cd "$(dirname "$0")" || exit 1\n')
+        f.write(import_command(writer, database) + "\n")
+    os.chmod(script_path, 0o755)
+    return writer
+
+
+# --- 3. 主函数 ---
+def main():
+    parser = argparse.ArgumentParser(description="将结构化 / 非结构化数据集转换为 neo4j-admin database import 的 CSV 文件。")
+    parser.add_argument("--structured", default="structured_data_all.json",
+                        help="结构化数据集 (同名 .parquet 存在时优先使用)")
+    parser.add_argument("--unstructured", default="unstructured_data_all.json",
+                        help="摘要知识数据集 (同名 .parquet 存在时优先使用)")
+    parser.add_argument("--output-dir", default="neo4j_import", help="CSV 与 import.sh 的输出目录")
+    parser.add_argument("--partitions", type=int, default=64, help="临时分区数；去重时内存占用约为总行数 / 分区数")
+    parser.add_argument("--read-batch", type=int, default=10000, help="每次从数据集读入内存的记录数")
+    parser.add_argument("--database", default="neo4j", help="导入的目标数据库名")
+    parser.add_argument("--aliases", default="aspect_aliases.json",
+                        help="方面短语别名表 (aspect_canonical.py 生成)，存在时近义短语合并为规范节点")
+    parser.add_argument("--create-schema", action="store_true",
+                        help="不导出，而是连接已启动的 Neo4j，为导入后的图谱创建唯一约束与索引，并构建问题统计索引")
+    args = parser.parse_args()
+
+    if args.create_schema:
+        driver = setup_driver()
+        if not driver: return
+        ensure_schema(driver)
+        start_time = time.perf_counter()
+        problems = refresh_problem_stats(driver)
+        print(f"问题统计索引构建完成: {problems} 个问题，耗时 {time.perf_counter() - start_time:.1f} 秒。")
+        driver.close()
+        return
+
+    print("--- 离线批量导入: 生成 neo4j-admin CSV ---")
+    structured_path = resolve_dataset_path(args.structured)
+    unstructured_path = resolve_dataset_path(args.unstructured)
+    missing = [path for path in (structured_path, unstructured_path) if not dataset_files(path)]
+    if missing:
+        print(f"错误：找不到所需的数据文件 {missing}。请先运行脚本1和脚本2。")
+        return
+    print(f"结构化数据: '{structured_path}'，非结构化(摘要)知识: '{unstructured_path}'。")
+
+    aliases = AspectAliases.load(args.aliases)
+    if aliases: print(f"已加载方面别名表 '{args.aliases}': {aliases.describe()}。")
+
+    os.makedirs(args.output_dir, exist_ok=True)
+    writer = export_import_files(structured_path, unstructured_path, args.output_dir, args.partitions,
+                                 args.read_batch, args.database, aliases)
+    for name, count in sorted(writer.counts.items(), key=lambda item: -item[1]):
+        print(f"    {name}: {count}")
+    print(f"\n已在 '{args.output_dir}' 中生成 {len(writer.node_files)} 个节点文件、{len(writer.rel_files)} 个关系文件。")
+    print(f"停止 Neo4j 后运行 '{os.path.join(args.output_dir, 'import.sh')}' 导入；"
+          f"启动服务后运行 'python json_to_neo4j_import.py --create-schema' 创建唯一约束、索引与问题统计。")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,445 @@
+# lexical_index.py (专利检索的本地 BM25 倒排索引: 中文二元组 + IPC 分类号 + 申请人精确匹配)
+
+import argparse
+import contextlib
+import json
+import math
+import os
+import re
+import shutil
+import time
+import unicodedata
+from collections import Counter
+from typing import Iterable, Iterator, Optional
+
+import numpy as np
+import pyarrow as pa
+
+# --- 1. 分词 ---
+# IPC 分类号: 部/大类/小类 (H01R)、大组 (H01R13)、完整分类号 (H01R13/639)
+IPC_RE = re.compile(r"(?<![A-Za-z0-9])([A-H]\d{2}[A-Z])(?:\s*(\d{1,4})(?:\s*/\s*(\d{1,6}))?)?(?![A-Za-z0-9])", re.IGNORECASE)
+CJK_RE = re.compile(r"[\u3400-\u9fff]+")
+WORD_RE = re.compile(r"[a-z0-9]+")
+MAX_TERM_LEN = 48  # 词项以定长 unicode 数组存储，超长词项截断
+
+
+def _normalize(text: str) -> str:
+    return unicodedata.normalize("NFKC", text or "")
+
+
+def ipc_tokens(subclass: str, group: str = None, subgroup: str = None, expand: bool = False) -> list[str]:
+    """IPC 分类号词项。文档侧 expand=True 时同时产生各级前缀，查询侧只产生用户给出的那一级。"""
+    levels = [subclass.upper()]
+    if group: levels.append(f"{levels[0]}{int(group)}")
+    if group and subgroup: levels.append(f"{levels[1]}/{subgroup}")
+    return [f"ipc:{level.lower()}" for level in (levels if expand else levels[-1:])]
+
+
+def tokenize(text: str, expand_ipc: bool = False) -> list[str]:
+    """IPC 分类号整体成词；中文按相邻二字切分 (单字串保留单字)；字母数字串按词切分并小写。"""
+    tokens = []
+
+    def take_ipc(match):
+        tokens.extend(ipc_tokens(*match.groups(), expand=expand_ipc))
+        return " "
+
+    rest = IPC_RE.sub(take_ipc, _normalize(text))
+    for run in CJK_RE.findall(rest):
+        tokens.extend([run] if len(run) == 1 else [run[i:i + 2] for i in range(len(run) - 1)])
+    tokens.extend(WORD_RE.findall(CJK_RE.sub(" ", rest).lower()))
+    return [token[:MAX_TERM_LEN] for token in tokens]
+
+
+def applicant_token(name: str) -> str:
+    return f"org:{''.join(_normalize(name).split()).lower()}"[:MAX_TERM_LEN]
+
+
+def patent_tokens(text: str, ipc_codes: Iterable[str] = (), applicants: Iterable[str] = ()) -> list[str]:
+    """专利文档的词项: 序列化描述文本 + 各级 IPC 前缀 + 申请人精确匹配词项 (申请人名称本身也参与二元组切分)。"""
+    tokens = tokenize(" ".join([text, *ipc_codes]), expand_ipc=True)
+    tokens.extend(applicant_token(name) for name in applicants if name)
+    return tokens
+
+
+def reciprocal_rank_fusion(rankings: list[list[str]], k: int = 60) -> list[tuple[str, float]]:
+    """倒数排名融合: score(d) = Σ 1 / (k + rank_i(d))，rank 从 1 开始。"""
+    scores = {}
+    for ranking in rankings:
+        for rank, key in enumerate(ranking, start=1):
+            scores[key] = scores.get(key, 0.0) + 1.0 / (k + rank)
+    return sorted(scores.items(), key=lambda kv: kv[1], reverse=True)
+
+
+_WHERE_OPERATORS = {
+    "$eq": lambda value, operand: value == operand,
+    "$ne": lambda value, operand: value != operand,
+    "$gt": lambda value, operand: value is not None and value > operand,
+    "$gte": lambda value, operand: value is not None and value >= operand,
+    "$lt": lambda value, operand: value is not None and value < operand,
+    "$lte": lambda value, operand: value is not None and value <= operand,
+    "$in": lambda value, operand: value in operand,
+    "$nin": lambda value, operand: value not in operand,
+}
+
+
+def matches_where(metadata: dict, where: Optional[dict]) -> bool:
+    """在 Python 中按 Chroma 的 where 语法 ($and/$or 与比较运算符) 判断元数据是否匹配，用于过滤词法结果。"""
+    if not where: return True
+    for key, condition in where.items():
+        if key == "$and":
+            if not all(matches_where(metadata, sub) for sub in condition): return False
+        elif key == "$or":
+            if not any(matches_where(metadata, sub) for sub in condition): return False
+        elif isinstance(condition, dict):
+            value = metadata.get(key)
+            if not all(_WHERE_OPERATORS[op](value, operand) for op, operand in condition.items()): return False
+        elif metadata.get(key) != condition:
+            return False
+    return True
+
+
+# --- 2. 不可变索引段 (CSR 倒排表 + 文档键 + 载荷列，全部以 mmap 方式加载) ---
+def _payload_table(payloads: list[dict]) -> pa.Table:
+    """载荷字典 -> 每个字段一列的 Arrow 表 (各文档的字段不尽相同，如 ipc_* 标记；缺少的字段为 null)。"""
+    columns = dict.fromkeys(column for payload in payloads for column in payload)
+    return pa.table({column: [payload.get(column) for payload in payloads] for column in columns})
+
+
+class _Segment:
+    """
+    keys.npy          段内文档键 (申请号，定长 unicode，升序)，以二分查找定位文档
+    terms.npy         升序排列的词项 (定长 unicode)，以二分查找定位
+    offsets.npy       词项 i 的倒排表为 docs[offsets[i]:offsets[i + 1]]
+    docs.npy / tf.npy 倒排表中的段内文档序号与词频
+    lengths.npy       每个文档的词项数
+    payloads.arrow    文档载荷 (专利名、申请人、类型化元数据、lexical_hash)，Arrow IPC 文件，每个字段一列
+    live_<版本>.npy    有效文档掩码 (文档在之后的段中被更新或被删除时失效)；段本身不可变，每次保存写出新版本的掩码
+    """
+
+    def __init__(self, path: str, version: str = None):
+        self.path = path
+        self.name = os.path.basename(path)
+        self.keys = np.load(os.path.join(path, "keys.npy"), mmap_mode="r")
+        self.terms = np.load(os.path.join(path, "terms.npy"), mmap_mode="r")
+        self.offsets = np.load(os.path.join(path, "offsets.npy"), mmap_mode="r")
+        self.docs = np.load(os.path.join(path, "docs.npy"), mmap_mode="r")
+        self.tf = np.load(os.path.join(path, "tf.npy"), mmap_mode="r")
+        self.lengths = np.load(os.path.join(path, "lengths.npy"), mmap_mode="r")
+        # 映射文件须在表的生命周期内保持打开 (列数据直接引用映射的内存)
+        self.payloads = pa.ipc.open_file(pa.memory_map(os.path.join(path, "payloads.arrow"))).read_all()
+        # 新写出的段尚未保存过掩码，全部文档有效
+        self.live = np.load(self.live_path(version), mmap_mode="r") if version is not None \
+            else np.ones(len(self.keys), dtype=bool)
+
+    def live_path(self, version: str) -> str:
+        return os.path.join(self.path, f"live_{version}.npy")
+
+    def postings(self, term: str) -> tuple[np.ndarray, np.ndarray]:
+        i = int(np.searchsorted(self.terms, term))
+        if i >= len(self.terms) or self.terms[i] != term:
+            return np.empty(0, dtype=np.int32), np.empty(0, dtype=np.float32)
+        start, end = int(self.offsets[i]), int(self.offsets[i + 1])
+        return np.asarray(self.docs[start:end]), np.asarray(self.tf[start:end])
+
+    def find(self, keys: np.ndarray) -> tuple[np.ndarray, np.ndarray]:
+        """在段内二分查找一组文档键，返回 (命中的查询下标, 对应的段内文档序号)。"""
+        if not len(self.keys) or not len(keys): return np.empty(0, dtype=np.int64), np.empty(0, dtype=np.int64)
+        rows = np.searchsorted(self.keys, keys).clip(max=len(self.keys) - 1)
+        found = np.nonzero(self.keys[rows] == keys)[0]
+        return found, rows[found]
+
+    def discard(self, keys: np.ndarray):
+        """将段内属于 keys 的文档标记为失效 (只修改内存中的掩码副本，保存时写出新版本)。"""
+        _, rows = self.find(keys)
+        if rows.size:
+            live = np.array(self.live)
+            live[rows] = False
+            self.live = live
+
+    def payload_rows(self, rows: np.ndarray) -> list[dict]:
+        """按段内文档序号读取载荷 (省略 null 字段，即该文档原本没有的字段)。"""
+        return [{column: value for column, value in row.items() if value is not None}
+                for row in self.payloads.take(pa.array(rows, type=pa.int64())).to_pylist()]
+
+    @staticmethod
+    def write(path: str, keys: np.ndarray, lengths: np.ndarray, terms: np.ndarray, term_ids: np.ndarray,
+              posting_docs: np.ndarray, posting_tf: np.ndarray, payloads: pa.Table):
+        """
+        由 (词项编号, 文档序号, 词频) 三元组数组与载荷表写出一个新段；terms 为升序且无重复的词项表，
+        term_ids 为每条倒排记录在其中的下标。文档按键排序后重新编号。
+        """
+        os.makedirs(path)
+        keys = np.asarray(keys, dtype=str)
+        key_order = np.argsort(keys, kind="stable")
+        doc_rank = np.empty(len(keys), dtype=np.int64)
+        doc_rank[key_order] = np.arange(len(keys))
+        posting_docs = doc_rank[posting_docs]
+        used_terms, term_ids = np.unique(term_ids, return_inverse=True)  # 去掉合并后已没有倒排记录的词项
+        terms = np.asarray(terms)[used_terms]
+        order = np.lexsort((posting_docs, term_ids))
+        offsets = np.zeros(len(terms) + 1, dtype=np.int64)
+        np.cumsum(np.bincount(term_ids, minlength=len(terms)), out=offsets[1:])
+        np.save(os.path.join(path, "keys.npy"), keys[key_order])
+        np.save(os.path.join(path, "terms.npy"), terms.astype(f"<U{MAX_TERM_LEN}"))
+        np.save(os.path.join(path, "offsets.npy"), offsets)
+        np.save(os.path.join(path, "docs.npy"), posting_docs[order].astype(np.int32))
+        np.save(os.path.join(path, "tf.npy"), posting_tf[order].astype(np.float32))
+        np.save(os.path.join(path, "lengths.npy"), np.asarray(lengths, dtype=np.int32)[key_order])
+        payloads = payloads.take(pa.array(key_order, type=pa.int64()))
+        with pa.OSFile(os.path.join(path, "payloads.arrow"), "wb") as sink, \
+                pa.ipc.new_file(sink, payloads.schema) as writer:
+            writer.write_table(payloads)
+
+    def live_postings(self) -> tuple[np.ndarray, np.ndarray, np.ndarray]:
+        """展开为 (段内词项编号, 文档序号, 词频) 三元组，只保留仍然有效的文档 (用于合并段)。"""
+        term_ids = np.repeat(np.arange(len(self.terms), dtype=np.int32), np.diff(self.offsets))
+        docs = np.asarray(self.docs)
+        keep = np.asarray(self.live)[docs]
+        return term_ids[keep], docs[keep], np.asarray(self.tf)[keep]
+
+
+# --- 3. 多段索引: 增量写入新段，删除/更新通过各段的 live 掩码标记，段数过多时合并 ---
+class LexicalIndex:
+    """
+    目录结构: manifest.json (版本号与段目录列表) + 若干不可变段目录 (seg_000001/ ...)。
+    文档键、载荷与有效掩码都存放在段内并以 mmap 方式加载，打开索引的耗时与文档数无关 (不做逐文档的 Python 循环)；
+    文档更新时写入新段并把旧段中的同键文档标记为失效。
+    """
+    K1, B = 1.5, 0.75
+    MAX_SEGMENTS = 8
+    MAX_DEAD_RATIO = 0.3
+
+    def __init__(self, directory: str):
+        self.directory = directory
+        self._manifest_mtime = None
+        self._pending_removal: list[str] = []
+        self._load()
+
+    @classmethod
+    def open(cls, directory: str) -> "LexicalIndex":
+        """打开索引；目录不存在时得到一个空索引 (首次 save 时创建目录)。"""
+        return cls(directory)
+
+    # --- 加载与刷新 ---
+    @property
+    def manifest_path(self) -> str:
+        return os.path.join(self.directory, "manifest.json")
+
+    def _load(self):
+        manifest = {"version": "", "next_segment": 1, "segments": []}
+        if os.path.exists(self.manifest_path):
+            self._manifest_mtime = os.stat(self.manifest_path).st_mtime_ns
+            with open(self.manifest_path, encoding="utf-8") as f:
+                manifest = json.load(f)
+            if "live" in manifest:
+                raise ValueError(f"词法索引 '{self.directory}' 是旧版格式，请删除该目录后重新运行 vectorize_full_kg.py 构建。")
+        self.version = manifest["version"]
+        self.next_segment = manifest["next_segment"]
+        self.segments = [_Segment(os.path.join(self.directory, name), self.version) for name in manifest["segments"]]
+        self._prepare_stats()
+
+    def _prepare_stats(self):
+        """BM25 所需的文档总数与平均长度 (对各段的掩码与长度数组做向量化求和)。"""
+        self.doc_count = sum(int(np.count_nonzero(segment.live)) for segment in self.segments)
+        total_length = sum(int(np.asarray(segment.lengths)[np.asarray(segment.live)].sum()) for segment in self.segments)
+        self.avg_length = total_length / self.doc_count if self.doc_count else 0.0
+
+    def is_stale(self) -> bool:
+        """manifest 是否已被其他进程 (如向量化脚本) 更新；已加载的实例本身不会变化，调用方应重新 open。"""
+        try:
+            return os.stat(self.manifest_path).st_mtime_ns != self._manifest_mtime
+        except FileNotFoundError:
+            return False
+
+    def __len__(self) -> int:
+        return self.doc_count
+
+    def keys(self) -> Iterator[str]:
+        """全部有效文档的键。"""
+        for segment in self.segments:
+            yield from np.asarray(segment.keys)[np.asarray(segment.live)].tolist()
+
+    def _locate(self, keys: list[str]) -> Iterator[tuple[_Segment, np.ndarray, np.ndarray]]:
+        """按键批量定位有效文档: 逐段产出 (段, 命中的查询下标, 段内文档序号)，每个段一次向量化二分查找。"""
+        keys = np.array(keys, dtype=str)
+        for segment in self.segments:
+            found, rows = segment.find(keys)
+            alive = np.asarray(segment.live)[rows]
+            if alive.any(): yield segment, found[alive], rows[alive]
+
+    def payload(self, key: str) -> Optional[dict]:
+        for segment, _, rows in self._locate([key]):
+            return segment.payload_rows(rows)[0]
+        return None
+
+    def payload_values(self, keys: list[str], field: str) -> list:
+        """批量读取一组文档载荷中的一个字段 (如 lexical_hash)；文档或字段不存在时为 None。"""
+        values = [None] * len(keys)
+        for segment, found, rows in self._locate(keys):
+            if field not in segment.payloads.column_names: continue
+            column = segment.payloads.column(field).take(pa.array(rows, type=pa.int64())).to_pylist()
+            for i, value in zip(found.tolist(), column):
+                values[i] = value
+        return values
+
+    def _has_live_term(self, term: str) -> bool:
+        return any(np.asarray(segment.live)[segment.postings(term)[0]].any() for segment in self.segments)
+
+    # --- 写入 ---
+    def _new_segment_path(self) -> str:
+        """下一个段目录。跳过已存在的目录 (写出段后未保存就中断的运行留下的，manifest 中没有引用)。"""
+        while True:
+            path = os.path.join(self.directory, f"seg_{self.next_segment:06d}")
+            self.next_segment += 1
+            if not os.path.exists(path): return path
+
+    def upsert(self, docs: list[tuple[str, list[str], dict]]):
+        """写入一批 (文档键, 词项列表, 载荷) 作为新段；已存在的键视为更新。需调用 save() 持久化。"""
+        # 同一批中重复的键以最后一次为准
+        docs = list({key: (key, tokens, payload) for key, tokens, payload in docs}.values())
+        if not docs: return
+        keys, lengths, posting_terms, posting_docs, posting_tf = [], [], [], [], []
+        for doc_index, (key, tokens, _) in enumerate(docs):
+            counts = Counter(tokens)
+            keys.append(key)
+            lengths.append(len(tokens))
+            posting_terms.extend(counts)
+            posting_docs.extend([doc_index] * len(counts))
+            posting_tf.extend(counts.values())
+        keys = np.array(keys)
+        for segment in self.segments:
+            segment.discard(keys)
+        terms, term_ids = np.unique(np.array(posting_terms, dtype=f"<U{MAX_TERM_LEN}"), return_inverse=True)
+        path = self._new_segment_path()
+        _Segment.write(path, keys, np.array(lengths), terms, term_ids, np.array(posting_docs, dtype=np.int64),
+                       np.array(posting_tf), _payload_table([payload for _, _, payload in docs]))
+        self.segments.append(_Segment(path))
+        self._prepare_stats()
+
+    def delete(self, keys: Iterable[str]):
+        keys = np.array(list(keys), dtype=str)
+        for segment in self.segments:
+            segment.discard(keys)
+        self._prepare_stats()
+
+    def dead_ratio(self) -> float:
+        total = sum(len(segment.keys) for segment in self.segments)
+        return 1 - self.doc_count / total if total else 0.0
+
+    def compact(self):
+        """将全部段中仍然有效的文档合并为一个新段，并删除旧段目录。倒排记录以词项编号合并 (不展开词项字符串)。"""
+        terms = np.unique(np.concatenate([np.asarray(segment.terms) for segment in self.segments])) \
+            if self.segments else np.empty(0, dtype=f"<U{MAX_TERM_LEN}")
+        keys, lengths, term_ids, docs, tfs, payloads = [], [], [], [], [], []
+        doc_total = 0
+        for segment in self.segments:
+            mask = np.asarray(segment.live)
+            remap = np.cumsum(mask) - 1 + doc_total
+            segment_term_ids, segment_docs, segment_tf = segment.live_postings()
+            term_ids.append(np.searchsorted(terms, np.asarray(segment.terms)).astype(np.int32)[segment_term_ids])
+            docs.append(remap[segment_docs])
+            tfs.append(segment_tf)
+            keys.append(np.asarray(segment.keys)[mask])
+            lengths.append(np.asarray(segment.lengths)[mask])
+            payloads.append(segment.payloads.filter(pa.array(mask)))
+            doc_total += int(mask.sum())
+        old_paths = [segment.path for segment in self.segments]
+        self.segments = []
+        if doc_total:
+            path = self._new_segment_path()
+            _Segment.write(path, np.concatenate(keys), np.concatenate(lengths), terms, np.concatenate(term_ids),
+                           np.concatenate(docs), np.concatenate(tfs), pa.concat_tables(payloads, promote_options="default"))
+            self.segments = [_Segment(path)]
+        self._pending_removal.extend(old_paths)
+        self._prepare_stats()
+
+    def maybe_compact(self) -> bool:
+        if len(self.segments) > self.MAX_SEGMENTS or self.dead_ratio() > self.MAX_DEAD_RATIO:
+            self.compact()
+            return True
+        return False
+
+    def save(self):
+        """
+        为每个段写出新版本的掩码，再原子地替换 manifest (读取方只会看到完整的新版本)，
+        然后清理合并后不再引用的旧段与更早版本的掩码 (保留上一版本，刚读到旧 manifest 的进程仍能打开)。
+        """
+        os.makedirs(self.directory, exist_ok=True)
+        previous_version, self.version = self.version, str(time.time_ns())
+        for segment in self.segments:
+            np.save(segment.live_path(self.version), np.asarray(segment.live))
+        manifest = {"version": self.version, "next_segment": self.next_segment,
+                    "segments": [segment.name for segment in self.segments]}
+        tmp_path = f"{self.manifest_path}.tmp"
+        with open(tmp_path, "w", encoding="utf-8") as f:
+            json.dump(manifest, f, ensure_ascii=False)
+        os.replace(tmp_path, self.manifest_path)
+        for path in self._pending_removal:
+            shutil.rmtree(path, ignore_errors=True)  # 其他进程已映射的文件在其关闭前仍可读取
+        self._pending_removal = []
+        keep = {f"live_{self.version}.npy", f"live_{previous_version}.npy"}
+        for segment in self.segments:
+            for name in os.listdir(segment.path):
+                if name.startswith("live_") and name not in keep:
+                    with contextlib.suppress(OSError):
+                        os.remove(os.path.join(segment.path, name))
+        self._load()
+
+    # --- 查询 ---
+    def query_tokens(self, query: str) -> list[str]:
+        """查询恰好是已知申请人时使用申请人精确词项，否则按普通分词。"""
+        token = applicant_token(query)
+        return [token] if self._has_live_term(token) else tokenize(query)
+
+    def is_structured_query(self, query: str) -> bool:
+        """IPC 分类号或申请人查询: 纯词法即可精确回答，无需调用嵌入 API。"""
+        if self._has_live_term(applicant_token(query)): return True
+        rest = IPC_RE.sub(" ", _normalize(query))
+        return bool(IPC_RE.search(_normalize(query))) and not re.sub(r"[\s,;，；、]+", "", rest)
+
+    def search(self, query: str, k: int = 15, where: dict = None) -> list[tuple[str, float]]:
+        """BM25 检索，返回按得分降序的 [(文档键, 得分)]；where 按文档载荷过滤 (先过滤再取前 k 个)。"""
+        query_terms = Counter(self.query_tokens(query))
+        if not query_terms or not self.doc_count: return []
+        postings = {term: [segment.postings(term) for segment in self.segments] for term in query_terms}
+        live_masks = [np.asarray(segment.live) for segment in self.segments]
+        results = []
+        segment_scores = [np.zeros(len(segment.keys), dtype=np.float32) for segment in self.segments]
+        for term, weight in query_terms.items():
+            df = sum(int(mask[docs].sum()) for mask, (docs, _) in zip(live_masks, postings[term]))
+            if not df: continue
+            idf = math.log(1 + (self.doc_count - df + 0.5) / (df + 0.5))
+            for segment, scores, (docs, tf) in zip(self.segments, segment_scores, postings[term]):
+                if not len(docs): continue
+                norm = self.K1 * (1 - self.B + self.B * np.asarray(segment.lengths)[docs] / self.avg_length)
+                scores[docs] += weight * idf * tf * (self.K1 + 1) / (tf + norm)
+        for segment, scores, mask in zip(self.segments, segment_scores, live_masks):
+            scores[~mask] = 0
+            hits = np.nonzero(scores)[0]
+            if where and hits.size:
+                hits = hits[[matches_where(payload, where) for payload in segment.payload_rows(hits)]]
+            top = hits[np.argsort(-scores[hits])[:k]]
+            results.extend((str(segment.keys[i]), float(scores[i])) for i in top)
+        return sorted(results, key=lambda kv: kv[1], reverse=True)[:k]
+
+
+def main():
+    parser = argparse.ArgumentParser(description="查询本地词法索引 (由 vectorize_full_kg.py 构建/增量更新)。")
+    parser.add_argument("query", help="查询文本，如 'H01R13/639'、申请人名称或技术术语")
+    parser.add_argument("--index-dir", default=os.getenv("LEXICAL_INDEX_DIR", "lexical_index"))
+    parser.add_argument("-k", type=int, default=10)
+    args = parser.parse_args()
+
+    start_time = time.perf_counter()
+    index = LexicalIndex.open(args.index_dir)
+    loaded = time.perf_counter()
+    hits = index.search(args.query, k=args.k)
+    searched = time.perf_counter()
+    print(f"索引: {len(index)} 篇文档 / {len(index.segments)} 个段，加载 {(loaded - start_time) * 1000:.1f} 毫秒，"
+          f"查询 {(searched - loaded) * 1000:.1f} 毫秒，结构化查询: {index.is_structured_query(args.query)}")
+    for key, score in hits:
+        print(f"  {score:7.3f}  {key}  {index.payload(key).get('patent_name')}")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,134 @@
+# llm_cache.py (基于 SQLite 的内容寻址 LLM 响应缓存)
+
+import hashlib
+import json
+import os
+import sqlite3
+import threading
+import time
+import warnings
+from typing import Any, Optional, Sequence
+
+from langchain_core.caches import BaseCache
+from langchain_core.load import dumps, loads
+from langchain_core.outputs import Generation
+
+
+def make_cache_key(**parts) -> str:
+    """对请求的全部决定性要素 (模型、system prompt、messages、temperature 等) 做 SHA-256，得到内容寻址键。"""
+    payload = json.dumps(parts, sort_keys=True, ensure_ascii=False, default=str)
+    return hashlib.sha256(payload.encode("utf-8")).hexdigest()
+
+
+class SQLiteCache:
+    """
+    进程内线程安全、多进程可共享 (WAL 模式) 的键值缓存。
+    - ttl_seconds: 条目存活时间，过期条目在读取时视为未命中并被删除；None 表示永不过期。
+    - max_entries: 条目数上限，超过后按最近访问时间 (LRU) 淘汰 (每 100 次写入检查一次)；None 表示不限制。
+    """
+    _EVICT_EVERY = 100
+
+    def __init__(self, path: str = "llm_cache.sqlite3", ttl_seconds: float = None, max_entries: int = None):
+        self.path = path
+        self.ttl_seconds = ttl_seconds
+        self.max_entries = max_entries
+        self.hits = 0
+        self.misses = 0
+        self._writes = 0
+        self._lock = threading.Lock()
+        self._conn = sqlite3.connect(path, check_same_thread=False, timeout=30)
+        self._conn.execute("PRAGMA journal_mode=WAL")
+        self._conn.execute(
+            "CREATE TABLE IF NOT EXISTS cache ("
+            " key TEXT PRIMARY KEY, value TEXT NOT NULL,"
+            " created_at REAL NOT NULL, last_access REAL NOT NULL)"
+        )
+        self._conn.execute("CREATE INDEX IF NOT EXISTS idx_cache_last_access ON cache (last_access)")
+        self._conn.commit()
+
+    def get(self, key: str) -> Optional[Any]:
+        now = time.time()
+        with self._lock:
+            row = self._conn.execute("SELECT value, created_at FROM cache WHERE key = ?", (key,)).fetchone()
+            if row and self.ttl_seconds is not None and now - row[1] > self.ttl_seconds:
+                self._conn.execute("DELETE FROM cache WHERE key = ?", (key,))
+                self._conn.commit()
+                row = None
+            if not row:
+                self.misses += 1
+                return None
+            self._conn.execute("UPDATE cache SET last_access = ? WHERE key = ?", (now, key))
+            self._conn.commit()
+            self.hits += 1
+        return json.loads(row[0])
+
+    def set(self, key: str, value: Any):
+        now = time.time()
+        with self._lock:
+            self._conn.execute(
+                "INSERT OR REPLACE INTO cache (key, value, created_at, last_access) VALUES (?, ?, ?, ?)",
+                (key, json.dumps(value, ensure_ascii=False), now, now)
+            )
+            self._writes += 1
+            if self.max_entries and self._writes % self._EVICT_EVERY == 0:
+                self._evict()
+            self._conn.commit()
+
+    def _evict(self):
+        """删除超出 max_entries 的最久未访问条目 (调用方需持有锁)。"""
+        count = self._conn.execute("SELECT COUNT(*) FROM cache").fetchone()[0]
+        if count > self.max_entries:
+            self._conn.execute(
+                "DELETE FROM cache WHERE key IN (SELECT key FROM cache ORDER BY last_access ASC LIMIT ?)",
+                (count - self.max_entries,)
+            )
+
+    def clear(self):
+        with self._lock:
+            self._conn.execute("DELETE FROM cache")
+            self._conn.commit()
+
+    def stats(self) -> dict:
+        with self._lock:
+            entries = self._conn.execute("SELECT COUNT(*) FROM cache").fetchone()[0]
+        total = self.hits + self.misses
+        return {"hits": self.hits, "misses": self.misses, "hit_rate": self.hits / total if total else 0.0,
+                "entries": entries}
+
+
+class LangChainSQLiteCache(BaseCache):
+    """将 SQLiteCache 适配为 LangChain 的 BaseCache，可直接传给 ChatOpenAI(cache=...)。"""
+
+    def __init__(self, store: SQLiteCache):
+        self.store = store
+
+    def lookup(self, prompt: str, llm_string: str) -> Optional[Sequence[Generation]]:
+        # llm_string 已包含模型名、temperature 以及绑定的 tools；prompt 为序列化后的完整 messages (含 system prompt)
+        cached = self.store.get(make_cache_key(llm_string=llm_string, prompt=prompt))
+        if cached is None: return None
+        with warnings.catch_warnings():
+            warnings.simplefilter("ignore")  # langchain_core.load.loads 的 beta 提示
+            return [loads(generation) for generation in cached]
+
+    def update(self, prompt: str, llm_string: str, return_val: Sequence[Generation]) -> None:
+        self.store.set(make_cache_key(llm_string=llm_string, prompt=prompt),
+                       [dumps(generation) for generation in return_val])
+
+    def clear(self, **kwargs: Any) -> None:
+        self.store.clear()
+
+
+def get_default_cache() -> Optional[SQLiteCache]:
+    """
+    根据环境变量创建默认缓存: LLM_CACHE_ENABLED (默认 true)、LLM_CACHE_PATH、
+    LLM_CACHE_TTL_SECONDS、LLM_CACHE_MAX_ENTRIES。禁用时返回 None。
+    """
+    if os.getenv("LLM_CACHE_ENABLED", "true").lower() in ("0", "false", "no"):
+        return None
+    ttl = os.getenv("LLM_CACHE_TTL_SECONDS")
+    max_entries = os.getenv("LLM_CACHE_MAX_ENTRIES")
+    return SQLiteCache(
+        path=os.getenv("LLM_CACHE_PATH", "llm_cache.sqlite3"),
+        ttl_seconds=float(ttl) if ttl else None,
+        max_entries=int(max_entries) if max_entries else None,
+    )
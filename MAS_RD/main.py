@@ -1,22 +1,29 @@
 # main.py
 
+from __future__ import annotations
+
 import operator
-from typing import TypedDict, List, Dict, Annotated
-from functools import partial
+from typing import TYPE_CHECKING, TypedDict, List, Dict, Annotated
 import os
+import time
 from dotenv import load_dotenv
 
-from langchain_core.tools import Tool
-from langchain_openai import ChatOpenAI
-from langgraph.graph import StateGraph, END, START
-from langchain.agents import AgentExecutor, create_tool_calling_agent
-from langchain_core.prompts import ChatPromptTemplate
-from langchain_core.messages import SystemMessage
-
 load_dotenv()
 
+from resources import resource
+
+# langchain_openai / langgraph / langchain.agents 导入较慢，仅在首次创建 LLM、执行器或编译工作流时导入
+if TYPE_CHECKING:
+    from langchain.agents import AgentExecutor
+    from langchain_core.tools import Tool
+    from langchain_openai import ChatOpenAI
+
 # --- 导入工具 ---
 from tools import (
+    afetch_patent_features,
+    async_neo4j_scope,
+    fetch_patent_features,
+    use_feature_snapshot,
     find_associated_technologies,
     get_technology_trend,
     find_technology_gaps,
@@ -28,14 +35,24 @@ from tools import (
 # --- 定义共享状态 ---
 class GraphState(TypedDict):
     patent_list: List[str]
+    patent_features: dict
     agent_outputs: Annotated[dict, operator.or_]
     critique: str
     final_report: str
+    node_timings: Annotated[dict, operator.or_]
 
 
 # --- LLM 和 Agent 创建逻辑 ---
-llm = ChatOpenAI(model="qwen-max", temperature=0, api_key=os.getenv("DASHSCOPE_API_KEY"),
-                 base_url="https://dashscope.aliyuncs.com/compatible-mode/v1")
+# temperature=0 时相同的 (模型, 消息, 工具) 请求结果可复用，重复分析同一专利列表时直接命中缓存
+@resource("chat_model")
+def get_chat_model() -> ChatOpenAI:
+    from langchain_openai import ChatOpenAI
+    from llm_cache import LangChainSQLiteCache, get_default_cache
+
+    llm_response_cache = get_default_cache()
+    return ChatOpenAI(model="qwen-max", temperature=0, api_key=os.getenv("DASHSCOPE_API_KEY"),
+                      base_url="https://dashscope.aliyuncs.com/compatible-mode/v1",
+                      cache=LangChainSQLiteCache(llm_response_cache) if llm_response_cache else None)
 
 GAP_AGENT_SYSTEM_PROMPT = "你是一位顶尖的风险投资分析师，你的投资哲学是寻找‘被忽视的角落’。你的任务是识别那些真正存在巨大市场痛苦，但尚未被主流技术很好满足的领域。请对所有数据保持批判性思维，你的最终目标是找到高风险、高回报的早期机会。"
 EVALUATION_AGENT_SYSTEM_PROMPT = "你是一位经验丰富的企业技术战略顾问。你的任务是精确评估一项技术的商业化阶段，并为客户提供明确的进入或观望建议。请结合专利数据，严谨地分析其生命周期，并解释你的判断依据。"
@@ -43,47 +60,96 @@ CRITIC_AGENT_SYSTEM_PROMPT = "你是一个专业的评审员（Critic）。你
 DEFAULT_SYSTEM_PROMPT = "You are a helpful assistant. Use the provided tools to answer the user's request based on the provided input."
 
 
-def create_agent_executor(tools: list[Tool], system_prompt: str = DEFAULT_SYSTEM_PROMPT) -> AgentExecutor:
+def create_agent_executor(tools: list[Tool], system_prompt: str = DEFAULT_SYSTEM_PROMPT,
+                          chat_model=None) -> AgentExecutor:
+    from langchain.agents import AgentExecutor, create_tool_calling_agent
+    from langchain_core.prompts import ChatPromptTemplate
+
     prompt = ChatPromptTemplate.from_messages([
         ("system", system_prompt),
         ("user", "Please perform your analysis based on the following structured input: {input}"),
         ("placeholder", "{agent_scratchpad}"),
     ])
-    agent = create_tool_calling_agent(llm, tools, prompt)
+    agent = create_tool_calling_agent(chat_model or get_chat_model(), tools, prompt)
     return AgentExecutor(agent=agent, tools=tools, verbose=True)
 
 
-# --- 实例化专家 Agent ---
-association_agent_executor = create_agent_executor([find_associated_technologies])
-emerging_theme_agent_executor = create_agent_executor([get_technology_trend])
-gap_agent_executor = create_agent_executor([find_technology_gaps], system_prompt=GAP_AGENT_SYSTEM_PROMPT)
-evaluation_agent_executor = create_agent_executor(
-    [assess_technology_maturity, calculate_opportunity_score],
-    system_prompt=EVALUATION_AGENT_SYSTEM_PROMPT
-)
+def create_agent_executors(chat_model=None) -> Dict[str, AgentExecutor]:
+    """为工作流中的四个专家 Agent 创建执行器。"""
+    return {
+        "Association": create_agent_executor([find_associated_technologies], chat_model=chat_model),
+        "EmergingTheme": create_agent_executor([get_technology_trend], chat_model=chat_model),
+        "TechnologyGap": create_agent_executor([find_technology_gaps], system_prompt=GAP_AGENT_SYSTEM_PROMPT,
+                                               chat_model=chat_model),
+        "Evaluation": create_agent_executor(
+            [assess_technology_maturity, calculate_opportunity_score],
+            system_prompt=EVALUATION_AGENT_SYSTEM_PROMPT,
+            chat_model=chat_model
+        ),
+    }
+
+
+# --- 实例化专家 Agent (进程级共享，首次使用时创建) ---
+@resource("agent_executors")
+def get_agent_executors() -> Dict[str, AgentExecutor]:
+    return create_agent_executors()
 
 
 # --- 定义图的节点 ---
+def feature_extraction_node(state: GraphState) -> dict:
+    """预分析节点: 一次批量查询取回三个分析师所需的全部图数据，写入状态供后续节点的工具复用。"""
+    print("\n--- Running Feature Extraction (Shared Snapshot For All Analysts) ---")
+    patent_list = state.get('patent_list', [])
+    if not patent_list:
+        return {"patent_features": {}}
+    try:
+        features = fetch_patent_features(patent_list)
+    except Exception as e:
+        print(f"  批量预取特征失败，分析师工具将回退为各自查询图数据库: {e}")
+        return {"patent_features": {}}
+    return {"patent_features": features}
+
+
+async def afeature_extraction_node(state: GraphState) -> dict:
+    print("\n--- Running Feature Extraction (Shared Snapshot For All Analysts, async) ---")
+    patent_list = state.get('patent_list', [])
+    if not patent_list:
+        return {"patent_features": {}}
+    try:
+        features = await afetch_patent_features(patent_list)
+    except Exception as e:
+        print(f"  批量预取特征失败，分析师工具将回退为各自查询图数据库: {e}")
+        return {"patent_features": {}}
+    return {"patent_features": features}
+
+
 def agent_node(state: GraphState, agent_executor: AgentExecutor, name: str) -> dict:
     print(f"\n--- Running {name} Agent (On Full Patent List) ---")
     patent_list = state.get('patent_list', [])
     if not patent_list:
         return {"agent_outputs": {name: "没有有效的专利可供分析。"}}
 
-    result = agent_executor.invoke({"input": {"patent_list": patent_list}})
+    with use_feature_snapshot(patent_list, state.get('patent_features')):
+        result = agent_executor.invoke({"input": {"patent_list": patent_list}})
 
     return {"agent_outputs": {name: result['output']}}
 
 
-association_agent_node = partial(agent_node, agent_executor=association_agent_executor, name="Association")
-emerging_theme_agent_node = partial(agent_node, agent_executor=emerging_theme_agent_executor, name="EmergingTheme")
-gap_agent_node = partial(agent_node, agent_executor=gap_agent_executor, name="TechnologyGap")
+async def aagent_node(state: GraphState, agent_executor: AgentExecutor, name: str) -> dict:
+    print(f"\n--- Running {name} Agent (On Full Patent List, async) ---")
+    patent_list = state.get('patent_list', [])
+    if not patent_list:
+        return {"agent_outputs": {name: "没有有效的专利可供分析。"}}
 
+    with use_feature_snapshot(patent_list, state.get('patent_features')):
+        result = await agent_executor.ainvoke({"input": {"patent_list": patent_list}})
 
-def critic_agent_node(state: GraphState) -> dict:
-    print("\n--- Running Critic Agent ---")
+    return {"agent_outputs": {name: result['output']}}
+
+
+def build_review_prompt(state: GraphState) -> str:
     agent_outputs = state.get('agent_outputs', {})
-    review_prompt = f"""
+    return f"""
     以下三份报告是基于一个用户确认的专利列表生成的，请你进行严格审查。
 
     报告1: [关联技术分析师]\n{agent_outputs.get("Association", "无结果")}
@@ -92,20 +158,35 @@ def critic_agent_node(state: GraphState) -> dict:
 
     请根据你的角色要求，对以上报告提出你的批判性意见。
     """
-    response = llm.invoke([SystemMessage(content=CRITIC_AGENT_SYSTEM_PROMPT), ("user", review_prompt)])
+
+
+def critic_agent_node(state: GraphState, chat_model=None) -> dict:
+    print("\n--- Running Critic Agent ---")
+    from langchain_core.messages import SystemMessage
+    review_prompt = build_review_prompt(state)
+    response = (chat_model or get_chat_model()).invoke([SystemMessage(content=CRITIC_AGENT_SYSTEM_PROMPT), ("user", review_prompt)])
+    return {"critique": response.content}
+
+
+async def acritic_agent_node(state: GraphState, chat_model=None) -> dict:
+    print("\n--- Running Critic Agent (async) ---")
+    from langchain_core.messages import SystemMessage
+    review_prompt = build_review_prompt(state)
+    response = await (chat_model or get_chat_model()).ainvoke(
+        [SystemMessage(content=CRITIC_AGENT_SYSTEM_PROMPT), ("user", review_prompt)]
+    )
     return {"critique": response.content}
 
 
 # vvvvvvvvvvvvvvvvvvvvvvvvvvvvvvvvvvvvvvvvvvvvvvvvvvvvvvvvvvvvvvvvvvvvvvvvvvvvvv
 # --- 函数已根据您的要求完全更新 ---
-def evaluation_agent_node_final(state: GraphState) -> dict:
-    print("\n--- Running Final Evaluation Agent (Decision-Support Upgrade) ---")
+def build_evaluation_prompt(state: GraphState) -> str:
     agent_outputs = state.get('agent_outputs', {})
     critique = state.get('critique', "无批判性意见。")
     patent_list = state.get('patent_list', [])
 
     # 使用您提供的全新、强调证据追溯和论证过程的指令模板
-    evaluation_prompt = f"""
+    return f"""
     你是一位顶级的技术战略分析师，你的最终交付物是一份能让CEO和CTO直接用于决策的、**高度可信且论证充分**的战略报告。
 
     --- 基础情报 ---
@@ -152,7 +233,19 @@ def evaluation_agent_node_final(state: GraphState) -> dict:
     请现在开始你的分析和报告生成。
     """
 
-    result = evaluation_agent_executor.invoke({"input": evaluation_prompt})
+
+def evaluation_agent_node_final(state: GraphState, agent_executor: AgentExecutor = None) -> dict:
+    print("\n--- Running Final Evaluation Agent (Decision-Support Upgrade) ---")
+    with use_feature_snapshot(state.get('patent_list', []), state.get('patent_features')):
+        result = (agent_executor or get_agent_executors()["Evaluation"]).invoke({"input": build_evaluation_prompt(state)})
+    return {"final_report": result['output']}
+
+
+async def aevaluation_agent_node_final(state: GraphState, agent_executor: AgentExecutor = None) -> dict:
+    print("\n--- Running Final Evaluation Agent (Decision-Support Upgrade, async) ---")
+    with use_feature_snapshot(state.get('patent_list', []), state.get('patent_features')):
+        result = await (agent_executor or get_agent_executors()["Evaluation"]).ainvoke(
+            {"input": build_evaluation_prompt(state)})
     return {"final_report": result['output']}
 
 
@@ -161,22 +254,107 @@ def evaluation_agent_node_final(state: GraphState) -> dict:
 
 
 # --- 组装 StateGraph ---
-workflow = StateGraph(GraphState)
+def build_app(chat_model=None):
+    """
+    组装并编译工作流。每个节点同时提供同步和异步实现，因此同一个 app 既支持 invoke / stream，
+    也支持 ainvoke / astream (此时三个分析师分支在同一事件循环中真正并发，工具使用异步 Neo4j 驱动)。
+    chat_model 为空时使用共享的 get_chat_model()；基准测试可传入桩模型。
+    """
+    from langchain_core.runnables import RunnableLambda
+    from langgraph.graph import StateGraph, END, START
+
+    executors = get_agent_executors() if chat_model is None else create_agent_executors(chat_model)
+
+    def node(func, afunc, node_name, **kwargs):
+        # 包装节点函数，在返回的状态更新中附带本节点耗时 (秒)，供 UI 展示
+        def timed(state: GraphState) -> dict:
+            start_time = time.perf_counter()
+            update = func(state, **kwargs)
+            return {**update, "node_timings": {node_name: time.perf_counter() - start_time}}
+
+        async def atimed(state: GraphState) -> dict:
+            start_time = time.perf_counter()
+            update = await afunc(state, **kwargs)
+            return {**update, "node_timings": {node_name: time.perf_counter() - start_time}}
+
+        return RunnableLambda(timed, afunc=atimed, name=node_name)
+
+    workflow = StateGraph(GraphState)
+    workflow.add_node("feature_extraction",
+                      node(feature_extraction_node, afeature_extraction_node, "feature_extraction"))
+    workflow.add_node("association_agent", node(agent_node, aagent_node, "association_agent",
+                                                agent_executor=executors["Association"], name="Association"))
+    workflow.add_node("emerging_theme_agent", node(agent_node, aagent_node, "emerging_theme_agent",
+                                                   agent_executor=executors["EmergingTheme"], name="EmergingTheme"))
+    workflow.add_node("gap_agent", node(agent_node, aagent_node, "gap_agent",
+                                        agent_executor=executors["TechnologyGap"], name="TechnologyGap"))
+    workflow.add_node("critic_agent", node(critic_agent_node, acritic_agent_node, "critic_agent",
+                                           chat_model=chat_model))
+    workflow.add_node("evaluation_agent", node(evaluation_agent_node_final, aevaluation_agent_node_final,
+                                               "evaluation_agent", agent_executor=executors["Evaluation"]))
+
+    # 定义工作流图
+    workflow.add_edge(START, "feature_extraction")
+    workflow.add_edge("feature_extraction", "association_agent")
+    workflow.add_edge("feature_extraction", "emerging_theme_agent")
+    workflow.add_edge("feature_extraction", "gap_agent")
+
+    workflow.add_edge(["association_agent", "emerging_theme_agent", "gap_agent"], "critic_agent")
+    workflow.add_edge("critic_agent", "evaluation_agent")
+    workflow.add_edge("evaluation_agent", END)
+
+    return workflow.compile()
+
+
+def create_initial_state(patent_list: List[str]) -> GraphState:
+    return GraphState(patent_list=patent_list, patent_features={}, agent_outputs={}, critique="", final_report="",
+                      node_timings={})
+
+
+def stream_analysis(patent_list: List[str], graph=None, stream_mode=("updates", "messages")):
+    """
+    同步流式入口。默认同时订阅两种事件，逐个产出 (mode, payload):
+    - ("updates", {节点名: 状态更新})     节点完成时产出，更新中包含 node_timings
+    - ("messages", (消息片段, 元数据))    LLM 逐 token 输出，元数据中的 langgraph_node 标明所属节点
+    """
+    yield from (graph or get_app()).stream(create_initial_state(patent_list), stream_mode=list(stream_mode))
+
+
+async def arun_analysis(patent_list: List[str], graph=None) -> GraphState:
+    """异步入口: 以 ainvoke 执行完整分析并返回最终状态；结束时释放本事件循环的异步 Neo4j 连接池。"""
+    async with async_neo4j_scope():
+        return await (graph or get_app()).ainvoke(create_initial_state(patent_list))
+
+
+async def astream_analysis(patent_list: List[str], graph=None, stream_mode=("updates", "messages")):
+    """异步流式入口，产出的事件与 stream_analysis 相同。"""
+    async with async_neo4j_scope():
+        async for chunk in (graph or get_app()).astream(create_initial_state(patent_list),
+                                                       stream_mode=list(stream_mode)):
+            yield chunk
+
+
+@resource("workflow_app")
+def get_app():
+    """进程级共享的已编译工作流。编译后的图不保存会话状态，可被多个 Streamlit 会话并发调用。"""
+    compiled = build_app()
+    print("\nStateGraph 编译成功!")
+    return compiled
 
-workflow.add_node("association_agent", association_agent_node)
-workflow.add_node("emerging_theme_agent", emerging_theme_agent_node)
-workflow.add_node("gap_agent", gap_agent_node)
-workflow.add_node("critic_agent", critic_agent_node)
-workflow.add_node("evaluation_agent", evaluation_agent_node_final)
 
-# 定义工作流图
-workflow.add_edge(START, "association_agent")
-workflow.add_edge(START, "emerging_theme_agent")
-workflow.add_edge(START, "gap_agent")
+# 兼容旧的模块级属性名 (from main import app / llm 等)，访问时从注册表取共享实例
+_LEGACY_RESOURCES = {
+    "app": get_app,
+    "llm": get_chat_model,
+    "agent_executors": get_agent_executors,
+    "association_agent_executor": lambda: get_agent_executors()["Association"],
+    "emerging_theme_agent_executor": lambda: get_agent_executors()["EmergingTheme"],
+    "gap_agent_executor": lambda: get_agent_executors()["TechnologyGap"],
+    "evaluation_agent_executor": lambda: get_agent_executors()["Evaluation"],
+}
 
-workflow.add_edge(["association_agent", "emerging_theme_agent", "gap_agent"], "critic_agent")
-workflow.add_edge("critic_agent", "evaluation_agent")
-workflow.add_edge("evaluation_agent", END)
 
-app = workflow.compile()
-print("\nStateGraph 编译成功!")
\ No newline at end of file
+def __getattr__(name):
+    if name in _LEGACY_RESOURCES:
+        return _LEGACY_RESOURCES[name]()
+    raise AttributeError(f"module {__name__!r} has no attribute {name!r}")
\ No newline at end of file
@@ -0,0 +1,177 @@
+# mock_neo4j_driver.py (内存中的 Neo4j 驱动替身: 模拟事务耗时、节点锁与死锁检测，用于离线压测图谱加载)
+
+import re
+import threading
+import time
+
+from neo4j.exceptions import TransientError
+
+_LABELS = re.compile(r":`([^`]+)`")
+
+
+class LockManager:
+    """
+    节点级排他锁: 事务写入节点或以其为端点创建关系时加锁，持有到提交/回滚。
+    维护等待图，等待会形成环时让当前事务失败 (与 Neo4j 的 DeadlockDetected 一样属于可重试的瞬时错误)。
+    """
+
+    def __init__(self):
+        self._condition = threading.Condition()
+        self._owners = {}  # 节点 -> 持有锁的事务
+        self._waiting = {}  # 事务 -> 正在等待的节点
+        self.deadlocks = 0
+        self.waits = 0
+
+    def _would_deadlock(self, tx_id: int, owner: int) -> bool:
+        for _ in range(len(self._waiting) + 1):
+            if owner == tx_id: return True
+            if owner not in self._waiting: return False
+            owner = self._owners.get(self._waiting[owner])
+        return False
+
+    def acquire(self, tx_id: int, nodes: list, held: set):
+        """按顺序锁定 nodes 并加入 held；被占用时等待，形成等待环时抛出 TransientError (已获得的锁保留在 held 中)。"""
+        with self._condition:
+            for node in nodes:
+                while True:
+                    owner = self._owners.get(node)
+                    if owner is None or owner == tx_id:
+                        self._owners[node] = tx_id
+                        self._waiting.pop(tx_id, None)
+                        held.add(node)
+                        break
+                    if self._would_deadlock(tx_id, owner):
+                        self._waiting.pop(tx_id, None)
+                        self.deadlocks += 1
+                        raise TransientError(f"Neo.TransientError.Transaction.DeadlockDetected: 事务 {tx_id} "
+                                             f"等待节点 {node} 时形成等待环")
+                    if self._waiting.get(tx_id) != node: self.waits += 1
+                    self._waiting[tx_id] = node
+                    self._condition.wait()
+
+    def release(self, tx_id: int, nodes: set):
+        with self._condition:
+            for node in nodes:
+                if self._owners.get(node) == tx_id: del self._owners[node]
+            self._condition.notify_all()
+
+
+class MockTransaction:
+    """解析 json_to_neo4j 生成的节点/关系 MERGE 语句，逐行加锁并按成本模型休眠，提交时才写入图谱。"""
+
+    def __init__(self, driver: "MockDriver", tx_id: int):
+        self._driver = driver
+        self._tx_id = tx_id
+        self._locked = set()
+        self._nodes = []
+        self._rels = []
+
+    def _lock_rows(self, rows: list, row_nodes):
+        driver = self._driver
+        for i in range(0, len(rows), driver.lock_chunk):
+            chunk = rows[i:i + driver.lock_chunk]
+            driver.locks.acquire(self._tx_id, [node for row in chunk for node in row_nodes(row)], self._locked)
+            time.sleep(driver.row_cost * len(chunk))
+
+    def run(self, query: str, rows: list = None, **params):
+        time.sleep(self._driver.latency / 2)
+        labels = _LABELS.findall(query)
+        if "MERGE (a)-" in query:
+            source_label, target_label, rel_type = labels
+            rows = rows or [{"source": params["source_key"], "target": params["target_key"]}]
+            self._lock_rows(rows, lambda row: ((source_label, row["source"]), (target_label, row["target"])))
+            self._rels.extend((source_label, row["source"], target_label, row["target"], rel_type) for row in rows)
+        elif query.lstrip().startswith(("UNWIND", "MERGE")):
+            label = labels[0]
+            rows = rows or [{"key": params["key"], "properties": params.get("properties") or {}}]
+            self._lock_rows(rows, lambda row: ((label, row["key"]),))
+            self._nodes.extend((label, row["key"], row["properties"]) for row in rows)
+        return []
+
+    def commit(self):
+        time.sleep(self._driver.latency / 2)
+        self._driver.graph.apply(self._nodes, self._rels)
+        self._driver.locks.release(self._tx_id, self._locked)
+
+    def rollback(self):
+        self._driver.locks.release(self._tx_id, self._locked)
+
+
+class MockGraph:
+    """提交后的图谱内容: 节点 {(label, key): properties} 与关系集合；关系的端点不存在时与 MATCH 一样不创建。"""
+
+    def __init__(self):
+        self._lock = threading.Lock()
+        self.nodes = {}
+        self.rels = set()
+        self.unmatched = 0
+
+    def apply(self, nodes: list, rels: list):
+        with self._lock:
+            for label, key, properties in nodes:
+                self.nodes.setdefault((label, key), {}).update(properties)
+            for source_label, source_key, target_label, target_key, rel_type in rels:
+                if (source_label, source_key) in self.nodes and (target_label, target_key) in self.nodes:
+                    self.rels.add((source_label, source_key, target_label, target_key, rel_type))
+                else:
+                    self.unmatched += 1
+
+
+class MockSession:
+    """execute_write 与驱动的行为一致 (失败时回滚)，但自身不重试，重试完全交给调用方。"""
+
+    def __init__(self, driver: "MockDriver"):
+        self._driver = driver
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *exc_info):
+        self.close()
+
+    def close(self):
+        pass
+
+    def execute_write(self, work, *args, **kwargs):
+        tx = MockTransaction(self._driver, self._driver.next_tx_id())
+        try:
+            result = work(tx, *args, **kwargs)
+        except BaseException:
+            tx.rollback()
+            raise
+        tx.commit()
+        return result
+
+
+class MockDriver:
+    """
+    成本模型: 每个事务两次往返各 latency/2 秒 (提交时仍持有锁)，每写入一行 row_cost 秒；
+    每 lock_chunk 行加一次锁并休眠，使并发事务的加锁过程交错进行，从而可能出现真实的等待与死锁。
+    """
+
+    def __init__(self, latency: float = 0.002, row_cost: float = 30e-6, lock_chunk: int = 100):
+        self.latency = latency
+        self.row_cost = row_cost
+        self.lock_chunk = lock_chunk
+        self.locks = LockManager()
+        self.graph = MockGraph()
+        self._tx_counter = 0
+        self._tx_lock = threading.Lock()
+
+    def next_tx_id(self) -> int:
+        with self._tx_lock:
+            self._tx_counter += 1
+            return self._tx_counter
+
+    @property
+    def transactions(self) -> int:
+        return self._tx_counter
+
+    def session(self, **kwargs):
+        return MockSession(self)
+
+    def verify_connectivity(self):
+        pass
+
+    def close(self):
+        pass
@@ -0,0 +1,131 @@
+# mock_openai_server.py (本地 OpenAI 兼容 mock 服务，用于离线压测)
+
+import argparse
+import hashlib
+import json
+import random
+import threading
+import time
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+
+# 模拟抽取结果: 与 excel_to_json_Unstructured.PatentAspects 的字段保持一致
+MOCK_ASPECTS = {
+    "object": "散热装置",
+    "problem": "现有散热器散热效率低",
+    "innovation": "采用热管与鳍片一体化结构",
+    "principle": "利用相变传热提高热传导效率",
+    "benefit": "提升散热效率，降低噪音",
+    "sub_functions": "导热;散热;固定",
+    "application": "计算机散热",
+    "components": "热管;鳍片;底座",
+    "component_relations": "热管穿设于鳍片并与底座焊接",
+    "technical_implementation": "将热管焊接于底座后穿设鳍片组"
+}
+
+
+def _mock_embedding(text: str, dimensions: int) -> list[float]:
+    """根据文本哈希生成确定性的伪向量，相同文本总是得到相同向量。"""
+    rng = random.Random(hashlib.sha256(text.encode("utf-8")).digest())
+    return [rng.uniform(-1.0, 1.0) for _ in range(dimensions)]
+
+
+class MockOpenAIHandler(BaseHTTPRequestHandler):
+    """实现 /v1/chat/completions 与 /v1/embeddings 两个端点，并可按比例注入 429 / 503 错误。"""
+    latency = 0.5
+    error_rate = 0.0
+    embedding_dimensions = 1536
+    stats = {"requests": 0, "errors": 0}
+    stats_lock = threading.Lock()
+
+    def log_message(self, format, *args):
+        pass
+
+    def _send_json(self, status: int, payload: dict, headers: dict = None):
+        body = json.dumps(payload, ensure_ascii=False).encode("utf-8")
+        self.send_response(status)
+        self.send_header("Content-Type", "application/json")
+        self.send_header("Content-Length", str(len(body)))
+        for key, value in (headers or {}).items():
+            self.send_header(key, value)
+        self.end_headers()
+        self.wfile.write(body)
+
+    def do_POST(self):
+        length = int(self.headers.get("Content-Length", 0))
+        request = json.loads(self.rfile.read(length) or b"{}")
+        time.sleep(random.uniform(0.5, 1.5) * self.latency)
+
+        with self.stats_lock:
+            self.stats["requests"] += 1
+            inject_error = random.random() < self.error_rate
+            if inject_error: self.stats["errors"] += 1
+        if inject_error:
+            status = random.choice([429, 503])
+            self._send_json(status, {"error": {"message": "mock injected error", "code": status}},
+                            headers={"Retry-After": "0.1"} if status == 429 else None)
+            return
+
+        model = request.get("model", "mock-model")
+        if self.path.endswith("/chat/completions"):
+            self._send_json(200, {
+                "id": f"chatcmpl-mock-{time.time_ns()}",
+                "object": "chat.completion",
+                "created": int(time.time()),
+                "model": model,
+                "choices": [{
+                    "index": 0,
+                    "message": {"role": "assistant", "content": json.dumps(MOCK_ASPECTS, ensure_ascii=False)},
+                    "finish_reason": "stop"
+                }],
+                "usage": {"prompt_tokens": 0, "completion_tokens": 0, "total_tokens": 0}
+            })
+        elif self.path.endswith("/embeddings"):
+            inputs = request.get("input", [])
+            inputs = [inputs] if isinstance(inputs, str) else inputs
+            self._send_json(200, {
+                "object": "list",
+                "model": model,
+                "data": [
+                    {"object": "embedding", "index": i,
+                     "embedding": _mock_embedding(text, request.get("dimensions") or self.embedding_dimensions)}
+                    for i, text in enumerate(inputs)
+                ],
+                "usage": {"prompt_tokens": 0, "total_tokens": 0}
+            })
+        else:
+            self._send_json(404, {"error": {"message": f"unknown path {self.path}"}})
+
+
+def start_mock_server(host: str = "127.0.0.1", port: int = 0, latency: float = 0.5,
+                      error_rate: float = 0.0) -> tuple[ThreadingHTTPServer, str]:
+    """在后台线程中启动 mock 服务，返回 (server, base_url)；port=0 表示自动选择空闲端口。"""
+    handler = type("ConfiguredMockHandler", (MockOpenAIHandler,), {
+        "latency": latency,
+        "error_rate": error_rate,
+        "stats": {"requests": 0, "errors": 0},
+        "stats_lock": threading.Lock(),
+    })
+    server = ThreadingHTTPServer((host, port), handler)
+    threading.Thread(target=server.serve_forever, daemon=True).start()
+    return server, f"http://{host}:{server.server_address[1]}/v1"
+
+
+def main():
+    parser = argparse.ArgumentParser(description="本地 OpenAI 兼容 mock 服务 (chat/completions 与 embeddings)。")
+    parser.add_argument("--host", default="127.0.0.1")
+    parser.add_argument("--port", type=int, default=8765)
+    parser.add_argument("--latency", type=float, default=0.5, help="平均响应延迟 (秒)")
+    parser.add_argument("--error-rate", type=float, default=0.0, help="注入 429/503 错误的比例 (0.0-1.0)")
+    args = parser.parse_args()
+
+    server, base_url = start_mock_server(args.host, args.port, args.latency, args.error_rate)
+    print(f"Mock OpenAI 服务已启动: {base_url} (延迟 {args.latency}s，错误率 {args.error_rate:.0%})，按 Ctrl+C 退出。")
+    try:
+        while True:
+            time.sleep(1)
+    except KeyboardInterrupt:
+        server.shutdown()
+
+
+if __name__ == "__main__":
+    main()
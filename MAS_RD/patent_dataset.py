@@ -0,0 +1,343 @@
+# patent_dataset.py (Excel -> Parquet 列式中间格式: 工作簿只读一遍，下游按批流式读取)
+
+import argparse
+import datetime
+import glob
+import json
+import os
+import re
+import time
+from typing import Iterable, Iterator, Optional
+
+import pyarrow as pa
+import pyarrow.compute as pc
+import pyarrow.parquet as pq
+
+# --- 1. Schema: 每个字段一列，申请日为日期列表 (少数记录含多个以 ';' 分隔的日期)，其余为字符串 ---
+STRUCTURED_FIELDS = ["申请号", "申请日", "IPC分类号", "申请（专利权）人", "发明人", "发明名称", "代理人", "代理机构",
+                     "文献类型", "申请人所在国（省）"]
+ROW_NUMBER_FIELD = "行号"  # Excel 中的行号 (表头为第 1 行)，用于按行范围/分片读取
+PATENT_SCHEMA = pa.schema([
+    pa.field(name, pa.list_(pa.date32()) if name == "申请日" else pa.string()) for name in STRUCTURED_FIELDS + ["摘要"]
+] + [pa.field(ROW_NUMBER_FIELD, pa.int32())])
+
+# LLM 抽取结果: 与 excel_to_json_Unstructured.PatentAspects 的字段一致，以 struct 列保存
+ASPECT_FIELDS = ["object", "problem", "innovation", "principle", "benefit", "sub_functions", "application",
+                 "components", "component_relations", "technical_implementation"]
+UNSTRUCTURED_SCHEMA = pa.schema([
+    pa.field("申请号", pa.string()),
+    pa.field("发明名称", pa.string()),
+    pa.field("extracted_knowledge", pa.struct([pa.field(name, pa.string()) for name in ASPECT_FIELDS])),
+])
+
+DATE_FORMAT = "%Y.%m.%d"  # 与 Excel 导出及图谱中 ApplicationDate 节点名称的格式一致
+DEFAULT_BATCH_ROWS = 10000
+
+
+def parse_dates(value) -> list[datetime.date]:
+    """Excel 单元格 -> 日期列表: 兼容 datetime 单元格与 '2005.06.14;2009.06.17' 这类文本，无法解析的部分被丢弃。"""
+    if isinstance(value, datetime.datetime): return [value.date()]
+    if isinstance(value, datetime.date): return [value]
+    dates = []
+    for match in re.finditer(r"(\d{4})\D(\d{1,2})\D(\d{1,2})", str(value or "")):
+        try:
+            dates.append(datetime.date(*map(int, match.groups())))
+        except ValueError:
+            continue
+    return dates
+
+
+def _cell_text(value) -> str:
+    return "" if value is None else str(value)
+
+
+# --- 2. 写入: 以 ParquetWriter 按批追加，内存占用只与批大小有关 ---
+class DatasetWriter:
+    """按批写入 Parquet 文件: 先写临时文件，close 时原子替换，中途失败不会留下半个数据集。"""
+
+    def __init__(self, path: str, schema: pa.Schema, batch_rows: int = DEFAULT_BATCH_ROWS):
+        self.path = path
+        self.schema = schema
+        self.batch_rows = batch_rows
+        self.rows_written = 0
+        self._columns = {name: [] for name in schema.names}
+        self._tmp_path = f"{path}.tmp"
+        self._writer = pq.ParquetWriter(self._tmp_path, schema, compression="zstd")
+
+    def write(self, record: dict):
+        for name, column in self._columns.items():
+            column.append(record.get(name))
+        if len(self._columns[self.schema.names[0]]) >= self.batch_rows:
+            self.flush()
+
+    def flush(self):
+        if not self._columns[self.schema.names[0]]: return
+        batch = pa.RecordBatch.from_pydict(self._columns, schema=self.schema)
+        self._writer.write_batch(batch)
+        self.rows_written += batch.num_rows
+        self._columns = {name: [] for name in self.schema.names}
+
+    def close(self):
+        self.flush()
+        self._writer.close()
+        os.replace(self._tmp_path, self.path)
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, exc_type, exc, tb):
+        if exc_type is None:
+            self.close()
+        else:
+            self._writer.close()
+            os.remove(self._tmp_path)
+
+
+def write_records(path: str, records: Iterable[dict], schema: pa.Schema, batch_rows: int = DEFAULT_BATCH_ROWS) -> int:
+    """将记录流写为 Parquet 文件，返回写入行数。"""
+    with DatasetWriter(path, schema, batch_rows) as writer:
+        for record in records:
+            writer.write(record)
+    return writer.rows_written
+
+
+def iter_workbook_rows(xlsx_path: str, columns: list[str], start_row: int = 1,
+                       end_row: int = None) -> Iterator[tuple[int, dict]]:
+    """
+    以 openpyxl 只读模式流式读取工作簿第一个工作表的数据行 [start_row, end_row] (1 表示表头后的第一行)，
+    读到 end_row 即停止，不解析其后的内容。返回 (Excel 行号, {列名: 单元格值})，跳过整行为空的行。
+    """
+    from openpyxl import load_workbook
+    workbook = load_workbook(xlsx_path, read_only=True, data_only=True)
+    try:
+        sheet = workbook.worksheets[0]
+        header = [_cell_text(cell).strip() for cell in next(sheet.iter_rows(max_row=1, values_only=True), ())]
+        missing = [name for name in columns if name not in header]
+        if missing: raise KeyError(f"工作簿缺少列: {missing}")
+        positions = [(name, header.index(name)) for name in columns]
+        rows = sheet.iter_rows(min_row=start_row + 1, max_row=end_row + 1 if end_row else None, values_only=True)
+        for row_number, row in enumerate(rows, start=start_row + 1):
+            if row is None or not any(cell is not None and cell != "" for cell in row): continue
+            yield row_number, {name: row[i] if i < len(row) else None for name, i in positions}
+    finally:
+        workbook.close()
+
+
+def _workbook_record(values: dict) -> dict:
+    """单元格值 -> 类型化记录: 申请日为日期列表，摘要保留原文，其余字段去首尾空白。"""
+    record = {name: _cell_text(value) if name == "摘要" else _cell_text(value).strip() for name, value in values.items()}
+    if "申请日" in values: record["申请日"] = parse_dates(values["申请日"])
+    return record
+
+
+def convert_workbook(xlsx_path: str, dataset_path: str, batch_rows: int = DEFAULT_BATCH_ROWS) -> int:
+    """读取工作簿一遍，写出 PATENT_SCHEMA 的 Parquet 数据集 (结构化字段 + 摘要 + Excel 行号)，返回行数。"""
+    def records():
+        for row_number, values in iter_workbook_rows(xlsx_path, STRUCTURED_FIELDS + ["摘要"]):
+            yield {**_workbook_record(values), ROW_NUMBER_FIELD: row_number}
+
+    return write_records(dataset_path, records(), PATENT_SCHEMA, batch_rows)
+
+
+def is_dataset_fresh(xlsx_path: str, dataset_path: str) -> bool:
+    """数据集存在、不早于工作簿且包含行号列 (旧版缓存没有行号，需要重新转换)。"""
+    if not os.path.exists(dataset_path) or os.path.getmtime(dataset_path) < os.path.getmtime(xlsx_path):
+        return False
+    return ROW_NUMBER_FIELD in pq.read_schema(dataset_path).names
+
+
+def ensure_workbook_dataset(xlsx_path: str, dataset_path: str) -> str:
+    """数据集不存在或早于工作簿时重新转换，否则直接复用 (后续脚本不再解析 Excel)。"""
+    if not is_dataset_fresh(xlsx_path, dataset_path):
+        start_time = time.perf_counter()
+        rows = convert_workbook(xlsx_path, dataset_path)
+        print(f"已将 '{xlsx_path}' 转换为列式数据集 '{dataset_path}' ({rows} 行，{time.perf_counter() - start_time:.1f} 秒)。")
+    return dataset_path
+
+
+# --- 3. 行范围与分片: 抽取脚本的命令行参数，以及按范围/分片流式读取工作簿 ---
+def parse_shard(text: str) -> tuple[int, int]:
+    """'i/N' -> (i, N)，i 从 0 开始。"""
+    try:
+        index, count = (int(part) for part in text.split("/"))
+    except ValueError:
+        raise argparse.ArgumentTypeError(f"分片格式应为 i/N (如 0/4)，收到 '{text}'")
+    if count < 1 or not 0 <= index < count:
+        raise argparse.ArgumentTypeError(f"分片序号须满足 0 <= i < N，收到 '{text}'")
+    return index, count
+
+
+def add_row_selection_arguments(parser: argparse.ArgumentParser):
+    parser.add_argument("--start-row", type=int, default=1, help="开始行 (包含，1 表示表头后的第一行)")
+    parser.add_argument("--end-row", type=int, default=None, help="结束行 (包含)，默认读到最后一行；读到该行即停止")
+    parser.add_argument("--shard", type=parse_shard, default=None, metavar="i/N",
+                        help="只处理范围内第 i 个分片 (按行号轮转分配，共 N 片)，多个进程可各取一片并行处理同一工作簿")
+
+
+def validate_row_selection(args: argparse.Namespace) -> Optional[str]:
+    """返回错误信息；参数合法时返回 None。"""
+    if args.start_row < 1: return f"无效的开始行 {args.start_row}"
+    if args.end_row is not None and args.end_row < args.start_row:
+        return f"无效的行范围 ({args.start_row}-{args.end_row})"
+    return None
+
+
+def describe_row_selection(args: argparse.Namespace) -> str:
+    text = f"第 {args.start_row} 行到{'最后一行' if args.end_row is None else f'第 {args.end_row} 行'}"
+    if args.shard: text += f"，分片 {args.shard[0]}/{args.shard[1]}"
+    return text
+
+
+def shard_path(path: str, shard: Optional[tuple[int, int]]) -> str:
+    """分片输出文件名: data.parquet -> data.part-0-of-4.parquet；不分片时原样返回。"""
+    if not shard: return path
+    root, ext = os.path.splitext(path)
+    return f"{root}.part-{shard[0]}-of-{shard[1]}{ext}"
+
+
+_SHARD_SUFFIX_RE = re.compile(r"\.part-(\d+)-of-(\d+)$")
+
+
+def shard_files(path: str, allow_mixed: bool = False) -> list[str]:
+    """
+    path 对应的全部已存在的分片文件，按分片序号排列。
+    数据集只能由同一种分片方式 (同一个 N) 的分片组成: 同时存在多种 -of-N 说明残留了以前运行的分片，
+    混读会重复或混入过期记录，因此抛出 ValueError。allow_mixed=True 时 (检查点按申请号合并) 返回全部分片，
+    按修改时间从旧到新排列，较新运行的记录覆盖旧记录。
+    """
+    root, ext = os.path.splitext(path)
+    shard_sets: dict[int, list[tuple[int, str]]] = {}
+    for file_path in glob.glob(f"{glob.escape(root)}.part-*-of-*{glob.escape(ext)}"):
+        match = _SHARD_SUFFIX_RE.search(file_path[:len(file_path) - len(ext)])
+        if not match: continue
+        index, count = map(int, match.groups())
+        if index < count: shard_sets.setdefault(count, []).append((index, file_path))
+    if allow_mixed:
+        return sorted((file_path for shards in shard_sets.values() for _, file_path in shards), key=os.path.getmtime)
+    if len(shard_sets) > 1:
+        listing = "; ".join(f"-of-{count}: {len(shards)} 个" for count, shards in sorted(shard_sets.items()))
+        raise ValueError(f"'{path}' 存在多种分片方式的分片文件 ({listing})，请删除以前运行残留的分片后重试。")
+    return [file_path for shards in shard_sets.values() for _, file_path in sorted(shards)]
+
+
+def dataset_files(path: str) -> list[str]:
+    """数据集文件列表: 完整文件存在时只用它，否则使用各分片文件。"""
+    return [path] if os.path.exists(path) else shard_files(path)
+
+
+def _format_record(record: dict) -> dict:
+    """类型化记录 -> 与旧版 JSON 相同形态 (日期列表 -> 'YYYY.MM.DD;...'，空值 -> 空字符串)。"""
+    return {name: "" if value is None else ";".join(d.strftime(DATE_FORMAT) for d in value)
+            if isinstance(value, list) else value for name, value in record.items()}
+
+
+def _iter_dataset_rows(dataset_path: str, columns: list[str], start_row: int,
+                       end_row: Optional[int]) -> Iterator[tuple[int, dict]]:
+    """从工作簿数据集按批读取 [start_row, end_row] 范围内的行 (行号递增，越过 end_row 即停止)。"""
+    parquet_file = pq.ParquetFile(dataset_path)
+    for batch in parquet_file.iter_batches(batch_size=DEFAULT_BATCH_ROWS, columns=columns + [ROW_NUMBER_FIELD]):
+        for record in batch.to_pylist():
+            data_row = record.pop(ROW_NUMBER_FIELD) - 1
+            if data_row < start_row: continue
+            if end_row is not None and data_row > end_row: return
+            yield data_row + 1, record
+
+
+def iter_patent_rows(xlsx_path: str, dataset_path: str, columns: list[str], start_row: int = 1, end_row: int = None,
+                     shard: tuple[int, int] = None, typed: bool = False) -> Iterator[tuple[int, dict]]:
+    """
+    按行范围与分片流式读取专利行，返回 (Excel 行号, 记录)。
+    - 工作簿数据集 (dataset_path) 比工作簿新时从数据集读取，否则以只读模式流式读取工作簿并在 end_row 处停止；
+      读取全部行且不分片时顺便生成数据集，供之后的运行复用。
+    - 分片按数据行号轮转分配: 第 k 个数据行 (从 start_row 起计) 属于分片 k % N。
+    - typed=True 时 申请日 为日期列表 (用于写 Parquet)，否则为与旧版 JSON 相同的字符串形态。
+    """
+    if not is_dataset_fresh(xlsx_path, dataset_path) and start_row == 1 and end_row is None and not shard:
+        ensure_workbook_dataset(xlsx_path, dataset_path)
+    if is_dataset_fresh(xlsx_path, dataset_path):
+        rows = _iter_dataset_rows(dataset_path, columns, start_row, end_row)
+    else:
+        rows = ((row_number, _workbook_record(values))
+                for row_number, values in iter_workbook_rows(xlsx_path, columns, start_row, end_row))
+    index, count = shard or (0, 1)
+    for row_number, record in rows:
+        if (row_number - 1 - start_row) % count != index: continue
+        yield row_number, record if typed else _format_record(record)
+
+
+# --- 4. 读取: 按批流式读取 Parquet (含分片文件)；旧版 JSON 文件整体读入后按批切分 ---
+def _format_column(column: pa.Array) -> pa.Array:
+    """在 Arrow 内向量化转换: 日期列表 -> 'YYYY.MM.DD;...' 字符串，字符串空值 -> 空字符串。"""
+    if pa.types.is_list(column.type):
+        dates = pc.strftime(pc.cast(column.flatten(), pa.timestamp("s")), format=DATE_FORMAT)
+        column = pc.binary_join(pa.ListArray.from_arrays(column.offsets, dates), ";")
+    if pa.types.is_string(column.type):
+        column = pc.fill_null(column, "")
+    return column
+
+
+def _to_records(batch: pa.RecordBatch) -> list[dict]:
+    """
+    RecordBatch -> 与旧版 JSON 相同形态的记录: 日期列表格式化为 'YYYY.MM.DD;...'，空值为空字符串；
+    struct 列 (抽取结果) 去掉空字段，与 model_dump(exclude_none=True) 一致。
+    """
+    batch = pa.RecordBatch.from_arrays([_format_column(column) for column in batch.columns], names=batch.schema.names)
+    records = batch.to_pylist()
+    struct_names = [field.name for field in batch.schema if pa.types.is_struct(field.type)]
+    for record in records if struct_names else ():
+        for name in struct_names:
+            value = record[name]
+            record[name] = {key: item for key, item in value.items() if item is not None} if value else ""
+    return records
+
+
+def iter_records(path: str, columns: list[str] = None, batch_size: int = DEFAULT_BATCH_ROWS) -> Iterator[list[dict]]:
+    """
+    按批返回记录列表。.parquet 文件流式读取 (内存占用与批大小相关)，完整文件不存在时依次读取各分片文件；
+    其他后缀按旧版 JSON 数组读取。
+    """
+    if path.endswith(".parquet"):
+        for file_path in dataset_files(path):
+            parquet_file = pq.ParquetFile(file_path)
+            names = [name for name in columns if name in parquet_file.schema_arrow.names] if columns else None
+            for batch in parquet_file.iter_batches(batch_size=batch_size, columns=names):
+                yield _to_records(batch)
+        return
+    with open(path, 'r', encoding='utf-8') as f:
+        records = json.load(f)
+    for i in range(0, len(records), batch_size):
+        yield [{name: record.get(name, "") for name in columns} if columns else record
+               for record in records[i:i + batch_size]]
+
+
+def count_records(path: str) -> int:
+    if path.endswith(".parquet"):
+        return sum(pq.ParquetFile(file_path).metadata.num_rows for file_path in dataset_files(path))
+    with open(path, 'r', encoding='utf-8') as f:
+        return len(json.load(f))
+
+
+def resolve_dataset_path(path: str) -> str:
+    """给定 .json 路径时，若同名 .parquet (或其分片文件) 存在则优先使用列式数据集。"""
+    root, ext = os.path.splitext(path)
+    if ext == ".json" and dataset_files(f"{root}.parquet"):
+        return f"{root}.parquet"
+    return path
+
+
+def main():
+    parser = argparse.ArgumentParser(description="将专利工作簿一次性转换为 Parquet 数据集 (结构化字段 + 摘要)。")
+    parser.add_argument("xlsx", nargs="?", default="patents.xlsx", help="输入工作簿")
+    parser.add_argument("output", nargs="?", default="patents.parquet", help="输出 Parquet 文件")
+    parser.add_argument("--batch-rows", type=int, default=DEFAULT_BATCH_ROWS, help="每个写入批次的行数")
+    args = parser.parse_args()
+
+    start_time = time.perf_counter()
+    rows = convert_workbook(args.xlsx, args.output, args.batch_rows)
+    elapsed = time.perf_counter() - start_time
+    print(f"已将 '{args.xlsx}' 的 {rows} 行转换为 '{args.output}' "
+          f"({os.path.getsize(args.output) / 1024:.0f} KB)，耗时 {elapsed:.2f} 秒。")
+
+
+if __name__ == "__main__":
+    main()
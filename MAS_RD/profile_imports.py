@@ -0,0 +1,59 @@
+# profile_imports.py (基于 python -X importtime 的模块导入耗时报告)
+
+import argparse
+import subprocess
+import sys
+from collections import defaultdict
+
+
+def profile_import(module: str) -> list[tuple[str, int, int, int]]:
+    """在全新子进程中以 -X importtime 导入模块，返回 [(模块名, 嵌套深度, 自身耗时 us, 累计耗时 us)]。"""
+    stderr = subprocess.run([sys.executable, "-X", "importtime", "-W", "ignore", "-c", f"import {module}"],
+                            capture_output=True, text=True, check=True).stderr
+    rows = []
+    for line in stderr.splitlines():
+        if not line.startswith("import time:") or "self [us]" in line: continue
+        self_us, cumulative_us, name = line[len("import time:"):].split("|")
+        depth = (len(name) - len(name.lstrip())) // 2
+        rows.append((name.strip(), depth, int(self_us), int(cumulative_us)))
+    return rows
+
+
+def summarize(module: str, rows: list[tuple[str, int, int, int]], top: int):
+    # importtime 先输出子模块再输出父模块: 目标模块是最后一个顶层行，它之前直到上一个顶层行的部分都由它触发
+    end = max(i for i, (name, depth, _, _) in enumerate(rows) if depth == 0 and name == module)
+    start = max([i for i, (_, depth, _, _) in enumerate(rows[:end]) if depth == 0], default=-1) + 1
+    rows = rows[start:end + 1]
+    total_us = rows[-1][3]
+    print(f"\n=== import {module}: 共 {total_us / 1000:.0f} 毫秒，加载 {len(rows)} 个模块 ===")
+
+    # 按顶层包聚合自身耗时，定位最重的第三方依赖
+    by_package = defaultdict(int)
+    for name, _, self_us, _ in rows:
+        by_package[name.split(".")[0]] += self_us
+    print(f"  耗时最多的 {top} 个顶层包:")
+    for package, self_us in sorted(by_package.items(), key=lambda kv: kv[1], reverse=True)[:top]:
+        print(f"    {package:<28s} {self_us / 1000:8.1f} 毫秒  ({self_us / total_us:5.1%})")
+
+    # 累计耗时最高的直接依赖 (谁把这些包拉进来)
+    direct = [(name, cumulative_us) for name, depth, _, cumulative_us in rows if depth == 1]
+    print(f"  由 {module} 直接导入、累计耗时最多的模块:")
+    for name, cumulative_us in sorted(direct, key=lambda kv: kv[1], reverse=True)[:top]:
+        print(f"    {name:<28s} {cumulative_us / 1000:8.1f} 毫秒")
+
+
+def main():
+    parser = argparse.ArgumentParser(description="统计模块冷导入耗时 (基于 python -X importtime)。")
+    parser.add_argument("modules", nargs="*", default=["tools", "main"], help="要分析的模块")
+    parser.add_argument("--top", type=int, default=10, help="每项列出的条目数")
+    args = parser.parse_args()
+
+    for module in args.modules:
+        try:
+            summarize(module, profile_import(module), args.top)
+        except subprocess.CalledProcessError as e:
+            print(f"\n=== import {module} 失败 ===\n{e.stderr.strip().splitlines()[-1]}")
+
+
+if __name__ == "__main__":
+    main()
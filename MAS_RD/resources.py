@@ -0,0 +1,76 @@
+# resources.py (进程级共享资源注册表: LLM、Agent 执行器、工作流、OpenAI / Chroma / Neo4j 客户端)
+
+import threading
+import time
+from typing import Any, Callable, Optional
+
+
+class ResourceRegistry:
+    """
+    名称 -> 工厂函数 的注册表。每个资源在进程内首次 get 时创建一次，之后所有线程和 Streamlit 会话共享同一实例。
+    - 每个资源有独立的锁: 并发会话同时首次访问时只会创建一次，且不同资源的创建互不阻塞 (工厂内可以 get 其他资源)。
+    - 注册的资源必须是无会话状态的 (客户端、连接池、编译后的图等)；会话数据应放在 st.session_state 或调用参数中。
+    """
+
+    def __init__(self):
+        self._factories: dict[str, Callable[[], Any]] = {}
+        self._closers: dict[str, Optional[Callable[[Any], None]]] = {}
+        self._instances: dict[str, Any] = {}
+        self._locks: dict[str, threading.Lock] = {}
+        self._init_seconds: dict[str, float] = {}
+
+    def register(self, name: str, factory: Callable[[], Any], close: Callable[[Any], None] = None):
+        """注册资源。close 用于 reset / 进程退出时释放资源 (如关闭连接池)。"""
+        self._factories[name] = factory
+        self._closers[name] = close
+        self._locks.setdefault(name, threading.Lock())
+
+    def get(self, name: str) -> Any:
+        if name in self._instances:
+            return self._instances[name]
+        with self._locks[name]:
+            if name not in self._instances:
+                start_time = time.perf_counter()
+                self._instances[name] = self._factories[name]()
+                self._init_seconds[name] = time.perf_counter() - start_time
+        return self._instances[name]
+
+    def is_loaded(self, name: str) -> bool:
+        return name in self._instances
+
+    def reset(self, name: str = None):
+        """释放指定资源 (为空时释放全部)，下次 get 时重新创建。"""
+        for resource_name in ([name] if name else list(self._factories)):
+            with self._locks[resource_name]:
+                instance = self._instances.pop(resource_name, None)
+                close = self._closers.get(resource_name)
+                if instance is not None and close is not None:
+                    close(instance)
+
+    def warm_up(self, names: list[str] = None) -> "ResourceRegistry":
+        """预先创建资源 (为空时创建全部)，返回注册表本身，便于作为 st.cache_resource 的返回值。"""
+        for name in (names or list(self._factories)):
+            self.get(name)
+        return self
+
+    def stats(self) -> dict:
+        return {name: {"loaded": name in self._instances, "init_seconds": self._init_seconds.get(name)}
+                for name in self._factories}
+
+
+registry = ResourceRegistry()
+
+
+def resource(name: str, close: Callable[[Any], None] = None):
+    """装饰器: 将工厂函数注册为资源，并将其替换为返回共享实例的无参访问函数。"""
+    def decorator(factory: Callable[[], Any]) -> Callable[[], Any]:
+        registry.register(name, factory, close)
+
+        def getter():
+            return registry.get(name)
+
+        getter.__name__ = factory.__name__
+        getter.__doc__ = factory.__doc__
+        return getter
+
+    return decorator
@@ -0,0 +1,113 @@
+# search_cache.py (语义检索缓存: 查询文本 -> 向量 的两级缓存，以及短 TTL 的检索结果缓存)
+
+import os
+import threading
+import time
+import unicodedata
+from collections import OrderedDict
+from typing import Any, Hashable, Optional
+
+from llm_cache import SQLiteCache, make_cache_key
+
+
+def normalize_query(text: str) -> str:
+    """查询文本规范化: NFKC (全角转半角)、去首尾空白、合并连续空白、英文小写。"""
+    return " ".join(unicodedata.normalize("NFKC", text).split()).lower()
+
+
+class TTLCache:
+    """线程安全的进程内 LRU 缓存，条目超过 ttl_seconds 后视为未命中；ttl_seconds 为 None 时永不过期。"""
+
+    def __init__(self, max_entries: int = 256, ttl_seconds: float = None):
+        self.max_entries = max_entries
+        self.ttl_seconds = ttl_seconds
+        self.hits = 0
+        self.misses = 0
+        self._entries: OrderedDict = OrderedDict()
+        self._lock = threading.Lock()
+
+    def get(self, key: Hashable) -> Optional[Any]:
+        with self._lock:
+            entry = self._entries.get(key)
+            if entry is not None and self.ttl_seconds is not None and time.monotonic() - entry[1] > self.ttl_seconds:
+                del self._entries[key]
+                entry = None
+            if entry is None:
+                self.misses += 1
+                return None
+            self._entries.move_to_end(key)
+            self.hits += 1
+            return entry[0]
+
+    def set(self, key: Hashable, value: Any):
+        with self._lock:
+            self._entries[key] = (value, time.monotonic())
+            self._entries.move_to_end(key)
+            while len(self._entries) > self.max_entries:
+                self._entries.popitem(last=False)
+
+    def clear(self):
+        with self._lock:
+            self._entries.clear()
+
+    def stats(self) -> dict:
+        total = self.hits + self.misses
+        return {"hits": self.hits, "misses": self.misses, "hit_rate": self.hits / total if total else 0.0,
+                "entries": len(self._entries)}
+
+
+class QueryEmbeddingCache:
+    """
+    查询向量的两级缓存: 进程内 LRU + 磁盘 SQLiteCache (跨进程、跨重启复用)。
+    键为 (嵌入模型, 规范化后的查询文本) 的哈希，大小写、全半角或空白不同的查询共用同一个向量。
+    """
+
+    def __init__(self, model: str, disk_cache: SQLiteCache = None, max_entries: int = 1024):
+        self.model = model
+        self.disk_cache = disk_cache
+        self.memory_cache = TTLCache(max_entries=max_entries)
+
+    def key(self, text: str) -> str:
+        return make_cache_key(model=self.model, query=normalize_query(text))
+
+    def get(self, text: str) -> Optional[list[float]]:
+        key = self.key(text)
+        vector = self.memory_cache.get(key)
+        if vector is None and self.disk_cache is not None:
+            vector = self.disk_cache.get(key)
+            if vector is not None:
+                self.memory_cache.set(key, vector)
+        return vector
+
+    def set(self, text: str, vector: list[float]):
+        key = self.key(text)
+        self.memory_cache.set(key, vector)
+        if self.disk_cache is not None:
+            self.disk_cache.set(key, vector)
+
+    def stats(self) -> dict:
+        return {"memory": self.memory_cache.stats(), "disk": self.disk_cache.stats() if self.disk_cache else None}
+
+
+# --- 集合版本: 向量化脚本写入集合后更新版本文件，检索结果缓存以版本为键的一部分，数据变化后自动失效 ---
+def _version_path(persist_directory: str, collection_name: str) -> str:
+    return os.path.join(persist_directory or ".", f"{collection_name}.version")
+
+
+def collection_version(persist_directory: str, collection_name: str) -> str:
+    try:
+        with open(_version_path(persist_directory, collection_name), encoding="utf-8") as f:
+            return f.read().strip()
+    except FileNotFoundError:
+        return ""
+
+
+def bump_collection_version(persist_directory: str, collection_name: str) -> str:
+    """原子地写入新版本号 (纳秒时间戳) 并返回。"""
+    version = str(time.time_ns())
+    path = _version_path(persist_directory, collection_name)
+    tmp_path = f"{path}.tmp"
+    with open(tmp_path, "w", encoding="utf-8") as f:
+        f.write(version)
+    os.replace(tmp_path, path)
+    return version
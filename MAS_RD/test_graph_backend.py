@@ -0,0 +1,96 @@
+# test_graph_backend.py (图后端一致性测试: 进程内 CSR 实现与逐句转写 Cypher 语义的参考实现在随机图谱上结果一致；
+# 与 Neo4j 的比较为可选的集成测试，设置 NEO4J_PARITY=1 且 Neo4j 已加载数据集时运行)
+
+import asyncio
+import os
+import random
+
+import pytest
+
+from check_graph_backend import ReferenceGraphBackend, _normalize_features, synthetic_graph_items
+from graph_backend import CypherGraphBackend, InMemoryGraphBackend
+
+LIMITS = [1, 10, 25]
+
+
+def _patent_lists(patents: list[str], seed: int, sizes=(1, 3, 15, 40), per_size: int = 20) -> list[list[str]]:
+    rng = random.Random(seed)
+    patent_lists = [rng.sample(patents, min(size, len(patents))) for size in sizes for _ in range(per_size)]
+    patent_lists.append(["CN-不存在的申请号"] + rng.sample(patents, 3))  # 图谱中没有的申请号被忽略
+    return patent_lists
+
+
+# 大图谱中枢纽领域连接数百件专利；小图谱中同分并列更多，用于检验名称升序的次序
+@pytest.fixture(scope="module", params=[(3000, 0), (300, 1)], ids=["hubs", "ties"])
+def backends(request):
+    items = synthetic_graph_items(*request.param)
+    return InMemoryGraphBackend.from_items(items), ReferenceGraphBackend(items)
+
+
+@pytest.mark.parametrize("limit", LIMITS)
+def test_associated_technologies(backends, limit):
+    memory, reference = backends
+    for patent_list in _patent_lists(memory.names["Patent"], limit):
+        assert memory.associated_technologies(patent_list, limit) == reference.associated_technologies(patent_list, limit)
+
+
+@pytest.mark.parametrize("limit", LIMITS)
+def test_technology_gaps(backends, limit):
+    memory, reference = backends
+    for patent_list in _patent_lists(memory.names["Patent"], limit):
+        assert memory.technology_gaps(patent_list, limit) == reference.technology_gaps(patent_list, limit)
+
+
+def test_patent_features(backends):
+    memory, reference = backends
+    for patent_list in _patent_lists(memory.names["Patent"], 0):
+        features = memory.patent_features(patent_list)
+        assert _normalize_features(features) == _normalize_features(reference.patent_features(patent_list))
+        # 同领域专利的 (专利, 技术实现) 对不重复 (Cypher 中为 collect(DISTINCT ...))
+        for patent in features["patents"].values():
+            assert len(patent["peer_techs"]) == len(set(map(tuple, patent["peer_techs"])))
+
+
+def test_patent_year_rows(backends):
+    memory, reference = backends
+    assert sorted(memory.patent_year_rows()) == sorted(reference.patent_year_rows())
+
+
+def test_async_methods_match_sync(backends):
+    memory, _ = backends
+    patent_list = _patent_lists(memory.names["Patent"], 0)[-1]
+
+    async def run():
+        return (await memory.apatent_features(patent_list), await memory.aassociated_technologies(patent_list, 25),
+                await memory.atechnology_gaps(patent_list, 25))
+
+    assert asyncio.run(run()) == (memory.patent_features(patent_list), memory.associated_technologies(patent_list, 25),
+                                  memory.technology_gaps(patent_list, 25))
+
+
+# --- 集成测试: 与 Neo4j 上的 Cypher 查询比较 (check_graph_backend.py --against neo4j 的同一比较) ---
+@pytest.fixture(scope="module")
+def neo4j_backends():
+    if os.getenv("NEO4J_PARITY") != "1":
+        pytest.skip("设置 NEO4J_PARITY=1 并用 json_to_neo4j.py 加载数据集后运行")
+    import tools
+    if not tools.check_neo4j_health():
+        pytest.skip("无法连接 Neo4j，请检查 .env 中的 NEO4J_URI 等配置")
+    from aspect_canonical import AspectAliases
+    from patent_dataset import resolve_dataset_path
+    memory = InMemoryGraphBackend.from_datasets(resolve_dataset_path(tools.GRAPH_STRUCTURED_DATA_PATH),
+                                                resolve_dataset_path(tools.GRAPH_UNSTRUCTURED_DATA_PATH),
+                                                aliases=AspectAliases.load(tools.GRAPH_ASPECT_ALIASES_PATH))
+    return memory, CypherGraphBackend(tools.run_cypher_query, tools.arun_cypher_query)
+
+
+@pytest.mark.integration
+@pytest.mark.parametrize("limit", LIMITS)
+def test_neo4j_parity(neo4j_backends, limit):
+    memory, neo4j = neo4j_backends
+    for patent_list in _patent_lists(memory.names["Patent"], limit, sizes=(1, 15), per_size=10):
+        assert memory.associated_technologies(patent_list, limit) == neo4j.associated_technologies(patent_list, limit)
+        assert memory.technology_gaps(patent_list, limit) == neo4j.technology_gaps(patent_list, limit)
+        assert _normalize_features(memory.patent_features(patent_list)) == \
+            _normalize_features(neo4j.patent_features(patent_list))
+    assert sorted(memory.patent_year_rows()) == sorted(neo4j.patent_year_rows())
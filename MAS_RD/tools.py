@@ -1,16 +1,30 @@
 # tools.py (FIXED AGAIN)
 
+from __future__ import annotations
+
 import os
+import asyncio
+import atexit
+import contextlib
 import datetime
+import json
+import weakref
+from contextvars import ContextVar
 from collections import Counter
+from typing import TYPE_CHECKING, Awaitable, Callable, Optional
 from dotenv import load_dotenv
 from langchain_core.tools import tool
-from neo4j import GraphDatabase
 import numpy as np
-from openai import OpenAI
-import chromadb
 from pydantic import BaseModel, Field
 
+# neo4j / openai / chromadb 导入较慢且需要外部服务，仅在首次创建对应客户端时导入
+if TYPE_CHECKING:
+    from openai import AsyncOpenAI, OpenAI
+
+from graph_backend import GraphBackend
+from graph_indexes import LazyIndex, PatentYearIndex
+from resources import registry, resource
+
 # ... (所有环境变量和服务客户端初始化代码保持不变) ...
 load_dotenv()
 NEO4J_URI = os.getenv("NEO4J_URI")
@@ -18,146 +32,543 @@ NEO4J_URI = os.getenv("NEO4J_URI")
 OPENAI_API_KEY = os.getenv("OPENAI_API_KEY")
 OPENAI_BASE_URL = os.getenv("OPENAI_BASE_URL")
 EMBEDDING_MODEL = "text-embedding-3-small"
-openai_client_for_tools = OpenAI(api_key=OPENAI_API_KEY, base_url=OPENAI_BASE_URL)
-chroma_client = chromadb.PersistentClient(path=os.getenv("CHROMA_PERSIST_DIRECTORY"))
-chroma_collection = chroma_client.get_collection(name=os.getenv("CHROMA_COLLECTION_NAME"))
 
 
-# --- 基础工具：数据库查询 (保持不变) ---
-def run_cypher_query(query: str, params: dict = {}) -> list[dict]:
-    # ... (此函数逻辑不变) ...
-    driver = None
+# --- 服务客户端: 注册到进程级资源注册表，首次使用时创建，所有 Streamlit 会话共享 ---
+@resource("openai_client")
+def get_openai_client() -> OpenAI:
+    from openai import OpenAI
+    return OpenAI(api_key=OPENAI_API_KEY, base_url=OPENAI_BASE_URL)
+
+
+@resource("async_openai_client")
+def get_async_openai_client() -> AsyncOpenAI:
+    from openai import AsyncOpenAI
+    return AsyncOpenAI(api_key=OPENAI_API_KEY, base_url=OPENAI_BASE_URL)
+
+
+@resource("chroma_collection")
+def get_chroma_collection():
+    import chromadb
+    chroma_client = chromadb.PersistentClient(path=os.getenv("CHROMA_PERSIST_DIRECTORY"))
+    return chroma_client.get_collection(name=os.getenv("CHROMA_COLLECTION_NAME"))
+
+
+# 兼容旧的模块级属性名 (tools.chroma_collection 等)，访问时从注册表取共享实例
+_LEGACY_RESOURCES = {
+    "openai_client_for_tools": "openai_client",
+    "async_openai_client_for_tools": "async_openai_client",
+    "chroma_collection": "chroma_collection",
+}
+
+
+def __getattr__(name):
+    if name in _LEGACY_RESOURCES:
+        return registry.get(_LEGACY_RESOURCES[name])
+    raise AttributeError(f"module {__name__!r} has no attribute {name!r}")
+
+
+# --- Neo4j 驱动: 进程级单例 (惰性初始化 + 连接池 + 健康检查 + 退出时关闭) ---
+NEO4J_MAX_POOL_SIZE = int(os.getenv("NEO4J_MAX_POOL_SIZE", "50"))
+NEO4J_LIVENESS_CHECK_SECONDS = 30  # 空闲超过该时长的池化连接在复用前先做存活检查
+NEO4J_MAX_RETRY_SECONDS = 15  # 读事务遇到瞬时错误时的最长重试时间
+
+
+@resource("neo4j_driver", close=lambda driver: driver.close())
+def get_neo4j_driver():
+    """返回进程内共享的 Neo4j 驱动，首次调用时创建并验证连通性；所有工具和 Streamlit 会话共用同一个连接池。"""
+    from neo4j import GraphDatabase
+    driver = GraphDatabase.driver(
+        NEO4J_URI,
+        auth=(os.getenv("NEO4J_USER"), os.getenv("NEO4J_PASSWORD")),
+        max_connection_pool_size=NEO4J_MAX_POOL_SIZE,
+        liveness_check_timeout=NEO4J_LIVENESS_CHECK_SECONDS,
+        max_transaction_retry_time=NEO4J_MAX_RETRY_SECONDS,
+    )
+    driver.verify_connectivity()
+    return driver
+
+
+def check_neo4j_health() -> bool:
+    """健康检查: 驱动可用且服务器可达时返回 True。"""
+    try:
+        get_neo4j_driver().verify_connectivity()
+        return True
+    except Exception:
+        return False
+
+
+def close_neo4j_driver():
+    """关闭共享驱动 (进程退出时自动调用)；之后再次查询会重新创建驱动。"""
+    registry.reset("neo4j_driver")
+
+
+atexit.register(close_neo4j_driver)
+
+
+# --- 基础工具：数据库查询 ---
+def run_cypher_query(query: str, params: dict = None) -> list[dict]:
+    """在共享连接池上以读事务执行查询；瞬时错误 (如连接中断、集群切主) 由驱动自动重试。"""
+    def _read(tx):
+        return [record.data() for record in tx.run(query, params or {})]
+
+    with get_neo4j_driver().session() as session:
+        return session.execute_read(_read)
+
+# --- 异步 Neo4j 驱动: 异步驱动绑定创建它的事件循环，因此按事件循环各保留一个 ---
+_async_neo4j_drivers = weakref.WeakKeyDictionary()
+
+
+def get_async_neo4j_driver():
+    """返回当前事件循环共享的异步 Neo4j 驱动 (与同步驱动使用相同的连接池与重试配置)。"""
+    loop = asyncio.get_running_loop()
+    driver = _async_neo4j_drivers.get(loop)
+    if driver is None:
+        from neo4j import AsyncGraphDatabase
+        driver = AsyncGraphDatabase.driver(
+            NEO4J_URI,
+            auth=(os.getenv("NEO4J_USER"), os.getenv("NEO4J_PASSWORD")),
+            max_connection_pool_size=NEO4J_MAX_POOL_SIZE,
+            liveness_check_timeout=NEO4J_LIVENESS_CHECK_SECONDS,
+            max_transaction_retry_time=NEO4J_MAX_RETRY_SECONDS,
+        )
+        _async_neo4j_drivers[loop] = driver
+    return driver
+
+
+async def close_async_neo4j_driver():
+    """关闭当前事件循环的异步驱动，应在 asyncio.run 的协程结束前调用。"""
+    driver = _async_neo4j_drivers.pop(asyncio.get_running_loop(), None)
+    if driver is not None:
+        await driver.close()
+
+
+_async_neo4j_users = weakref.WeakKeyDictionary()
+
+
+@contextlib.asynccontextmanager
+async def async_neo4j_scope():
+    """
+    标记一次异步分析正在使用当前事件循环的异步驱动。同一事件循环上的最后一个使用者退出时关闭驱动，
+    因此并发会话 (asyncio.gather) 共享同一个连接池，每次 asyncio.run 结束前连接池都会被关闭。
+    """
+    loop = asyncio.get_running_loop()
+    _async_neo4j_users[loop] = _async_neo4j_users.get(loop, 0) + 1
     try:
-        driver = GraphDatabase.driver(NEO4J_URI, auth=(os.getenv("NEO4J_USER"), os.getenv("NEO4J_PASSWORD")))
-        with driver.session() as session:
-            result = session.run(query, params)
-            return [record.data() for record in result]
+        yield
     finally:
-        if driver:
-            driver.close()
+        _async_neo4j_users[loop] -= 1
+        if not _async_neo4j_users[loop]:
+            del _async_neo4j_users[loop]
+            await close_async_neo4j_driver()
+
+
+async def arun_cypher_query(query: str, params: dict = None) -> list[dict]:
+    """run_cypher_query 的异步版本，供 app.ainvoke / app.astream 路径上的异步工具使用。"""
+    async def _read(tx):
+        result = await tx.run(query, params or {})
+        return await result.data()
+
+    async with get_async_neo4j_driver().session() as session:
+        return await session.execute_read(_read)
+
+
+# --- 图后端: neo4j (默认，经上面的共享连接池执行 Cypher) 或 memory (由数据集在进程内构建，无需 Neo4j 服务) ---
+GRAPH_BACKEND = os.getenv("GRAPH_BACKEND", "neo4j").lower()
+GRAPH_STRUCTURED_DATA_PATH = os.getenv("GRAPH_STRUCTURED_DATA_PATH", "structured_data_all.json")
+GRAPH_UNSTRUCTURED_DATA_PATH = os.getenv("GRAPH_UNSTRUCTURED_DATA_PATH", "unstructured_data_all.json")
+GRAPH_ASPECT_ALIASES_PATH = os.getenv("GRAPH_ASPECT_ALIASES_PATH", "aspect_aliases.json")
+
+
+@resource("graph_backend")
+def get_graph_backend() -> GraphBackend:
+    """
+    返回分析工具共用的图后端；memory 后端首次使用时读取数据集构建 CSR 邻接 (同名 .parquet 存在时优先使用)，
+    并与加载器一样应用方面别名表 (存在时)。
+    """
+    from graph_backend import CypherGraphBackend, InMemoryGraphBackend
+    if GRAPH_BACKEND == "memory":
+        from aspect_canonical import AspectAliases
+        from patent_dataset import resolve_dataset_path
+        return InMemoryGraphBackend.from_datasets(resolve_dataset_path(GRAPH_STRUCTURED_DATA_PATH),
+                                                  resolve_dataset_path(GRAPH_UNSTRUCTURED_DATA_PATH),
+                                                  aliases=AspectAliases.load(GRAPH_ASPECT_ALIASES_PATH))
+    if GRAPH_BACKEND != "neo4j":
+        raise ValueError(f"未知的 GRAPH_BACKEND: {GRAPH_BACKEND!r} (可选 neo4j / memory)")
+    return CypherGraphBackend(run_cypher_query, arun_cypher_query)
+
+
+# --- 预计算索引: 专利 -> 申请年份 (趋势与成熟度工具共用，进程内缓存，定期重建) ---
+PATENT_INDEX_TTL_SECONDS = float(os.getenv("PATENT_INDEX_TTL_SECONDS", "600"))
+patent_year_index = LazyIndex(
+    lambda: PatentYearIndex.from_rows(get_graph_backend().patent_year_rows()),
+    ttl_seconds=PATENT_INDEX_TTL_SECONDS
+)
+
+# --- 语义检索缓存: 查询向量 (进程内 LRU + 磁盘) 与检索结果 (短 TTL，集合版本变化时失效) ---
+QUERY_EMBEDDING_CACHE_PATH = os.getenv("QUERY_EMBEDDING_CACHE_PATH", "query_embedding_cache.sqlite3")
+SEARCH_RESULT_TTL_SECONDS = float(os.getenv("SEARCH_RESULT_TTL_SECONDS", "300"))
+
+
+@resource("query_embedding_cache")
+def get_query_embedding_cache():
+    from llm_cache import SQLiteCache
+    from search_cache import QueryEmbeddingCache
+    return QueryEmbeddingCache(EMBEDDING_MODEL, disk_cache=SQLiteCache(path=QUERY_EMBEDDING_CACHE_PATH))
+
+
+@resource("search_result_cache")
+def get_search_result_cache():
+    from search_cache import TTLCache
+    return TTLCache(max_entries=256, ttl_seconds=SEARCH_RESULT_TTL_SECONDS)
+
+
+def _search_result_key(topic: str, n_results: int, where: dict = None) -> tuple:
+    """检索结果缓存键: 查询向量由 (模型, 规范化文本) 唯一确定，因此以其缓存键代替向量本身。"""
+    from search_cache import collection_version
+    collection_name = os.getenv("CHROMA_COLLECTION_NAME")
+    return (get_query_embedding_cache().key(topic), n_results, json.dumps(where, sort_keys=True, ensure_ascii=False),
+            collection_version(os.getenv("CHROMA_PERSIST_DIRECTORY"), collection_name))
+
+
+# --- 混合检索: 本地 BM25 词法索引 + Chroma 向量检索，以倒数排名融合 (RRF) 合并 ---
+LEXICAL_INDEX_DIR = os.getenv("LEXICAL_INDEX_DIR", "lexical_index")
+RRF_K = 60  # RRF 平滑常数，越大则两路排名的头部差异影响越小
+
+
+@resource("lexical_index")
+def get_lexical_index():
+    from lexical_index import LexicalIndex
+    return LexicalIndex.open(LEXICAL_INDEX_DIR)
+
+
+def _current_lexical_index():
+    """向量化脚本更新索引后重新打开；正在进行的检索仍持有旧实例 (段文件不可变)，不受影响。"""
+    index = get_lexical_index()
+    if index.is_stale():
+        registry.reset("lexical_index")
+        index = get_lexical_index()
+    return index
+
+
+def _fuse_results(dense_results: dict, lexical_hits: list[tuple[str, float]], n_results: int) -> list[str]:
+    """两路结果的键都是申请号 (向量 ID 与词法文档键一致)，融合后直接返回申请号列表。"""
+    from lexical_index import reciprocal_rank_fusion
+    dense_ids = (dense_results.get('ids') or [[]])[0]
+    fused = reciprocal_rank_fusion([dense_ids, [key for key, _ in lexical_hits]], k=RRF_K)[:n_results]
+    return [key for key, _ in fused]
+
+
+def _lexical_app_nos(lexical_index, topic: str, n_results: int, where: dict = None) -> list[str]:
+    return [key for key, _ in lexical_index.search(topic, k=n_results, where=where)]
+
+
+def get_patent_titles(app_nos: list[str]) -> dict[str, str]:
+    """申请号 -> 发明名称 (仅用于展示)。优先读本地词法索引的载荷，缺失的再从 Chroma 元数据中补齐。"""
+    lexical_index = _current_lexical_index()
+    titles = {app_no: (lexical_index.payload(app_no) or {}).get('patent_name') for app_no in app_nos}
+    missing = [app_no for app_no, title in titles.items() if not title]
+    if missing:
+        found = get_chroma_collection().get(ids=missing, include=["metadatas"])
+        for app_no, meta in zip(found.get('ids') or [], found.get('metadatas') or []):
+            titles[app_no] = (meta or {}).get('patent_name')
+    return {app_no: title or app_no for app_no, title in titles.items()}
+
+
+# --- 结构化筛选: 向量化时写入的类型化元数据 (见 vectorize_full_kg.structured_metadata) ---
+def build_patent_filter(year_from: int = None, year_to: int = None, doc_type: str = None,
+                        applicant_country: str = None, ipc_prefix: str = None) -> dict | None:
+    """
+    由常用筛选条件组装 Chroma where 表达式，未给出的条件忽略，全部为空时返回 None。
+    ipc_prefix 可以是部 (H)、小类 (H01R) 或大组 (H01R13)。
+    """
+    conditions = []
+    if year_from is not None: conditions.append({"filing_year": {"$gte": int(year_from)}})
+    if year_to is not None: conditions.append({"filing_year": {"$lte": int(year_to)}})
+    if doc_type: conditions.append({"doc_type": doc_type})
+    if applicant_country: conditions.append({"applicant_country": applicant_country})
+    if ipc_prefix: conditions.append({f"ipc_{''.join(ipc_prefix.split()).upper()}": True})
+    if not conditions: return None
+    return conditions[0] if len(conditions) == 1 else {"$and": conditions}
+
+
+def get_search_cache_stats() -> dict:
+    """语义检索缓存的命中率统计。"""
+    return {"query_embedding": get_query_embedding_cache().stats(), "search_results": get_search_result_cache().stats()}
+
 
 # --- 语义检索工具 (已添加Docstring) ---
 class SemanticSearchInput(BaseModel):
     topic: str = Field(description="The technical topic to search for similar patents.")
+    n_results: int = Field(default=15, description="Number of patents to return.")
+    where: Optional[dict] = Field(default=None, description=(
+        "Optional Chroma metadata filter, e.g. {'filing_year': {'$gte': 2015}} or {'ipc_H01R13': True}. "
+        "Fields: filing_year (int), doc_type, applicant_country, ipc_<section|subclass|main group> (bool)."))
+
+def _search_shortcut(topic: str, n_results: int, where: dict = None) -> tuple[tuple, list[str] | None]:
+    """
+    检索中不需要网络请求的部分 (同步与异步检索共用)，返回 (结果缓存键, 申请号列表)。
+    结果缓存命中或纯词法查询 (IPC 分类号 / 申请人，不调用嵌入 API) 时列表非空，否则为 None。
+    """
+    result_key = _search_result_key(topic, n_results, where)
+    app_nos = get_search_result_cache().get(result_key)
+    if app_nos is not None:
+        return result_key, list(app_nos)
+    lexical_index = _current_lexical_index()
+    if lexical_index.is_structured_query(topic):
+        app_nos = _lexical_app_nos(lexical_index, topic, n_results, where)
+        get_search_result_cache().set(result_key, tuple(app_nos))
+        return result_key, app_nos
+    return result_key, None
+
+
+def _dense_query_args(query_vector: list[float], n_results: int, where: dict = None) -> dict:
+    # where 条件下推到 Chroma: 先过滤再做近邻检索，筛选后仍返回满额的 n_results 条
+    return {"query_embeddings": [query_vector], "n_results": n_results, "where": where or None, "include": []}
+
+
+def _finish_search(result_key: tuple, topic: str, n_results: int, where: dict, dense_results: dict) -> list[str]:
+    """与词法结果融合并写入结果缓存。"""
+    lexical_hits = _current_lexical_index().search(topic, k=n_results, where=where)
+    app_nos = _fuse_results(dense_results, lexical_hits, n_results)
+    get_search_result_cache().set(result_key, tuple(app_nos))
+    return app_nos
+
 
 @tool(args_schema=SemanticSearchInput)
-def find_similar_patents(topic: str, n_results: int = 15) -> list[str]:
+def find_similar_patents(topic: str, n_results: int = 15, where: Optional[dict] = None) -> list[str]:
     """
-    Finds patents that are semantically similar to a given technical topic by searching in a vector database.
-    Returns a list of patent names.
+    Finds patents that are semantically similar to a given technical topic by searching in a vector database
+    and a local lexical index (exact terms, IPC codes, applicant names).
+    Returns a list of patent application numbers (申请号), which the analysis tools take as input.
     """
-    # ... (内部逻辑不变) ...
     try:
-        response = openai_client_for_tools.embeddings.create(model=EMBEDDING_MODEL, input=[topic])
-        query_vector = response.data[0].embedding
-        results = chroma_collection.query(query_embeddings=[query_vector], n_results=n_results, include=["metadatas"])
-        metadatas = results.get('metadatas', [[]])[0]
-        if not metadatas:
-            return []
-        patent_names = [meta.get('patent_name', '未知专利名') for meta in metadatas]
-        return patent_names
+        result_key, app_nos = _search_shortcut(topic, n_results, where)
+        if app_nos is not None: return app_nos
+        query_vector = get_query_embedding_cache().get(topic)
+        if query_vector is None:
+            response = get_openai_client().embeddings.create(model=EMBEDDING_MODEL, input=[topic])
+            query_vector = response.data[0].embedding
+            get_query_embedding_cache().set(topic, query_vector)
+        results = get_chroma_collection().query(**_dense_query_args(query_vector, n_results, where))
+        return _finish_search(result_key, topic, n_results, where, results)
     except Exception as e:
         return [f"检索时发生错误: {e}"]
 
+
+async def _afind_similar_patents(topic: str, n_results: int = 15, where: Optional[dict] = None) -> list[str]:
+    try:
+        result_key, app_nos = _search_shortcut(topic, n_results, where)
+        if app_nos is not None: return app_nos
+        query_vector = get_query_embedding_cache().get(topic)
+        if query_vector is None:
+            response = await get_async_openai_client().embeddings.create(model=EMBEDDING_MODEL, input=[topic])
+            query_vector = response.data[0].embedding
+            get_query_embedding_cache().set(topic, query_vector)
+        results = await asyncio.to_thread(get_chroma_collection().query,
+                                          **_dense_query_args(query_vector, n_results, where))
+        return _finish_search(result_key, topic, n_results, where, results)
+    except Exception as e:
+        return [f"检索时发生错误: {e}"]
+
+
+find_similar_patents.coroutine = _afind_similar_patents
+
+
+# --- 共享特征快照: 一次批量查询取回三个分析师工具所需的全部数据 ---
+# 快照保存在工作流状态 (GraphState.patent_features) 中，由 agent 节点在调用执行器期间绑定到当前上下文；
+# 工具调用继承该上下文 (同步工具在复制的上下文中执行，异步任务创建时复制上下文)，并发会话互不可见。
+_feature_snapshot: ContextVar[tuple[frozenset, dict] | None] = ContextVar("feature_snapshot", default=None)
+
+
+def fetch_patent_features(patent_list: list[str]) -> dict:
+    """
+    对确认的专利列表执行一次批量查询，返回紧凑的特征快照:
+    {"patents": {申请号: {"years", "scenes", "peer_techs", "problems"}},
+     "problems": {问题: {"tech_count", "top_scene"}}}
+    peer_techs 为同一应用领域内、列表之外的专利及其技术实现 [[申请号, 技术实现], ...]。
+    """
+    return get_graph_backend().patent_features(patent_list)
+
+
+async def afetch_patent_features(patent_list: list[str]) -> dict:
+    """fetch_patent_features 的异步版本。"""
+    return await get_graph_backend().apatent_features(patent_list)
+
+
+@contextlib.contextmanager
+def use_feature_snapshot(patent_list: list[str], features: dict):
+    """在 with 块内 (当前上下文) 让分析工具对同一专利列表的调用直接基于快照计算，不再访问图数据库。"""
+    token = _feature_snapshot.set((frozenset(patent_list), features) if features else None)
+    try:
+        yield
+    finally:
+        _feature_snapshot.reset(token)
+
+
+def _get_feature_snapshot(patent_list: list[str]) -> dict | None:
+    """仅当列表与快照的专利列表完全一致才命中 (关联技术需排除列表内专利，子集不能复用快照)。"""
+    snapshot = _feature_snapshot.get()
+    if snapshot is None or snapshot[0] != frozenset(patent_list): return None
+    return snapshot[1]
+
+
+def _associated_from_features(features: dict, limit: int = 10) -> list[dict]:
+    peers_by_tech: dict[str, set] = {}
+    for patent in features["patents"].values():
+        for peer, tech in patent["peer_techs"]:
+            peers_by_tech.setdefault(tech, set()).add(peer)
+    ranked = sorted(peers_by_tech.items(), key=lambda item: (-len(item[1]), item[0]))[:limit]
+    return [{"associated_tech": tech, "association_strength": len(peers)} for tech, peers in ranked]
+
+
+def _gaps_from_features(features: dict, limit: int = 10) -> list[dict]:
+    ranked = sorted(features["problems"].items(), key=lambda item: (item[1]["tech_count"], item[0]))[:limit]
+    return [{"problem_name": name, "tech_count": stats["tech_count"], "top_scene_name": stats["top_scene"] or '暂无'}
+            for name, stats in ranked]
+
+
+def _years_from_features(features: dict) -> np.ndarray:
+    return np.array([y for patent in features["patents"].values() for y in patent["years"]], dtype=np.int16)
+
+
+def _format_associated(results: list[dict]) -> str:
+    if not results: return "在所选专利的应用领域内，未发现显著的其他关联技术。"
+    formatted_parts = [f"{r['associated_tech']} (关联强度:{r['association_strength']})" for r in results]
+    return f"基于所选的专利列表，关联最强的其他技术实现有：{', '.join(formatted_parts)}"
+
+
+def _format_trend(years: np.ndarray, counts: np.ndarray) -> str:
+    if len(years) < 4: return "所选专利列表的有效年份数据不足4年，无法进行有意义的趋势分析。"
+    slope, _ = np.polyfit(years.astype(float), counts.astype(float), 1)
+    return f"对所选专利列表的趋势分析完成。整体趋势的回归斜率: {slope:.2f}。"
+
+
+def _format_gaps(results: list[dict]) -> str:
+    if not results: return "在所选专利涉及的问题域中，未发现明显的技术空白。"
+    formatted_parts = [f"{i+1}. 问题：[{r['problem_name']}] (全图谱技术方案: {r['tech_count']})，主要领域：[{r['top_scene_name']}]" for i, r in enumerate(results)]
+    return f"在所选专利涉及的问题域中，发现的潜在技术空白包括：{', '.join(formatted_parts)}"
+
+
+def _format_maturity(years: np.ndarray) -> str:
+    if not len(years): return "所选专利列表的数据中没有有效的年份信息。"
+    current_year, min_year = datetime.datetime.now().year, int(years.min())
+    if min_year >= current_year - 2: return "所选专利集群的技术成熟度处于[萌芽期]。"
+    # ... (其他成熟度判断逻辑) ...
+    return "所选专利集群的技术成熟度处于[发展中期]。"
+
+
+def _index_years(patent_list: list[str]) -> np.ndarray:
+    return patent_year_index.get().years_for(patent_list)
+
+
+async def _aindex_years(patent_list: list[str]) -> np.ndarray:
+    index = await asyncio.to_thread(patent_year_index.get)  # 索引过期时在线程中重建，不阻塞事件循环
+    return index.years_for(patent_list)
+
+
+class _AnalysisTool:
+    """
+    一个分析工具的共享逻辑: 空列表提示、优先使用特征快照、结果格式化与错误文案。
+    同步与异步实现只在取数调用上不同 (fetch / afetch，快照未命中时调用)。
+    """
+
+    def __init__(self, empty_message: str, error_message: str, from_features: Callable[[dict], object],
+                 fetch: Callable[[list[str]], object], afetch: Callable[[list[str]], Awaitable],
+                 format_result: Callable[[object], str]):
+        self.empty_message = empty_message
+        self.error_message = error_message
+        self.from_features = from_features
+        self.fetch = fetch
+        self.afetch = afetch
+        self.format_result = format_result
+
+    def run(self, patent_list: list[str]) -> str:
+        if not patent_list: return self.empty_message
+        try:
+            features = _get_feature_snapshot(patent_list)
+            return self.format_result(self.from_features(features) if features else self.fetch(patent_list))
+        except Exception as e: return f"{self.error_message}: {e}"
+
+    async def arun(self, patent_list: list[str]) -> str:
+        if not patent_list: return self.empty_message
+        try:
+            features = _get_feature_snapshot(patent_list)
+            return self.format_result(self.from_features(features) if features else await self.afetch(patent_list))
+        except Exception as e: return f"{self.error_message}: {e}"
+
+
+_ASSOCIATION = _AnalysisTool(
+    "输入专利列表为空，无法进行关联技术分析。", "查询关联技术过程中发生错误", _associated_from_features,
+    lambda patent_list: get_graph_backend().associated_technologies(patent_list),
+    lambda patent_list: get_graph_backend().aassociated_technologies(patent_list),
+    _format_associated,
+)
+_TREND = _AnalysisTool(
+    "输入专利列表为空，无法进行趋势分析。", "分析专利趋势过程中发生错误", _years_from_features,
+    _index_years, _aindex_years,
+    lambda years: _format_trend(*np.unique(years, return_counts=True)),
+)
+_GAPS = _AnalysisTool(
+    "输入专利列表为空，无法进行技术空白分析。", "查找技术空白过程中发生错误", _gaps_from_features,
+    lambda patent_list: get_graph_backend().technology_gaps(patent_list),
+    lambda patent_list: get_graph_backend().atechnology_gaps(patent_list),
+    _format_gaps,
+)
+_MATURITY = _AnalysisTool(
+    "输入专利列表为空，无法评估技术成熟度。", "评估技术成熟度过程中发生错误", _years_from_features,
+    _index_years, _aindex_years, _format_maturity,
+)
+
+
 # ========================================================================
 # vvv 核心分析工具 (已全部添加Docstring) vvv
+# 若当前专利列表有本次分析预取的特征快照 (use_feature_snapshot)，则直接基于快照计算；否则回退到图后端 / 预计算索引。
+# 每个工具同时提供异步实现 (tool.coroutine)，在 ainvoke / astream 路径上使用图后端的异步接口 (异步 Neo4j 驱动)。
 # ========================================================================
 
 class AnalysisInput(BaseModel):
-    patent_list: list[str] = Field(description="A list of patent names to be analyzed.")
+    patent_list: list[str] = Field(description="A list of patent application numbers (申请号) to be analyzed.")
 
 @tool(args_schema=AnalysisInput)
 def find_associated_technologies(patent_list: list[str]) -> str:
     """
     Analyzes a list of patents to find other 'technical implementations' that frequently co-occur in the same application areas.
-    The input must be a Python list of patent names.
-    """
-    if not patent_list: return "输入专利列表为空，无法进行关联技术分析。"
-    query = """
-    MATCH (p1:Patent)-[:应用于]->(scene:应用领域) WHERE p1.name IN $patent_list
-    MATCH (scene)<-[:应用于]-(p2:Patent) WHERE NOT p2.name IN $patent_list
-    MATCH (p2)-[:实现方式是]->(t:技术实现)
-    RETURN t.name AS associated_tech, COUNT(DISTINCT p2) AS association_strength
-    ORDER BY association_strength DESC LIMIT 10
+    The input must be a Python list of patent application numbers (申请号).
     """
-    try:
-        results = run_cypher_query(query, {"patent_list": patent_list})
-        if not results: return "在所选专利的应用领域内，未发现显著的其他关联技术。"
-        formatted_parts = [f"{r['associated_tech']} (关联强度:{r['association_strength']})" for r in results]
-        return f"基于所选的专利列表，关联最强的其他技术实现有：{', '.join(formatted_parts)}"
-    except Exception as e: return f"查询关联技术过程中发生错误: {e}"
+    return _ASSOCIATION.run(patent_list)
+
+find_associated_technologies.coroutine = _ASSOCIATION.arun
 
 @tool(args_schema=AnalysisInput)
 def get_technology_trend(patent_list: list[str]) -> str:
     """
     Analyzes the application year distribution of a list of patents to return quantitative growth metrics, such as linear regression slope.
-    The input must be a Python list of patent names.
+    The input must be a Python list of patent application numbers (申请号).
     """
-    if not patent_list: return "输入专利列表为空，无法进行趋势分析。"
-    query = """
-    MATCH (p:Patent)-[:发明于]->(ad:ApplicationDate) 
-    WHERE p.name IN $patent_list AND ad.name IS NOT NULL
-    WITH substring(ad.name, 0, 4) AS year, COUNT(p) AS patent_count
-    RETURN year, patent_count ORDER BY year ASC
-    """
-    try:
-        results = run_cypher_query(query, {"patent_list": patent_list})
-        if len(results) < 4: return "所选专利列表的有效年份数据不足4年，无法进行有意义的趋势分析。"
-        data = [{'year': int(r['year']), 'patent_count': int(r['patent_count'])} for r in results if r['year'] and str(r['year']).isdigit()]
-        if len(data) < 4: return "所选专利列表的有效年份数据不足4年，无法进行趋势分析。"
-        years, counts = np.array([d['year'] for d in data]), np.array([d['patent_count'] for d in data])
-        slope, _ = np.polyfit(years, counts, 1)
-        return f"对所选专利列表的趋势分析完成。整体趋势的回归斜率: {slope:.2f}。"
-    except Exception as e: return f"分析专利趋势过程中发生错误: {e}"
+    return _TREND.run(patent_list)
+
+get_technology_trend.coroutine = _TREND.arun
 
 @tool(args_schema=AnalysisInput)
 def find_technology_gaps(patent_list: list[str]) -> str:
     """
     Analyzes the 'problems to be solved' associated with a list of patents, and identifies which of these problems have the fewest technical solutions in the entire knowledge graph.
-    The input must be a Python list of patent names.
-    """
-    if not patent_list: return "输入专利列表为空，无法进行技术空白分析。"
-    query = """
-    MATCH (p:Patent)-[:旨在解决]->(problem:待解决问题) WHERE p.name IN $patent_list
-    WITH DISTINCT problem
-    OPTIONAL MATCH (problem)<-[:旨在解决]-(:Patent)-[:实现方式是]->(tech:技术实现)
-    WITH problem, COUNT(DISTINCT tech) AS tech_count
-    OPTIONAL MATCH (problem)<-[:旨在解决]-(:Patent)-[:应用于]->(scene:应用领域)
-    WITH problem, tech_count, scene, COUNT(scene) AS scene_freq
-    ORDER BY problem.name, scene_freq DESC
-    WITH problem, tech_count, COLLECT(scene.name)[0] AS top_scene
-    RETURN problem.name AS problem_name, tech_count, COALESCE(top_scene, '暂无') AS top_scene_name
-    ORDER BY tech_count ASC, problem_name ASC LIMIT 10
+    The input must be a Python list of patent application numbers (申请号).
     """
-    try:
-        results = run_cypher_query(query, {"patent_list": patent_list})
-        if not results: return "在所选专利涉及的问题域中，未发现明显的技术空白。"
-        formatted_parts = [f"{i+1}. 问题：[{r['problem_name']}] (全图谱技术方案: {r['tech_count']})，主要领域：[{r['top_scene_name']}]" for i, r in enumerate(results)]
-        return f"在所选专利涉及的问题域中，发现的潜在技术空白包括：{', '.join(formatted_parts)}"
-    except Exception as e: return f"查找技术空白过程中发生错误: {e}"
+    return _GAPS.run(patent_list)
+
+find_technology_gaps.coroutine = _GAPS.arun
 
 @tool(args_schema=AnalysisInput)
 def assess_technology_maturity(patent_list: list[str]) -> str:
     """
     Evaluates the overall maturity (nascent, growth, or mature stage) of the technology cluster represented by a list of patents.
-    The input must be a Python list of patent names.
-    """
-    if not patent_list: return "输入专利列表为空，无法评估技术成熟度。"
-    query = """
-    MATCH (p:Patent)-[:发明于]->(ad:ApplicationDate) 
-    WHERE p.name IN $patent_list AND ad.name IS NOT NULL
-    RETURN substring(ad.name, 0, 4) AS year ORDER BY year ASC
+    The input must be a Python list of patent application numbers (申请号).
     """
-    try:
-        results = run_cypher_query(query, {"patent_list": patent_list})
-        if not results: return "未找到所选专利列表的任何有效年份数据。"
-        years = [int(r['year']) for r in results if r['year'] and str(r['year']).isdigit()]
-        if not years: return "所选专利列表的数据中没有有效的年份信息。"
-        current_year, min_year = datetime.datetime.now().year, min(years)
-        if min_year >= current_year - 2: return "所选专利集群的技术成熟度处于[萌芽期]。"
-        # ... (其他成熟度判断逻辑) ...
-        return "所选专利集群的技术成熟度处于[发展中期]。"
-    except Exception as e: return f"评估技术成熟度过程中发生错误: {e}"
+    return _MATURITY.run(patent_list)
+
+assess_technology_maturity.coroutine = _MATURITY.arun
 
 # --- MCDA工具 (也需要docstring) ---
 class MCDAInput(BaseModel):
@@ -1,9 +1,24 @@
 # ui.py
 
+import datetime
+import time
 import streamlit as st
 import pandas as pd
-from main import app, GraphState
-from tools import find_similar_patents
+from main import stream_analysis
+from resources import registry
+from tools import build_patent_filter, find_similar_patents, get_patent_titles, get_search_cache_stats
+
+# 节点名 -> 页面标题
+NODE_TITLES = {
+    "feature_extraction": "特征预取",
+    "association_agent": "关联技术分析 (Association)",
+    "emerging_theme_agent": "新兴主题分析 (EmergingTheme)",
+    "gap_agent": "技术空白分析 (TechnologyGap)",
+    "critic_agent": "批判性审查 (Critic)",
+    "evaluation_agent": "最终评估报告 (Evaluation)",
+}
+STREAMED_NODE = "evaluation_agent"  # 逐 token 流式展示的节点
+TOKEN_RENDER_INTERVAL = 0.1  # 流式渲染的最小刷新间隔 (秒)，避免每个 token 都重绘页面
 
 # --- 页面配置 ---
 st.set_page_config(
@@ -12,13 +27,29 @@ st.set_page_config(
     layout="wide"
 )
 
+# --- 进程级共享资源 ---
+# Streamlit 每次交互都会从头重跑本脚本；st.cache_resource 保证 LLM、Agent 执行器、已编译工作流、
+# OpenAI / Chroma 客户端在进程内只创建一次，并由所有会话共享 (这些对象均不保存会话状态)。
+# 资源按阶段在首次需要时加载，首页无需等待模型和数据库；Neo4j 驱动在首次查询时才创建。
+SEARCH_RESOURCES = ("openai_client", "chroma_collection")
+ANALYSIS_RESOURCES = ("chat_model", "agent_executors", "workflow_app")
+
+
+@st.cache_resource(show_spinner="正在加载模型与向量库...")
+def load_shared_resources(names: tuple):
+    return registry.warm_up(list(names))
+
+
 # --- 初始化 Session State ---
 if 'stage' not in st.session_state:
     st.session_state.stage = 'initial'
     st.session_state.tech_topic = ""
     st.session_state.recommended_patents = []
     st.session_state.confirmed_patents = []
+    st.session_state.patent_titles = {}
     st.session_state.final_report = None
+    st.session_state.node_outputs = {}
+    st.session_state.node_timings = {}
 
 
 # --- 重置函数 ---
@@ -27,7 +58,10 @@ def reset_analysis():
     st.session_state.tech_topic = ""
     st.session_state.recommended_patents = []
     st.session_state.confirmed_patents = []
+    st.session_state.patent_titles = {}
     st.session_state.final_report = None
+    st.session_state.node_outputs = {}
+    st.session_state.node_timings = {}
 
 
 # --- 界面布局 ---
@@ -41,15 +75,33 @@ with st.sidebar:
         key='tech_topic_input'
     )
 
+    # 筛选条件下推到向量库查询，筛选后仍返回满额推荐
+    with st.expander("筛选条件 (可选)"):
+        use_year = st.checkbox("按申请年份筛选")
+        year_from, year_to = st.slider("申请年份", 1985, datetime.date.today().year,
+                                       (2005, datetime.date.today().year), disabled=not use_year)
+        doc_type = st.selectbox("文献类型", ["全部", "发明", "实用新型", "外观设计"])
+        applicant_country = st.text_input("申请人所在国（省）", placeholder="例如：CN")
+        ipc_prefix = st.text_input("IPC 分类前缀", placeholder="例如：H01R 或 H01R13")
+    search_filter = build_patent_filter(
+        year_from=year_from if use_year else None,
+        year_to=year_to if use_year else None,
+        doc_type=None if doc_type == "全部" else doc_type,
+        applicant_country=applicant_country.strip() or None,
+        ipc_prefix=ipc_prefix.strip() or None,
+    )
+
     if st.button("步骤 1: 获取相关专利推荐"):
         if tech_topic:
+            load_shared_resources(SEARCH_RESOURCES)
             with st.spinner('AI正在进行语义检索...'):
-                recommended_list = find_similar_patents.run({"topic": tech_topic})
+                recommended_list = find_similar_patents.run({"topic": tech_topic, "where": search_filter})
 
                 if isinstance(recommended_list, list) and recommended_list and "错误" not in recommended_list[0]:
                     st.session_state.tech_topic = tech_topic
                     st.session_state.recommended_patents = recommended_list
                     st.session_state.confirmed_patents = recommended_list
+                    st.session_state.patent_titles = get_patent_titles(recommended_list)
                     st.session_state.stage = 'selection'
                     st.rerun()
                 elif not recommended_list:
@@ -59,6 +111,10 @@ with st.sidebar:
         else:
             st.sidebar.warning("请输入技术主题！")
 
+    if registry.is_loaded("query_embedding_cache"):
+        with st.expander("检索缓存统计"):
+            st.json(get_search_cache_stats())
+
     st.markdown("---")
     if st.button("开始新的分析"):
         reset_analysis()
@@ -70,10 +126,12 @@ if st.session_state.stage == 'selection':
     st.markdown(f"**分析主题:** `{st.session_state.tech_topic}`")
     st.info("以下是AI为您推荐的相关专利。您可以增删列表，然后启动深度分析。")
 
+    # 列表项为申请号 (分析工具的输入)，发明名称仅用于展示，同名专利也能分别选择
     confirmed_patents = st.multiselect(
         label="请确认或修改专利列表：",
         options=st.session_state.recommended_patents,
-        default=st.session_state.recommended_patents
+        default=st.session_state.recommended_patents,
+        format_func=lambda app_no: f"{st.session_state.patent_titles.get(app_no, app_no)} ({app_no})"
     )
 
     if st.button("✅ 确认列表并启动深度分析", type="primary"):
@@ -85,23 +143,76 @@ if st.session_state.stage == 'selection':
             st.warning("请至少选择一个专利以进行深度分析。")
 
 elif st.session_state.stage == 'analysis':
-    with st.spinner('多智能体系统正在进行深度分析，这可能需要几分钟时间...'):
-        initial_state = GraphState(
-            patent_list=st.session_state.confirmed_patents,
-            agent_outputs={},
-            critique="",
-            final_report=""
-        )
-        final_state = app.invoke(initial_state)
-        st.session_state.final_report = final_state.get('final_report', "分析完成，但未生成报告。")
-        st.session_state.stage = 'done'
-        st.rerun()
+    load_shared_resources(ANALYSIS_RESOURCES)
+    st.subheader("步骤 3: 多智能体深度分析")
+    st.markdown(f"**分析主题:** `{st.session_state.tech_topic}`")
+    node_outputs, node_timings = {}, {}
+    final_report = ""
+    analysis_start = time.perf_counter()
+
+    with st.status("多智能体系统正在进行深度分析...", expanded=True) as status:
+        report_placeholder = st.empty()
+        streamed_tokens, last_render = [], 0.0
+
+        for mode, payload in stream_analysis(st.session_state.confirmed_patents):
+            if mode == "messages":
+                chunk, metadata = payload
+                if metadata.get("langgraph_node") != STREAMED_NODE or not isinstance(chunk.content, str): continue
+                streamed_tokens.append(chunk.content)
+                if time.perf_counter() - last_render >= TOKEN_RENDER_INTERVAL:
+                    report_placeholder.markdown("".join(streamed_tokens) + "▌")
+                    last_render = time.perf_counter()
+                continue
+
+            for node_name, update in payload.items():
+                elapsed = (update.get("node_timings") or {}).get(node_name)
+                node_timings[node_name] = elapsed
+                title = NODE_TITLES.get(node_name, node_name)
+                if node_name == "feature_extraction":
+                    output = f"已预取 {len((update.get('patent_features') or {}).get('patents', {}))} 件专利的共享特征。"
+                elif node_name == "critic_agent":
+                    output = update.get("critique", "")
+                elif node_name == STREAMED_NODE:
+                    final_report = update.get("final_report", "")
+                    report_placeholder.empty()
+                    output = final_report
+                else:
+                    output = "\n\n".join(update.get("agent_outputs", {}).values())
+                node_outputs[node_name] = output
+                st.write(f"✅ {title} 完成，用时 {elapsed:.1f} 秒" if elapsed is not None else f"✅ {title} 完成")
+                if node_name != STREAMED_NODE:
+                    with st.expander(title):
+                        st.markdown(output)
+                if node_name == "critic_agent":
+                    st.write(f"⏳ {NODE_TITLES[STREAMED_NODE]} 生成中...")
+
+        status.update(label=f"分析完成，总用时 {time.perf_counter() - analysis_start:.1f} 秒",
+                      state="complete", expanded=False)
+
+    st.session_state.final_report = final_report or "分析完成，但未生成报告。"
+    st.session_state.node_outputs = node_outputs
+    st.session_state.node_timings = node_timings
+    st.session_state.stage = 'done'
+    st.rerun()
 
 elif st.session_state.stage == 'done':
     st.success(f"对 **{st.session_state.tech_topic}** 的分析已完成！")
     st.subheader("最终分析报告")
     st.markdown(st.session_state.final_report)
 
+    st.subheader("各智能体中间结果")
+    for node_name, output in st.session_state.node_outputs.items():
+        if node_name == STREAMED_NODE: continue
+        with st.expander(NODE_TITLES.get(node_name, node_name)):
+            st.markdown(output)
+
+    if st.session_state.node_timings:
+        st.subheader("节点耗时")
+        st.dataframe(pd.DataFrame(
+            [(NODE_TITLES.get(name, name), elapsed) for name, elapsed in st.session_state.node_timings.items()],
+            columns=["节点", "耗时 (秒)"]
+        ), hide_index=True)
+
 else:  # 'initial'
     st.info("👋 欢迎使用本系统！请在左侧侧边栏输入技术主题开始分析。")
     st.markdown("""
@@ -1,13 +1,26 @@
 import os
+import re
 import sys
+import json
+import hashlib
+import queue
+import threading
+import time
 import chromadb
+import tiktoken
 from openai import OpenAI
 from neo4j import GraphDatabase
 from dotenv import load_dotenv
+from concurrent.futures import ThreadPoolExecutor
 from tqdm import tqdm
-from typing import Dict, List, Any
+from typing import Dict, Iterable, List, Any
 import logging
 
+from llm_cache import SQLiteCache, make_cache_key
+from lexical_index import IPC_RE, LexicalIndex, patent_tokens
+from patent_dataset import STRUCTURED_FIELDS, dataset_files, iter_records, resolve_dataset_path
+from search_cache import bump_collection_version
+
 # --- 0. 日志和基本配置 ---
 logging.basicConfig(level=logging.INFO, format='%(asctime)s - %(levelname)s - %(message)s')
 load_dotenv()
@@ -28,8 +41,26 @@ EMBEDDING_MODEL = "text-embedding-3-small"
 CHROMA_PERSIST_DIRECTORY = os.getenv("CHROMA_PERSIST_DIRECTORY")
 CHROMA_COLLECTION_NAME = os.getenv("CHROMA_COLLECTION_NAME")
 
-# 处理批次大小
+# 处理批次大小: 每批最多 BATCH_SIZE 条，且总 token 数不超过 MAX_BATCH_TOKENS (用 tiktoken 实测)
 BATCH_SIZE = 64
+MAX_BATCH_TOKENS = int(os.getenv("EMBEDDING_MAX_BATCH_TOKENS", "100000"))
+MAX_INPUT_TOKENS = 8191  # text-embedding-3-small 单条输入的 token 上限
+
+# 流水线配置: 并发嵌入请求数与阶段间队列长度 (队列有界，内存占用不随语料规模增长)
+EMBEDDING_WORKERS = int(os.getenv("EMBEDDING_WORKERS", "4"))
+QUEUE_SIZE = 8
+
+# 嵌入缓存: 以 (嵌入模型, 序列化文本哈希) 为键，重建集合时无需重新调用嵌入 API
+EMBEDDING_CACHE_PATH = os.getenv("EMBEDDING_CACHE_PATH", "embedding_cache.sqlite3")
+
+# 结构化字段来源: 以类型化元数据 (整数年份、IPC 前缀标记等) 写入 Chroma，供检索时下推 where 过滤
+# (同名 .parquet 列式数据集存在时优先使用，按批流式读取)
+STRUCTURED_DATA_PATH = resolve_dataset_path(os.getenv("STRUCTURED_DATA_PATH", "structured_data_all.json"))
+
+# 本地词法索引 (BM25)，与向量集合在同一次遍历中增量更新，供混合检索使用
+LEXICAL_INDEX_DIR = os.getenv("LEXICAL_INDEX_DIR", "lexical_index")
+# 每攒满这么多篇有变化的文档就写出一个索引段 (内存中只保留一段的词项)，结束时由 maybe_compact 合并
+LEXICAL_SEGMENT_DOCS = int(os.getenv("LEXICAL_SEGMENT_DOCS", "5000"))
 
 
 # --- 2. 序列化函数 (与之前相同) ---
@@ -58,7 +89,104 @@ def serialize_patent_data(record: Dict[str, Any]) -> str:
     return " ".join(parts)
 
 
-# --- 3. 新增的验证函数 ---
+# --- 3. 类型化元数据 ---
+def ipc_metadata(ipc_str: str) -> Dict[str, Any]:
+    """
+    IPC 分类号 -> 元数据。Chroma 元数据不支持列表，因此每个出现过的部/小类/大组各记一个布尔标记
+    (ipc_H、ipc_H01R、ipc_H01R13)，再单独记录第一个分类号的大组 ipc_main_group。
+    """
+    meta = {}
+    for match in IPC_RE.finditer(ipc_str or ""):
+        subclass, group, _ = match.groups()
+        subclass = subclass.upper()
+        main_group = f"{subclass}{int(group)}" if group else None
+        meta.setdefault("ipc_main_group", main_group or subclass)
+        meta[f"ipc_{subclass[0]}"] = True
+        meta[f"ipc_{subclass}"] = True
+        if main_group: meta[f"ipc_{main_group}"] = True
+    return meta
+
+
+def structured_metadata(record: Dict[str, Any]) -> Dict[str, Any]:
+    """结构化专利记录 -> 类型化元数据: filing_year (int)、doc_type、applicant_country 与 IPC 标记。"""
+    meta = {}
+    year = re.match(r"\s*(\d{4})", str(record.get("申请日") or ""))
+    if year: meta["filing_year"] = int(year.group(1))
+    if record.get("文献类型"): meta["doc_type"] = str(record["文献类型"]).strip()
+    if record.get("申请人所在国（省）"): meta["applicant_country"] = str(record["申请人所在国（省）"]).strip()
+    meta.update(ipc_metadata(record.get("IPC分类号")))
+    return meta
+
+
+def load_structured_metadata(path: str) -> Dict[str, Dict[str, Any]]:
+    """读取结构化数据文件，返回 {申请号: 类型化元数据}；文件不存在时返回空字典。"""
+    if not dataset_files(path):
+        logging.warning(f"  [警告] 未找到结构化数据文件 {path}，向量元数据将不包含年份/IPC 等筛选字段。")
+        return {}
+    return {str(record["申请号"]).strip(): structured_metadata(record)
+            for batch in iter_records(path, STRUCTURED_FIELDS) for record in batch if record.get("申请号")}
+
+
+def metadata_hash(metadata: Dict[str, Any]) -> str:
+    return hashlib.sha256(json.dumps(metadata, sort_keys=True, ensure_ascii=False).encode("utf-8")).hexdigest()
+
+
+def with_removed_keys(metadata: Dict[str, Any], existing_keys: Iterable[str]) -> Dict[str, Any]:
+    """
+    Chroma 的 upsert / update 会与已有元数据合并，已有但新元数据中没有的键 (如 IPC 变化后旧的 ipc_* 标记)
+    须显式置为 None 才会被删除，否则 where 筛选仍会命中旧值。
+    """
+    return {**{key: None for key in existing_keys if key not in metadata}, **metadata}
+
+
+# --- 4. 增量同步辅助函数 ---
+def patent_vector_id(record: Dict[str, Any]) -> str:
+    """向量 ID 即专利的申请号 (图谱中 Patent 的唯一键)，检索结果可直接作为分析工具的输入。"""
+    return record['app_no']
+
+
+def content_hash(text: str) -> str:
+    """序列化文本的内容哈希，用于判断向量是否需要重新计算。"""
+    return hashlib.sha256(text.encode("utf-8")).hexdigest()
+
+
+def normalize_record(record: Dict[str, Any]) -> Dict[str, Any]:
+    """列表字段排序，使序列化文本 (及其内容哈希) 与 collect() 返回的顺序无关。"""
+    for field in ('innovations', 'problems_solved', 'application_areas', 'ipc_codes'):
+        record[field] = sorted(record.get(field) or [])
+    return record
+
+
+def fetch_existing_hashes(collection, page_size: int = 5000) -> Dict[str, tuple]:
+    """分页读取集合中已有向量的 {id: (content_hash, metadata_hash, 元数据键)} (不读取向量本身)。"""
+    existing = {}
+    offset = 0
+    while True:
+        page = collection.get(include=["metadatas"], limit=page_size, offset=offset)
+        ids = page.get("ids") or []
+        for vector_id, meta in zip(ids, page.get("metadatas") or []):
+            meta = meta or {}
+            existing[vector_id] = (meta.get("content_hash"), meta.get("metadata_hash"), tuple(meta))
+        if len(ids) < page_size:
+            return existing
+        offset += page_size
+
+
+def embed_with_cache(texts: List[str], hashes: List[str], openai_client: OpenAI,
+                     cache: SQLiteCache) -> List[List[float]]:
+    """优先从嵌入缓存读取向量，只对未命中的文本调用嵌入 API，并把新结果写回缓存。"""
+    keys = [make_cache_key(model=EMBEDDING_MODEL, text_hash=h) for h in hashes]
+    embeddings = [cache.get(key) for key in keys]
+    missing = [i for i, emb in enumerate(embeddings) if emb is None]
+    if missing:
+        response = openai_client.embeddings.create(model=EMBEDDING_MODEL, input=[texts[i] for i in missing])
+        for i, item in zip(missing, response.data):
+            embeddings[i] = item.embedding
+            cache.set(keys[i], item.embedding)
+    return embeddings
+
+
+# --- 5. 新增的验证函数 ---
 def validate_config():
     """检查所有必需的环境变量是否已加载。"""
     required_vars = {
@@ -85,104 +213,345 @@ def validate_config():
     logging.info("所有配置已成功加载。")
 
 
-# --- 4. 主执行函数 ---
-def main():
-    """主函数，执行整个知识图谱向量化流程"""
-
-    # 在执行任何操作前，首先验证配置
-    validate_config()
+# --- 6. 流水线: Neo4j 游标 -> 并发嵌入 -> ChromaDB 写入 ---
+PATENT_QUERY = """
+MATCH (p:Patent) WHERE p.app_no IS NOT NULL
+OPTIONAL MATCH (c:Company)-[:申请]->(p)
+WITH p, min(c.name) AS company_name
+OPTIONAL MATCH (p)-[:核心创新是]->(innovation_node:创新点)
+OPTIONAL MATCH (p)-[:旨在解决]->(problem_node:待解决问题)
+OPTIONAL MATCH (p)-[:应用于]->(application_node:应用领域)
+OPTIONAL MATCH (p)-[:IPC分类为]->(ipc_node:IPCNumber)
+RETURN
+    p.app_no AS app_no,
+    p.name AS patent_name,
+    company_name,
+    collect(DISTINCT innovation_node.name) AS innovations,
+    collect(DISTINCT problem_node.name) AS problems_solved,
+    collect(DISTINCT application_node.name) AS application_areas,
+    collect(DISTINCT ipc_node.name) AS ipc_codes
+"""
+
+_END = object()  # 阶段间的结束标记
+
+
+class StageStats:
+    """记录单个流水线阶段处理的条数与忙碌时间，用于输出各阶段吞吐量。"""
+
+    def __init__(self, name: str):
+        self.name = name
+        self.items = 0
+        self.failed = 0
+        self.busy_seconds = 0.0
+        self._lock = threading.Lock()
+
+    def add(self, items: int, seconds: float):
+        with self._lock:
+            self.items += items
+            self.busy_seconds += seconds
+
+    def fail(self, items: int, seconds: float):
+        """记录处理失败的条数 (耗时仍计入忙碌时间，但不计入成功条数)。"""
+        with self._lock:
+            self.failed += items
+            self.busy_seconds += seconds
+
+    def report(self, wall_seconds: float) -> str:
+        busy_rate = self.items / self.busy_seconds if self.busy_seconds else 0.0
+        wall_rate = self.items / wall_seconds if wall_seconds else 0.0
+        failed = f"，失败 {self.failed} 条" if self.failed else ""
+        return (f"{self.name}: {self.items} 条{failed}，忙碌 {self.busy_seconds:.1f} 秒 "
+                f"({busy_rate:.1f} 条/秒)，整体 {wall_rate:.1f} 条/秒")
+
+
+class TokenBatcher:
+    """按 tiktoken 实测的 token 数装批: 每批不超过 max_items 条且不超过 max_tokens 个 token。"""
+
+    def __init__(self, max_items: int = BATCH_SIZE, max_tokens: int = MAX_BATCH_TOKENS):
+        self.encoding = tiktoken.encoding_for_model(EMBEDDING_MODEL)
+        self.max_items = max_items
+        self.max_tokens = max_tokens
+        self.items, self.tokens = [], 0
+
+    def add(self, item: tuple) -> list | None:
+        """item = (vector_id, text, text_hash, metadata)。返回因容量已满而封装好的上一批，否则返回 None。"""
+        vector_id, text, text_hash, metadata = item
+        tokens = self.encoding.encode(text)
+        if len(tokens) > MAX_INPUT_TOKENS:
+            text = self.encoding.decode(tokens[:MAX_INPUT_TOKENS])
+            tokens = tokens[:MAX_INPUT_TOKENS]
+        full = None
+        if self.items and (len(self.items) >= self.max_items or self.tokens + len(tokens) > self.max_tokens):
+            full = self.flush()
+        self.items.append((vector_id, text, text_hash, metadata))
+        self.tokens += len(tokens)
+        return full
+
+    def flush(self) -> list | None:
+        batch, self.items, self.tokens = self.items or None, [], 0
+        return batch
+
+
+class LexicalBatcher:
+    """
+    流式同步词法索引: 候选文档每攒满 segment_docs 篇批量比对一次 lexical_hash，
+    有变化的文档每攒满 segment_docs 篇写出一个新段。两个缓冲区都有上限，内存占用不随语料规模增长。
+    """
 
-    # --- 步骤 1: 连接 Neo4j 并执行精确查询 ---
-    logging.info("\n步骤 1: 正在从 Neo4j 获取专利数据...")
-    cypher_query = """
-    MATCH (p:Patent)
-    OPTIONAL MATCH (c:Company)-[:申请]->(p)
-    OPTIONAL MATCH (p)-[:核心创新是]->(innovation_node:创新点)
-    OPTIONAL MATCH (p)-[:旨在解决]->(problem_node:待解决问题)
-    OPTIONAL MATCH (p)-[:应用于]->(application_node:应用领域)
-    RETURN
-        p.name AS patent_name,
-        c.name AS company_name,
-        collect(DISTINCT innovation_node.name) AS innovations,
-        collect(DISTINCT problem_node.name) AS problems_solved,
-        collect(DISTINCT application_node.name) AS application_areas
+    def __init__(self, lexical_index: LexicalIndex, stats: StageStats, segment_docs: int = LEXICAL_SEGMENT_DOCS):
+        self.index = lexical_index
+        self.stats = stats
+        self.segment_docs = segment_docs
+        self.candidates, self.changed = [], []
+
+    def add(self, doc: tuple[str, list, dict]):
+        self.candidates.append(doc)
+        if len(self.candidates) >= self.segment_docs:
+            self._compare()
+
+    def flush(self):
+        self._compare()
+        self._write()
+
+    def _compare(self):
+        start_time = time.perf_counter()
+        docs, self.candidates = self.candidates, []
+        indexed = self.index.payload_values([key for key, _, _ in docs], "lexical_hash")
+        self.changed.extend(doc for doc, lexical_hash in zip(docs, indexed) if lexical_hash != doc[2]["lexical_hash"])
+        self.stats.add(0, time.perf_counter() - start_time)
+        if len(self.changed) >= self.segment_docs:
+            self._write()
+
+    def _write(self):
+        start_time = time.perf_counter()
+        docs, self.changed = self.changed, []
+        self.index.upsert(docs)
+        self.stats.add(len(docs), time.perf_counter() - start_time)
+
+
+def lexical_document(vector_id: str, text: str, rec: Dict[str, Any],
+                     typed_metadata: Dict[str, Any]) -> tuple[str, list, dict]:
+    """
+    词法索引文档: 序列化文本 + IPC 分类号 + 申请人。载荷带上类型化元数据，使词法结果也能按同一 where 条件过滤；
+    lexical_hash 用于增量比对。
     """
+    ipc_codes = rec.get('ipc_codes') or []
+    company = rec.get('company_name')
+    payload = {
+        "app_no": rec['app_no'],
+        "patent_name": rec.get('patent_name') or 'N/A',
+        "company_name": company,
+        **typed_metadata,
+    }
+    payload["lexical_hash"] = content_hash("\n".join([text, *ipc_codes, metadata_hash(payload)]))
+    return vector_id, patent_tokens(text, ipc_codes, [company]), payload
+
 
-    records = []
+def produce_batches(driver, existing_hashes: Dict[str, tuple], seen_ids: set, out_queue: queue.Queue,
+                    stats: StageStats, consumers: int, lexical_batcher: LexicalBatcher = None,
+                    structured: Dict[str, Dict[str, Any]] = None, write_queue: queue.Queue = None) -> bool:
+    """
+    阶段 1: 以游标方式逐行读取 Neo4j 结果，序列化并只把新增/变化的专利装批放入队列；
+    文本未变、仅元数据变化的专利每 BATCH_SIZE * 10 条作为 (更新块, None) 直接放入写入队列 (无需重新嵌入)；
+    每篇专利的词法文档交给 lexical_batcher，由其分段写入词法索引。
+    返回是否完整读完了全部结果 (只有完整读完时才能安全删除过期向量)。
+    """
     try:
-        with GraphDatabase.driver(NEO4J_URI, auth=(NEO4J_USERNAME, NEO4J_PASSWORD)) as driver:
-            driver.verify_connectivity()
-            with driver.session(database="neo4j") as session:
-                result = session.run(cypher_query)
-                records = [record.data() for record in result]
-        logging.info(f"  > 成功获取 {len(records)} 条专利记录。")
+        batcher, metadata_updates = TokenBatcher(), []
+        with driver.session(database="neo4j") as session:
+            result = session.run(PATENT_QUERY)
+            start_time = time.perf_counter()
+            for record in result:
+                rec = normalize_record(record.data())
+                vector_id = patent_vector_id(rec)
+                if vector_id in seen_ids: continue
+                seen_ids.add(vector_id)
+                text = serialize_patent_data(rec)
+                text_hash = content_hash(text)
+                stats.add(1, 0.0)
+                typed_metadata = (structured or {}).get(rec['app_no'], {})
+                if lexical_batcher is not None:
+                    lexical_batcher.add(lexical_document(vector_id, text, rec, typed_metadata))
+                metadata = {
+                    "app_no": rec['app_no'],
+                    "patent_name": rec.get('patent_name') or 'N/A',
+                    "company_name": rec.get('company_name') or 'N/A',
+                    **typed_metadata,
+                }
+                metadata["metadata_hash"] = metadata_hash(metadata)
+                metadata["content_hash"] = text_hash
+                existing = existing_hashes.get(vector_id, (None, None, ()))
+                existing_text_hash, existing_metadata_hash, existing_keys = existing
+                metadata = with_removed_keys(metadata, existing_keys)
+                if existing_text_hash == text_hash:
+                    if existing_metadata_hash != metadata["metadata_hash"] and write_queue is not None:
+                        metadata_updates.append((vector_id, metadata))
+                        if len(metadata_updates) >= BATCH_SIZE * 10:
+                            write_queue.put((metadata_updates, None))
+                            metadata_updates = []
+                    continue
+                batch = batcher.add((vector_id, text, text_hash, metadata))
+                if batch:
+                    stats.add(0, time.perf_counter() - start_time)
+                    out_queue.put(batch)
+                    start_time = time.perf_counter()
+            stats.add(0, time.perf_counter() - start_time)
+            batch = batcher.flush()
+            if batch: out_queue.put(batch)
+            # 先于结束标记放入写入队列，写入线程在收到全部结束标记前必然处理到它
+            if metadata_updates: write_queue.put((metadata_updates, None))
+            if lexical_batcher is not None: lexical_batcher.flush()
+        return True
     except Exception as e:
-        logging.error(f"  [错误] 无法连接到 Neo4j 或执行查询: {e}")
-        return
+        logging.error(f"  [错误] 从 Neo4j 读取专利数据时出错: {e}")
+        return False
+    finally:
+        for _ in range(consumers):
+            out_queue.put(_END)
+
+
+def embed_batches(in_queue: queue.Queue, out_queue: queue.Queue, openai_client: OpenAI, cache: SQLiteCache,
+                  stats: StageStats):
+    """阶段 2 (多个并发工作线程): 优先命中嵌入缓存，对未命中的文本调用嵌入 API。"""
+    while True:
+        batch = in_queue.get()
+        if batch is _END:
+            out_queue.put(_END)
+            return
+        start_time = time.perf_counter()
+        try:
+            embeddings = embed_with_cache([item[1] for item in batch], [item[2] for item in batch],
+                                          openai_client, cache)
+        except Exception as e:
+            logging.error(f"  [错误] 嵌入 {len(batch)} 条文本时出错: {e}")
+            stats.fail(len(batch), time.perf_counter() - start_time)
+            continue
+        stats.add(len(batch), time.perf_counter() - start_time)
+        out_queue.put((batch, embeddings))
 
-    if not records:
-        logging.warning("  [警告] 未从 Neo4j 获取到任何数据，脚本将退出。")
-        return
 
-    # --- 步骤 2: 序列化所有文本 ---
-    logging.info("\n步骤 2: 正在将所有记录序列化为文本...")
-    serialized_texts = [serialize_patent_data(rec) for rec in records]
-    logging.info(f"  > 成功序列化 {len(serialized_texts)} 条文本。")
+def write_batches(in_queue: queue.Queue, collection, stats: StageStats, producers: int, progress: tqdm,
+                  metadata_stats: StageStats):
+    """
+    阶段 3 (单独的写入线程): 将向量 upsert 到 ChromaDB。
+    embeddings 为 None 的条目是仅元数据变化的更新块，只 update 元数据 (已删除的键以 None 清除)。
+    """
+    finished = 0
+    while finished < producers:
+        item = in_queue.get()
+        if item is _END:
+            finished += 1
+            continue
+        batch, embeddings = item
+        start_time = time.perf_counter()
+        if embeddings is None:
+            try:
+                collection.update(ids=[vector_id for vector_id, _ in batch], metadatas=[meta for _, meta in batch])
+            except Exception as e:
+                logging.error(f"  [错误] 更新 {len(batch)} 条向量的元数据时出错: {e}")
+                metadata_stats.fail(len(batch), time.perf_counter() - start_time)
+                continue
+            metadata_stats.add(len(batch), time.perf_counter() - start_time)
+            continue
+        try:
+            collection.upsert(
+                ids=[vector_id for vector_id, _, _, _ in batch],
+                documents=[text for _, text, _, _ in batch],
+                metadatas=[metadata for _, _, _, metadata in batch],
+                embeddings=embeddings
+            )
+        except Exception as e:
+            logging.error(f"  [错误] 写入 {len(batch)} 条向量到 ChromaDB 时出错: {e}")
+            stats.fail(len(batch), time.perf_counter() - start_time)
+            continue
+        stats.add(len(batch), time.perf_counter() - start_time)
+        progress.update(len(batch))
+
+
+# --- 7. 主执行函数 ---
+def main():
+    """主函数，以流水线方式执行知识图谱增量向量化流程"""
+
+    # 在执行任何操作前，首先验证配置
+    validate_config()
 
-    # --- 步骤 3: 初始化 ChromaDB 和 OpenAI 客户端 ---
-    logging.info("\n步骤 3: 正在初始化 ChromaDB 和 OpenAI 客户端...")
+    # --- 步骤 1: 初始化 Neo4j、ChromaDB、OpenAI 客户端和嵌入缓存 ---
+    logging.info("\n步骤 1: 正在初始化 Neo4j、ChromaDB 和 OpenAI 客户端...")
     try:
+        driver = GraphDatabase.driver(NEO4J_URI, auth=(NEO4J_USERNAME, NEO4J_PASSWORD))
+        driver.verify_connectivity()
         chroma_client = chromadb.PersistentClient(path=CHROMA_PERSIST_DIRECTORY)
         collection = chroma_client.get_or_create_collection(
             name=CHROMA_COLLECTION_NAME,
             metadata={"hnsw:space": "cosine"}
         )
         openai_client = OpenAI(api_key=OPENAI_API_KEY, base_url=OPENAI_BASE_URL)
-        logging.info("  > ChromaDB 和 OpenAI 客户端初始化成功。")
+        embedding_cache = SQLiteCache(path=EMBEDDING_CACHE_PATH)
+        lexical_index = LexicalIndex.open(LEXICAL_INDEX_DIR)
+        structured = load_structured_metadata(STRUCTURED_DATA_PATH)
+        logging.info(f"  > 客户端初始化成功，已加载 {len(structured)} 条结构化元数据。")
     except Exception as e:
         logging.error(f"  [错误] 初始化客户端时出错: {e}")
         return
 
-    # --- 步骤 4: 分批次向量化并存入 ChromaDB ---
-    logging.info(f"\n步骤 4: 开始分批处理数据（每批 {BATCH_SIZE} 条）...")
-
-    for i in tqdm(range(0, len(records), BATCH_SIZE), desc="向量化并存储批次"):
-        # ... (后续代码与之前版本相同) ...
-        batch_records = records[i:i + BATCH_SIZE]
-        batch_texts = serialized_texts[i:i + BATCH_SIZE]
-
-        try:
-            response = openai_client.embeddings.create(
-                model=EMBEDDING_MODEL,
-                input=batch_texts
-            )
-            batch_embeddings = [item.embedding for item in response.data]
-
-            batch_ids = []
-            for j, rec in enumerate(batch_records):
-                patent_name = rec.get('patent_name', f'missing_name_{i + j}')
-                safe_name = "".join(x for x in patent_name if x.isalnum())[:50]
-                batch_ids.append(f"patent_{i + j}_{safe_name}")
-
-            batch_metadatas = [
-                {
-                    "patent_name": rec.get('patent_name', 'N/A'),
-                    "company_name": rec.get('company_name', 'N/A')
-                }
-                for rec in batch_records
-            ]
-
-            collection.add(
-                embeddings=batch_embeddings,
-                documents=batch_texts,
-                metadatas=batch_metadatas,
-                ids=batch_ids
-            )
-        except Exception as e:
-            logging.error(f"  [错误] 处理批次 {i // BATCH_SIZE + 1} 时出错: {e}")
-            continue
+    # --- 步骤 2: 读取集合中已有向量的内容哈希，用于增量比对 ---
+    existing_hashes = fetch_existing_hashes(collection)
+    logging.info(f"\n步骤 2: 集合中已有 {len(existing_hashes)} 条向量。")
+
+    # --- 步骤 3: 启动流水线 ---
+    logging.info(f"\n步骤 3: 启动流水线 (每批最多 {BATCH_SIZE} 条 / {MAX_BATCH_TOKENS} tokens，"
+                 f"{EMBEDDING_WORKERS} 个并发嵌入请求)...")
+    fetch_stats, embed_stats, write_stats = StageStats("读取+序列化"), StageStats("嵌入"), StageStats("写入")
+    lexical_stats, metadata_stats = StageStats("词法索引"), StageStats("仅更新元数据")
+    batch_queue, write_queue = queue.Queue(maxsize=QUEUE_SIZE), queue.Queue(maxsize=QUEUE_SIZE)
+    seen_ids = set()
+    start_time = time.perf_counter()
+    with tqdm(desc="向量化并存储 (条)", unit="条") as progress, \
+            ThreadPoolExecutor(max_workers=EMBEDDING_WORKERS + 2) as executor:
+        producer = executor.submit(produce_batches, driver, existing_hashes, seen_ids, batch_queue, fetch_stats,
+                                   EMBEDDING_WORKERS, LexicalBatcher(lexical_index, lexical_stats), structured,
+                                   write_queue)
+        for _ in range(EMBEDDING_WORKERS):
+            executor.submit(embed_batches, batch_queue, write_queue, openai_client, embedding_cache, embed_stats)
+        executor.submit(write_batches, write_queue, collection, write_stats, EMBEDDING_WORKERS, progress,
+                        metadata_stats)
+    wall_seconds = time.perf_counter() - start_time
+    driver.close()
+
+    # --- 步骤 4: 删除已不在图谱中的专利向量 ---
+    stale_ids = [vector_id for vector_id in existing_hashes if vector_id not in seen_ids]
+    if producer.result() and fetch_stats.items:
+        for i in range(0, len(stale_ids), BATCH_SIZE * 10):
+            collection.delete(ids=stale_ids[i:i + BATCH_SIZE * 10])
+    else:
+        stale_ids = []
+        logging.warning("  [警告] 未能完整读取 Neo4j 中的专利数据，跳过删除过期向量。")
+
+    # --- 步骤 5: 完成词法索引的增量更新 (新段已在流水线中写出；删除过期文档，段数或失效比例过高时合并) ---
+    stale_lexical = []
+    if producer.result() and fetch_stats.items:
+        stale_lexical = [key for key in lexical_index.keys() if key not in seen_ids]
+    lexical_index.delete(stale_lexical)
+    compacted = lexical_index.maybe_compact()
+    if lexical_stats.items or stale_lexical or compacted:
+        lexical_index.save()
+
+    # 集合内容有变化时更新版本号，使在线检索的结果缓存失效
+    if write_stats.items or stale_ids or metadata_stats.items or lexical_stats.items or stale_lexical:
+        bump_collection_version(CHROMA_PERSIST_DIRECTORY, CHROMA_COLLECTION_NAME)
 
     logging.info("\n🎉 全部处理完成！")
+    logging.info(f"  > 读取 {fetch_stats.items} 条专利，新增/更新 {write_stats.items} 条，"
+                 f"仅更新元数据 {metadata_stats.items} 条，删除 {len(stale_ids)} 条，"
+                 f"总耗时 {wall_seconds:.1f} 秒。")
+    if embed_stats.failed or write_stats.failed or metadata_stats.failed:
+        logging.warning(f"  [警告] {embed_stats.failed} 条嵌入失败、{write_stats.failed} 条写入失败、"
+                        f"{metadata_stats.failed} 条元数据更新失败，这些专利下次运行时会重新处理。")
+    for stats in (fetch_stats, embed_stats, write_stats, metadata_stats, lexical_stats):
+        logging.info(f"  > {stats.report(wall_seconds)}")
+    logging.info(f"  > 嵌入缓存统计: {embedding_cache.stats()}")
+    logging.info(f"  > 词法索引: 更新 {lexical_stats.items} 篇，删除 {len(stale_lexical)} 篇，"
+                 f"共 {len(lexical_index)} 篇 / {len(lexical_index.segments)} 个段 ({LEXICAL_INDEX_DIR})")
     logging.info(
         f"  > 总共有 {collection.count()} 个知识片段被成功向量化并存储在 ChromaDB 的 '{CHROMA_COLLECTION_NAME}' 集合中。")
     logging.info(f"  > 数据库文件存储在: {CHROMA_PERSIST_DIRECTORY}")